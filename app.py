@@ -1,69 +1,457 @@
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request, Response, g
+from werkzeug.exceptions import HTTPException
+import hashlib
 import json
 import os
+import queue
+import sys
+import threading
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules'))
+from anomaly_index import AnomalyIndex, FILTER_FIELDS, DEFAULT_LIMIT, MAX_LIMIT
+from anomaly_log import AnomalyLog, ANOMALY_LOG, ML_ANOMALY_LOG
+from rollups import Rollups, history, DEFAULT_POINTS
+from telemetry_store import TelemetryStore, STORE_DIR, DEFAULT_STATION
+from metrics import REGISTRY, ARTIFACT_READ_BYTES, cache_access, render, log_event
+from forecast_worker import request_worker, WorkerUnavailable, WorkerError, WORKER_METRICS
 
 app = Flask(__name__)
 
+# --- Instrumentation (exposée sur /metrics avec l'instantané du dernier run du pipeline) ---
+PIPELINE_METRICS = 'data/pipeline_metrics.json'
+HTTP_SECONDS = REGISTRY.histogram('onea_http_request_duration_seconds', "Latence des requêtes HTTP par endpoint",
+                                  ('endpoint', 'method', 'status'))
+HTTP_ERRORS = REGISTRY.counter('onea_http_errors_total', "Erreurs internes (HTTP 500) par endpoint", ('endpoint',))
+
+def endpoint_label():
+    """Route déclarée (cardinalité bornée) plutôt que l'URL brute"""
+    return request.url_rule.rule if request.url_rule else 'inconnu'
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_start' in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint_label(),
+                             method=request.method, status=response.status_code)
+    return response
+
+@app.errorhandler(Exception)
+def internal_error(e):
+    """Erreur non prévue : détail dans le journal (data/logs/api.ndjson), réponse 500 générique"""
+    if isinstance(e, HTTPException):
+        return e
+    HTTP_ERRORS.inc(endpoint=endpoint_label())
+    app.logger.exception(f"Erreur sur {request.path}")
+    log_event('api', 'error', endpoint=endpoint_label(), path=request.full_path,
+              error=f"{type(e).__name__}: {e}")
+    return jsonify({'error': 'Erreur interne du serveur'}), 500
+
+# --- Cache mémoire des artefacts JSON et des réponses ---
+# Un artefact n'est relu que si son (mtime, taille) a changé ; une réponse n'est
+# recalculée que si l'un des artefacts dont elle dépend a changé
+_artifacts = {}   # chemin -> (version, données parsées)
+_responses = {}   # clé -> (versions des artefacts, corps JSON, ETag)
+
+def artifact_version(path):
+    """Version d'un artefact : (mtime_ns, taille), None s'il n'existe pas"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def load_artifact(path, default=None):
+    """Contenu JSON parsé d'un artefact, relu sur disque uniquement après modification"""
+    version = artifact_version(path)
+    if version is None:
+        if default is None:
+            raise FileNotFoundError(path)
+        return default
+    cached = _artifacts.get(path)
+    cache_access('artifact', cached is not None and cached[0] == version)
+    if cached is None or cached[0] != version:
+        with open(path, 'r') as f:
+            cached = (version, json.load(f))
+        _artifacts[path] = cached
+        ARTIFACT_READ_BYTES.inc(version[1], artifact=path)
+    return cached[1]
+
+def cached_json(key, paths, build):
+    """
+    Réponse JSON mémorisée : build() n'est rappelé que si un fichier de `paths` a changé
+    ETag = empreinte du corps ; un client qui renvoie le même If-None-Match reçoit un 304 sans corps
+    """
+    versions = tuple(artifact_version(p) for p in paths)
+    cached = _responses.get(key)
+    cache_access('api_response', cached is not None and cached[0] == versions)
+    if cached is None or cached[0] != versions:
+        body = app.json.dumps(build()).encode()
+        cached = (versions, body, hashlib.sha1(body).hexdigest())
+        _responses[key] = cached
+    return conditional_response(cached[1], cached[2])
+
+def conditional_response(body, etag=None):
+    """Corps JSON + ETag (empreinte du corps par défaut), 304 si le client a déjà cette version"""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag or hashlib.sha1(body).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/')
 def home():
     return render_template('dashboard_pro.html')
 
+# --- Journaux d'anomalies (modules/anomaly_log.py) ---
+# L'index (.idx) est écrit après les lignes : sa version sert de version du journal
+ANOMALY_LOGS = (AnomalyLog(ANOMALY_LOG), AnomalyLog(ML_ANOMALY_LOG))
+ANOMALY_SOURCES = [log.index_path for log in ANOMALY_LOGS]
+_anomaly_records = {}   # journal -> anomalies déjà lues
+
+# KPI, liste et filtres : anomalies des ANOMALY_WINDOW_DAYS derniers jours de la télémétrie stockée
+# (les journaux conservent tout l'historique) ; la fenêtre suit le manifeste du store
+ANOMALY_WINDOW_DAYS = 30
+TELEMETRY_MANIFEST = os.path.join(STORE_DIR, 'manifest.json')
+ANOMALY_VIEW_SOURCES = ANOMALY_SOURCES + [TELEMETRY_MANIFEST]
+_current_anomalies = (None, None)   # (versions des journaux et du manifeste, (anomalies, positions) par journal)
+
+def anomaly_records(log):
+    """Anomalies d'un journal : seules les lignes ajoutées depuis la lecture précédente sont lues"""
+    records = _anomaly_records.get(log.path, [])
+    n = len(log)
+    cache_access('anomaly_log', len(records) == n)
+    if n != len(records):
+        # Lignes ajoutées depuis la lecture précédente (journal recréé : relecture complète)
+        records = records + log.read(len(records)) if n > len(records) else log.read()
+        _anomaly_records[log.path] = records
+    return records
+
+def anomaly_window():
+    """(première, dernière heure) affichées, bornes incluses ('AAAA-MM-JJTHH') ; None si le store est vide"""
+    partitions = [p for station in telemetry_store().manifest.values() for p in station.values()]
+    if not partitions:
+        return None
+    end = max(np.datetime64(p['end'], 'h') for p in partitions)
+    start = max(min(np.datetime64(p['start'], 'h') for p in partitions),
+                end - np.timedelta64(ANOMALY_WINDOW_DAYS * 24 - 1, 'h'))
+    return str(start), str(end)
+
+def windowed_anomalies():
+    """
+    Pour chaque journal (règles + ML, rapport ML) : anomalies de la fenêtre et leur position dans
+    le journal, recalculées quand un journal ou la télémétrie change
+    """
+    global _current_anomalies
+    versions = tuple(artifact_version(p) for p in ANOMALY_VIEW_SOURCES)
+    if _current_anomalies[0] != versions:
+        window = anomaly_window()
+        inside = lambda r: window is not None and window[0] <= f"{r['date']}T{int(r['hour']):02d}" <= window[1]
+        selected = []
+        for log in ANOMALY_LOGS:
+            records = anomaly_records(log)
+            positions = [i for i, r in enumerate(records) if inside(r)]
+            selected.append(([records[i] for i in positions], positions))
+        _current_anomalies = (versions, tuple(selected))
+    return _current_anomalies[1]
+
+def current_anomalies():
+    """(règles + ML, rapport ML) limités à la fenêtre"""
+    return tuple(records for records, _ in windowed_anomalies())
+
+def compute_kpi():
+    predictions = load_artifact('data/predictions.json')
+    schedule = load_artifact('data/pump_schedule.json')
+    anomalies, ml_anomalies = current_anomalies()
+
+    # Une anomalie = un enregistrement (station, date, heure), compté une seule fois même s'il
+    # apparaît en règle + ML dans le journal du module 3 et dans le rapport ML (module 3bis)
+    anomaly_keys = {(a.get('station_id'), a['date'], a['hour']) for a in anomalies + ml_anomalies}
+
+    # NOUVEAUX KPIs (Mix Énergétique & Impact Carbone)
+    total_cost = sum([s.get('cost_fcfa', 0) for s in schedule])
+    total_solar = sum([s.get('mix_solar_kwh', 0) for s in schedule])
+    total_gasoil = sum([s.get('gasoil_used_liters', 0) for s in schedule])
+    total_co2 = sum([s.get('co2_emissions_kg', 0) for s in schedule])
+    
+    # Calcul des économies (Si 100% SONABEL sans optimisation)
+    cost_no_optim = sum([p['energy_predicted'] * (54 if p['hour'] < 17 else 118) for p in predictions])
+    savings = cost_no_optim - total_cost
+
+    return {
+        'total_cost_fcfa': round(total_cost, 0),
+        'savings_fcfa': round(savings, 0),
+        'savings_percent': round((savings/cost_no_optim)*100, 1) if cost_no_optim > 0 else 0,
+        'total_solar_kwh': round(total_solar, 0),
+        'total_gasoil_liters': round(total_gasoil, 1),
+        'total_co2_kg': round(total_co2, 1),
+        'total_anomalies': len(anomaly_keys),
+        'critical_anomalies': len([a for a in anomalies if a.get('severity') == 'CRITIQUE'])
+    }
+
+KPI_SOURCES = ['data/predictions.json', 'data/pump_schedule.json'] + ANOMALY_VIEW_SOURCES
+
 @app.route('/api/kpi')
 def get_kpi():
-    try:
-        with open('data/predictions.json', 'r') as f:
-            predictions = json.load(f)
-        with open('data/pump_schedule.json', 'r') as f:
-            schedule = json.load(f)
-        with open('data/anomalies.json', 'r') as f:
-            anomalies = json.load(f)
-            
-        ml_anomalies =[]
-        if os.path.exists('data/ml_anomalies.json'):
-            with open('data/ml_anomalies.json', 'r') as f:
-                ml_anomalies = json.load(f)
-
-        # NOUVEAUX KPIs (Mix Énergétique & Impact Carbone)
-        total_cost = sum([s.get('cost_fcfa', 0) for s in schedule])
-        total_solar = sum([s.get('mix_solar_kwh', 0) for s in schedule])
-        total_gasoil = sum([s.get('gasoil_used_liters', 0) for s in schedule])
-        total_co2 = sum([s.get('co2_emissions_kg', 0) for s in schedule])
-        
-        # Calcul des économies (Si 100% SONABEL sans optimisation)
-        cost_no_optim = sum([p['energy_predicted'] * (54 if p['hour'] < 17 else 118) for p in predictions])
-        savings = cost_no_optim - total_cost
-
-        kpi = {
-            'total_cost_fcfa': round(total_cost, 0),
-            'savings_fcfa': round(savings, 0),
-            'savings_percent': round((savings/cost_no_optim)*100, 1) if cost_no_optim > 0 else 0,
-            'total_solar_kwh': round(total_solar, 0),
-            'total_gasoil_liters': round(total_gasoil, 1),
-            'total_co2_kg': round(total_co2, 1),
-            'total_anomalies': len(anomalies) + len(ml_anomalies),
-            'critical_anomalies': len([a for a in anomalies if a.get('severity') == 'CRITIQUE'])
-        }
-        return jsonify(kpi)
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return cached_json('kpi', KPI_SOURCES, compute_kpi)
 
 @app.route('/api/predictions')
 def get_predictions():
-    with open('data/predictions.json', 'r') as f: return jsonify(json.load(f))
+    return cached_json('predictions', ['data/predictions.json'], lambda: load_artifact('data/predictions.json'))
 
 @app.route('/api/schedule')
 def get_schedule():
-    with open('data/pump_schedule.json', 'r') as f: return jsonify(json.load(f))
+    return cached_json('schedule', ['data/pump_schedule.json'], lambda: load_artifact('data/pump_schedule.json'))
+
+_anomaly_index = (None, None)   # (versions des journaux, index)
+
+def anomaly_index():
+    """Index des anomalies de la fenêtre, reconstruit uniquement quand un journal ou la télémétrie change"""
+    global _anomaly_index
+    versions = tuple(artifact_version(p) for p in ANOMALY_VIEW_SOURCES)
+    if _anomaly_index[0] != versions:
+        (rule_based, rule_positions), (ml_based, ml_positions) = windowed_anomalies()
+        index = AnomalyIndex(rule_based, ml_based, positions=(rule_positions, ml_positions))
+        _anomaly_index = (versions, index)
+    return _anomaly_index[1]
 
 @app.route('/api/anomalies')
 def get_anomalies():
-    rule_anomalies = json.load(open('data/anomalies.json')) if os.path.exists('data/anomalies.json') else[]
-    ml_anomalies = json.load(open('data/ml_anomalies.json')) if os.path.exists('data/ml_anomalies.json') else[]
-    return jsonify({'rule_based': rule_anomalies, 'ml_based': ml_anomalies})
+    """
+    Anomalies filtrées, triées et paginées côté serveur
+    Filtres : severity, alert, method, station (valeurs séparées par des virgules),
+    start/end (date ou date+heure, inclus), hour_min/hour_max
+    Tri : sort (severity_score, date, flow, energy, level), order (asc/desc)
+    Pagination : limit, cursor (= next_cursor de la page précédente : clé de tri + identifiant de
+    la dernière anomalie servie, valable même après l'ajout de nouvelles anomalies)
+    """
+    args = request.args
+    filters = {f: args[f].split(',') for f in FILTER_FIELDS if args.get(f)}
+    try:
+        page = anomaly_index().query(
+            filters,
+            start=args.get('start') or None, end=args.get('end') or None,
+            hour_min=args.get('hour_min', type=int), hour_max=args.get('hour_max', type=int),
+            sort=args.get('sort', 'severity_score'), order=args.get('order', 'desc'),
+            cursor=args.get('cursor') or None, limit=args.get('limit', DEFAULT_LIMIT, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return conditional_response(app.json.dumps(page).encode())
+
+@app.route('/api/anomalies/recent')
+def get_recent_anomalies():
+    """
+    Dernières anomalies journalisées, les plus récentes d'abord (lecture de la fin des journaux)
+    Paramètres : limit ; after = valeur 'positions' d'une réponse précédente (seules les
+    anomalies ajoutées depuis sont renvoyées)
+    """
+    limit = max(1, min(request.args.get('limit', DEFAULT_LIMIT, type=int), MAX_LIMIT))
+    positions = [len(log) for log in ANOMALY_LOGS]
+    after = request.args.get('after')
+    try:
+        after = [int(p) for p in after.split(',')] if after else [max(0, n - limit) for n in positions]
+    except ValueError:
+        return jsonify({'error': f"after invalide : {request.args['after']}"}), 400
+    if len(after) != len(ANOMALY_LOGS):
+        return jsonify({'error': f"after : {len(ANOMALY_LOGS)} positions attendues"}), 400
+    items = []
+    for log, source, start, n in zip(ANOMALY_LOGS, ('rule_based', 'ml_based'), after, positions):
+        items += [dict(r, source=source) for r in log.read(max(start, n - limit), n)]
+    items.sort(key=lambda a: (a['date'], int(a['hour'])), reverse=True)
+    return jsonify({'items': items[:limit], 'positions': ','.join(map(str, positions))})
+
+@app.route('/api/anomalies/facets')
+def get_anomaly_facets():
+    return cached_json('anomaly_facets', ANOMALY_VIEW_SOURCES, lambda: anomaly_index().facets())
 
 @app.route('/api/ranking')
 def get_ranking():
-    with open('data/stations_ranking.json', 'r') as f: return jsonify(json.load(f))
+    return cached_json('ranking', ['data/stations_ranking.json'], lambda: load_artifact('data/stations_ranking.json'))
+
+# --- Historique (agrégats matérialisés par modules/rollups.py) ---
+_rollups = Rollups()
+_store = (None, None)   # (version du manifeste, store télémétrie)
+
+def telemetry_store():
+    """Store télémétrie, rouvert uniquement quand le manifeste change (nouvelles heures ajoutées)"""
+    global _store
+    version = artifact_version(TELEMETRY_MANIFEST)
+    if _store[0] != version:
+        _store = (version, TelemetryStore(STORE_DIR))
+    return _store[1]
+
+@app.route('/api/history')
+def get_history():
+    """
+    Série temporelle d'une station sur une plage quelconque, à la résolution du graphique
+    Paramètres : station, metric (valeurs séparées par des virgules), start/end (date ou
+    date+heure, fin exclue), points (nombre de points voulus, 500 par défaut)
+    """
+    args = request.args
+    try:
+        body = history(
+            _rollups, station=args.get('station', DEFAULT_STATION),
+            start=args.get('start') or None, end=args.get('end') or None,
+            metrics=args.get('metric', 'energy_kwh').split(','),
+            points=args.get('points', DEFAULT_POINTS, type=int), store=telemetry_store()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return conditional_response(app.json.dumps(body).encode())
+
+# --- Simulations "what-if" (worker de prévision : modules/forecast_worker.py) ---
+@app.route('/api/forecast', methods=['POST'])
+def post_forecast():
+    """
+    Prévision + planning de pompage sous hypothèses (corps JSON : stations, start, horizon_hours,
+    temp_offset, outage_hours, solar_factor, initial_level, optimize, mode...)
+    Transmise au worker, qui regroupe les demandes simultanées en un seul appel du modèle
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Corps JSON (objet) attendu'}), 400
+    try:
+        return jsonify(request_worker('forecast', payload))
+    except WorkerUnavailable as e:
+        return jsonify({'error': str(e), 'hint': 'python modules/forecast_worker.py serve'}), 503
+    except WorkerError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@app.route('/metrics')
+def get_metrics():
+    """Métriques au format texte Prometheus : API (source="api"), dernier run du pipeline et worker de prévision"""
+    body = render((REGISTRY.snapshot(), {'source': 'api'}),
+                  (load_artifact(PIPELINE_METRICS, default={}), {'source': 'pipeline'}),
+                  (load_artifact(WORKER_METRICS, default={}), {'source': 'worker'}))
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Diffusion en temps réel (Server-Sent Events) ---
+STREAM_POLL_SECONDS = 2          # période de vérification des artefacts publiés par le pipeline
+STREAM_HEARTBEAT_SECONDS = 15    # commentaire SSE envoyé aux clients inactifs (garde la connexion ouverte)
+STREAM_MAX_NEW_ANOMALIES = 50    # nombre max d'anomalies détaillées par événement (les critiques d'abord)
+
+class ChangeBroadcaster:
+    """
+    Un seul thread surveille les artefacts (un stat par fichier et par période) et calcule
+    chaque delta une fois, quel que soit le nombre de dashboards connectés ; chaque client
+    a sa propre file d'événements
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.versions = {}
+        self.positions = []
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=100)
+        with self.lock:
+            self.subscribers.add(q)
+            if self.thread is None:
+                self._snapshot()
+                self.thread = threading.Thread(target=self._watch, daemon=True)
+                self.thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def publish(self, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Client trop lent : sa file est fermée (sentinelle None), son flux se termine et
+                # EventSource se reconnecte puis recharge l'état complet
+                self.unsubscribe(q)
+                self.close(q)
+
+    @staticmethod
+    def close(q):
+        """Remplacer le plus ancien message par la sentinelle de fin de flux"""
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _snapshot(self):
+        self.versions = {p: artifact_version(p) for p in KPI_SOURCES}
+        self.positions = [len(log) for log in ANOMALY_LOGS]
+
+    def _watch(self):
+        while True:
+            time.sleep(STREAM_POLL_SECONDS)
+            try:
+                self.check()
+            except Exception as e:
+                # Artefact en cours d'écriture : nouvelle tentative à la période suivante
+                app.logger.warning(f"Diffusion SSE : {e}")
+
+    def check(self):
+        """Publier les changements depuis la dernière vérification (KPI, planning, nouvelles anomalies)"""
+        versions = {p: artifact_version(p) for p in KPI_SOURCES}
+        changed = {p for p in versions if versions[p] != self.versions.get(p)}
+        if not changed:
+            return
+        if 'data/pump_schedule.json' in changed:
+            self.publish('schedule', load_artifact('data/pump_schedule.json'))
+        if changed & set(ANOMALY_SOURCES):
+            # Journaux en ajout seul : les nouvelles anomalies sont les lignes après la position connue
+            positions = [len(log) for log in ANOMALY_LOGS]
+            new = [a for log, start, n in zip(ANOMALY_LOGS, self.positions, positions)
+                   for a in log.read(start if start <= n else 0, n)]
+            new.sort(key=lambda a: a.get('severity') != 'CRITIQUE')
+            self.positions = positions
+            if new:
+                self.publish('anomalies', {
+                    'count': len(new),
+                    'critical': sum(a.get('severity') == 'CRITIQUE' for a in new),
+                    'items': new[:STREAM_MAX_NEW_ANOMALIES]
+                })
+        self.publish('kpi', compute_kpi())
+        self.versions = versions
+
+broadcaster = ChangeBroadcaster()
+
+@app.route('/api/stream')
+def stream():
+    """Flux SSE : événements 'kpi', 'schedule' et 'anomalies' (nouvelles anomalies seulement)"""
+    q = broadcaster.subscribe()
+
+    def events():
+        try:
+            yield "retry: 5000\n\n"
+            try:
+                yield f"event: kpi\ndata: {json.dumps(compute_kpi())}\n\n"
+            except Exception as e:
+                app.logger.warning(f"Diffusion SSE : {e}")
+            while True:
+                try:
+                    message = q.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    return   # client désabonné (file pleine) : fin du flux, le navigateur se reconnecte
+                yield message
+        finally:
+            broadcaster.unsubscribe(q)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
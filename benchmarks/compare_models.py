@@ -0,0 +1,142 @@
+"""
+Comparaison des Formats du Modèle de Prévision (forest / flat / hgb)
+Chaque backend est entraîné sur le même historique simulé puis enregistré dans un registre
+temporaire ; on mesure la taille de l'artefact, le chargement (à chaud et dans un nouveau
+processus, imports compris), le débit de prédiction, le pic mémoire et le R2 sur les derniers
+jours de l'historique (découpage chronologique : aucune heure future dans l'entraînement)
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'modules'))
+
+import numpy as np
+from run_benchmarks import machine_info
+from module1_prediction import iter_generated_chunks, build_station_table, fit_backend, model_size, FEATURES, BACKENDS
+from model_registry import ModelRegistry
+
+TEST_FRACTION = 0.2      # derniers jours réservés à l'évaluation
+PREDICT_ROWS = 24 * 1000  # lot de prédiction : 1 000 stations × 24 h
+MODEL_NAME = 'energy_model'
+
+# Démarrage à froid : import du registre + chargement + une prévision de 24 h (ce que paie une commande ponctuelle)
+COLD_START = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {modules!r})
+import numpy as np
+from model_registry import ModelRegistry
+model = ModelRegistry({root!r}).load({name!r})
+model.predict(np.zeros((24, {n_features})))
+print(time.perf_counter() - start)
+"""
+
+def build_dataset(n_days, n_stations, seed):
+    """Historique simulé -> (X_train, y_train, X_test, y_test), découpage sur les jours"""
+    stations = build_station_table(n_stations, seed)
+    data = next(iter_generated_chunks(n_days, stations, seed=seed, chunk_days=n_days))
+    X = np.column_stack([data[f] for f in FEATURES]).astype(float)
+    y = data['energy']
+    train = data['day'] < int(n_days * (1 - TEST_FRACTION))
+    return X[train], y[train], X[~train], y[~train]
+
+def _r2(y, predicted):
+    return 1 - ((y - predicted) ** 2).sum() / ((y - y.mean()) ** 2).sum()
+
+def _median_time(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def compare_backends(backends=BACKENDS, n_days=365, n_stations=1, rows=PREDICT_ROWS, repeat=5, seed=42):
+    """Mesures par backend -> {backend: {...}} (r2_vs_forest : accord avec les prédictions de la forêt)"""
+    X_train, y_train, X_test, y_test = build_dataset(n_days, n_stations, seed)
+    X_batch = np.resize(X_test, (rows, len(FEATURES)))
+    root = tempfile.mkdtemp(prefix='onea_models_')
+    results, reference = {}, None
+    try:
+        for backend in backends:
+            registry = ModelRegistry(os.path.join(root, backend))
+            start = time.perf_counter()
+            model = fit_backend(backend, X_train, y_train)
+            fit_s = time.perf_counter() - start
+            entry = registry.register(MODEL_NAME, model, backend=backend)
+
+            load_s = _median_time(lambda: registry.load(MODEL_NAME, cached=False), repeat)
+            cold = [float(subprocess.run(
+                [sys.executable, '-c', COLD_START.format(modules=os.path.join(ROOT, 'modules'), root=registry.root,
+                                                         name=MODEL_NAME, n_features=len(FEATURES))],
+                capture_output=True, text=True, check=True).stdout) for _ in range(max(1, repeat // 2))]
+            model = registry.load(MODEL_NAME, cached=False)
+            predict_s = _median_time(lambda: model.predict(X_batch), repeat)
+            station_ms = _median_time(lambda: model.predict(X_batch[:24]), repeat) * 1000
+
+            tracemalloc.start()
+            try:
+                registry.load(MODEL_NAME, cached=False).predict(X_batch)
+                peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            finally:
+                tracemalloc.stop()
+
+            predicted = model.predict(X_test)
+            if backend == 'forest':
+                reference = predicted
+            results[backend] = {
+                'size': model_size(model),
+                'fit_s': round(fit_s, 3),
+                'artifact_mb': round(entry['size_bytes'] / 2**20, 2),
+                'load_ms': round(load_s * 1000, 2),
+                'cold_start_s': round(statistics.median(cold), 3),
+                'predict_rows_per_s': round(rows / predict_s),
+                'predict_24h_ms': round(station_ms, 2),
+                'peak_mb': round(peak_mb, 2),
+                'r2': round(float(_r2(y_test, predicted)), 4),
+                'r2_vs_forest': round(float(_r2(reference, predicted)), 6) if reference is not None else None
+            }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def print_table(results, rows):
+    print(f"\n{'Backend':<8}{'Taille':>8}{'Fit (s)':>9}{'Artefact':>11}{'Charg.':>10}{'Froid':>9}"
+          f"{'Lignes/s':>12}{'24h':>10}{'Pic mém.':>11}{'R2':>8}{'R2/forest':>11}")
+    for backend, r in results.items():
+        agreement = '-' if r['r2_vs_forest'] is None else f"{r['r2_vs_forest']:.4f}"
+        print(f"{backend:<8}{r['size']:>8}{r['fit_s']:>9.2f}{r['artifact_mb']:>8.2f} Mo{r['load_ms']:>7.1f} ms"
+              f"{r['cold_start_s']:>7.2f} s{r['predict_rows_per_s']:>12}{r['predict_24h_ms']:>7.2f} ms"
+              f"{r['peak_mb']:>8.1f} Mo{r['r2']:>8.3f}{agreement:>11}")
+    print(f"\nDébit mesuré sur un lot de {rows} lignes ; 24h : prévision d'une station ; "
+          "Froid : nouveau processus, imports + chargement + une prévision")
+    print("Pic mémoire : allocations Python/NumPy (les pages en memory-map du format flat ne sont pas comptées)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Comparer les formats du modèle de prévision")
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--days', type=int, default=365, help="Jours d'historique simulé")
+    parser.add_argument('--stations', type=int, default=1, help="Stations dans l'historique d'entraînement")
+    parser.add_argument('--rows', type=int, default=PREDICT_ROWS, help="Lignes du lot de prédiction")
+    parser.add_argument('--repeat', type=int, default=5, help="Exécutions chronométrées (médiane)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Écrire les résultats (JSON)")
+    args = parser.parse_args()
+
+    results = compare_backends(args.backends, args.days, args.stations, args.rows, args.repeat, args.seed)
+    print_table(results, args.rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(), 'days': args.days, 'stations': args.stations,
+                       'rows': args.rows, 'results': results}, f, indent=2)
+        print(f"✓ Résultats enregistrés dans {args.output}")
@@ -0,0 +1,378 @@
+"""
+Banc d'Essai des Performances ONEA (étapes du pipeline + endpoints de l'API)
+Chaque étape est exécutée sur un jeu de télémétrie simulé à plusieurs échelles
+(nombre de stations × jours d'historique), dans un espace de travail temporaire :
+temps d'exécution (médiane), pic mémoire (tracemalloc) et débit (enregistrements/s)
+Les résultats sont comparés aux références (benchmarks/baselines.json) et toute
+dégradation au-delà du seuil est signalée (code de sortie 1 avec --check)
+Aucun accès réseau : tout est généré localement (module 1)
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'modules'))
+sys.path.insert(0, ROOT)
+
+BASELINES_FILE = os.path.join(ROOT, 'benchmarks', 'baselines.json')
+PROFILES = {
+    'quick': {'stations': [1, 100], 'days': [30], 'repeat': 3},
+    'full': {'stations': [1, 100, 1000], 'days': [30, 365, 730], 'repeat': 1}
+}
+REGRESSION_THRESHOLD = 0.25   # +25 % de temps ou de mémoire par rapport à la référence
+MIN_DELTA_S = 0.005           # écarts de temps inférieurs à 5 ms ignorés (bruit de mesure)
+START_DATE = datetime(2024, 1, 1)
+SEED = 42
+API_REQUESTS = 50             # requêtes "à chaud" par endpoint après la première (à froid)
+API_ENDPOINTS = [
+    '/api/kpi', '/api/predictions', '/api/schedule', '/api/anomalies', '/api/anomalies/facets', '/api/anomalies/recent',
+    '/api/ranking', '/api/history?metric=energy_kwh,level_pct'
+]
+
+# --- Espace de travail (chemins 'data/...' relatifs au répertoire courant, comme en production) ---
+def prepare_workspace(workdir, n_stations, n_days):
+    """Dossier <workdir>/<N>st_<J>j avec un store télémétrie généré (réutilisé s'il existe déjà)"""
+    from module1_prediction import write_generated_store
+    path = os.path.join(workdir, f'{n_stations}st_{n_days}j')
+    if not os.path.exists(os.path.join(path, 'data', 'telemetry', 'manifest.json')):
+        shutil.rmtree(path, ignore_errors=True)
+        with quiet():
+            write_generated_store(os.path.join(path, 'data', 'telemetry'), n_days=n_days, n_stations=n_stations,
+                                  seed=SEED, chunk_days=92, start_date=START_DATE)
+    return path
+
+@contextlib.contextmanager
+def quiet():
+    """Les modules rendent compte par print() : la sortie est masquée pendant les mesures"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def _reset_models(ctx=None):
+    """Repartir d'un registre vide et sans scores en cache (chemin à froid d'un run nocturne)"""
+    import anomaly_scoring
+    import model_registry
+    shutil.rmtree('models', ignore_errors=True)
+    model_registry._LOADED.clear()
+    anomaly_scoring._SCORES.clear()
+    if os.path.exists(anomaly_scoring.SCORES_CACHE):
+        os.remove(anomaly_scoring.SCORES_CACHE)
+
+def _model(ctx):
+    """Modèle de prévision entraîné une fois par échelle (entrée des étapes en aval)"""
+    if 'model' not in ctx:
+        from module1_prediction import train_model, load_history
+        with quiet():
+            ctx['model'] = train_model(load_history(), force_full=True)
+    return ctx['model']
+
+def _forecast(ctx):
+    if 'forecast' not in ctx:
+        from module1_prediction import forecast
+        ctx['forecast'] = forecast(_model(ctx), stations=ctx['station_ids'], as_frame=False)
+    return ctx['forecast']
+
+# --- Étapes mesurées : prepare (non chronométré, une fois par échelle), reset (non chronométré,
+# avant chaque exécution), run (chronométré, retourne le nombre d'enregistrements traités) ---
+def _prepare_train(ctx):
+    from module1_prediction import load_history
+    ctx['history'] = load_history()
+
+def _run_train(ctx):
+    from module1_prediction import train_model
+    train_model(ctx['history'], force_full=True)
+    return len(ctx['history']['timestamp'])
+
+def _run_predictions(ctx):
+    """make_predictions étendu à N stations : une prévision 24 h par station, exportée en JSON"""
+    from module1_prediction import forecast
+    frame = forecast(_model(ctx), stations=ctx['station_ids'])
+    predictions = frame.to_dict(orient='records')
+    with open('data/predictions.json', 'w') as f:
+        json.dump(predictions, f, indent=2)
+    return len(predictions)
+
+def _prepare_optimize(ctx):
+    from module1_prediction import forecast
+    arrays = _forecast(ctx)
+    frame = forecast(_model(ctx))
+    ctx['predictions'] = frame.drop(columns='station_id').to_dict(orient='records')
+    ctx['fleet'] = (arrays['energy_predicted'], arrays['solar_capacity_predicted'],
+                    arrays['grid_status_predicted'], arrays['flow_estimated'])
+
+def _run_optimize(ctx):
+    """Une station : optimize_pumping (planning JSON) ; N stations : optimize_fleet (même heuristique)"""
+    from module2_optimization import optimize_pumping, optimize_fleet
+    if len(ctx['station_ids']) == 1:
+        return len(optimize_pumping(predictions=ctx['predictions']))
+    demand, solar, grid_status, flow = ctx['fleet']
+    return int(optimize_fleet(demand, solar, grid_status, flow=flow)['cost_fcfa'].size)
+
+def _run_anomalies(ctx):
+    from module3_anomalies import detect_anomalies
+    detect_anomalies(stations=ctx['station_ids'])
+    return ctx['rows']
+
+def _run_ml_anomalies(ctx):
+    from module3bis_ml_anomalies import run_ml_anomaly_detection
+    run_ml_anomaly_detection()
+    return ctx['reference_rows']
+
+def _run_ranking(ctx):
+    from module4_ranking import RankingEngine, rank_stations
+    engine = RankingEngine()
+    added = engine.update_from_store(ctx['store'])
+    rank_stations(engine)
+    return added
+
+def _reset_rollups(ctx):
+    shutil.rmtree('data/rollups', ignore_errors=True)
+
+def _run_rollups(ctx):
+    from rollups import Rollups
+    return Rollups().update(ctx['store'])
+
+STAGES = {
+    'train_model': {'axes': ('days',), 'prepare': _prepare_train, 'reset': _reset_models, 'run': _run_train},
+    'make_predictions': {'axes': ('stations',), 'prepare': _model, 'run': _run_predictions},
+    'optimize_pumping': {'axes': ('stations',), 'prepare': _prepare_optimize, 'run': _run_optimize},
+    'detect_anomalies': {'axes': ('stations', 'days'), 'reset': _reset_models, 'run': _run_anomalies},
+    'run_ml_anomaly_detection': {'axes': ('days',), 'reset': _reset_models, 'run': _run_ml_anomalies},
+    'rank_stations': {'axes': ('stations', 'days'), 'run': _run_ranking},
+    'update_rollups': {'axes': ('stations', 'days'), 'reset': _reset_rollups, 'run': _run_rollups}
+}
+
+# --- Endpoints de l'API (client de test Flask, sans serveur ni réseau) ---
+def _prepare_api(ctx):
+    """Produire une fois tous les artefacts publiés (comme après un run du pipeline)"""
+    if ctx.get('api_ready'):
+        return
+    _run_predictions(ctx)
+    from module2_optimization import optimize_pumping
+    _prepare_optimize(ctx)
+    optimize_pumping(predictions=ctx['predictions'])
+    _reset_models()
+    _run_anomalies(ctx)
+    _run_ml_anomalies(ctx)
+    _run_ranking(ctx)
+    _reset_rollups(ctx)
+    _run_rollups(ctx)
+    import app
+    ctx['client'] = app.app.test_client()
+    ctx['api_ready'] = True
+
+def _reset_api(ctx):
+    """Vider les caches mémoire de l'API : la première requête mesurée est à froid"""
+    import app
+    app._artifacts.clear()
+    app._responses.clear()
+    app._anomaly_index = (None, None)
+    app._anomaly_records.clear()
+    app._current_anomalies = (None, None)
+    app._store = (None, None)
+    app._rollups._cache.clear()
+
+def _api_stage(url):
+    def run(ctx):
+        latencies = []
+        for _ in range(API_REQUESTS + 1):
+            start = time.perf_counter()
+            response = ctx['client'].get(url)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} -> HTTP {response.status_code}")
+        ctx['latencies'] = latencies
+        return API_REQUESTS + 1
+    return {'axes': ('stations', 'days'), 'prepare': _prepare_api, 'reset': _reset_api, 'run': run, 'unit': 'req'}
+
+for _url in API_ENDPOINTS:
+    STAGES['api:' + _url.split('?')[0]] = _api_stage(_url)
+
+# --- Mesure ---
+def _cases(stages, stations, days):
+    """(étape, stations, jours) ; un axe que l'étape n'utilise pas est fixé à sa plus petite valeur"""
+    cases = []
+    for name in stages:
+        axes = STAGES[name]['axes']
+        for n in (stations if 'stations' in axes else [min(stations)]):
+            for d in (days if 'days' in axes else [min(days)]):
+                cases.append((name, n, d))
+    return cases
+
+def measure(name, ctx, repeat=3, memory=True):
+    stage = STAGES[name]
+    reset = stage.get('reset', lambda ctx: None)
+    times, records = [], 0
+    for _ in range(repeat):
+        with quiet():
+            reset(ctx)
+            start = time.perf_counter()
+            records = stage['run'](ctx)
+            times.append(time.perf_counter() - start)
+    result = {'wall_s': round(statistics.median(times), 4), 'records': int(records)}
+    if 'latencies' in ctx:
+        # Endpoint : première requête à froid, puis latence à chaud (p50 / p95)
+        latencies = ctx.pop('latencies')
+        warm = sorted(latencies[1:])
+        result['cold_ms'] = round(latencies[0] * 1000, 2)
+        result['p50_ms'] = round(warm[len(warm) // 2] * 1000, 3)
+        result['p95_ms'] = round(warm[int(len(warm) * 0.95)] * 1000, 3)
+    result['throughput'] = round(records / result['wall_s'], 1) if result['wall_s'] > 0 else None
+    result['unit'] = stage.get('unit', 'rec') + '/s'
+    if memory:
+        with quiet():
+            reset(ctx)
+            tracemalloc.start()
+            try:
+                stage['run'](ctx)
+                result['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            finally:
+                tracemalloc.stop()
+        ctx.pop('latencies', None)
+    return result
+
+def run_benchmarks(stages=None, stations=(1, 100), days=(30,), repeat=3, memory=True, workdir=None):
+    """Exécuter les étapes à chaque échelle -> {identifiant du cas: résultat}"""
+    stages = stages or list(STAGES)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Étapes inconnues : {', '.join(sorted(unknown))}")
+    keep = workdir is not None
+    workdir = os.path.abspath(workdir or tempfile.mkdtemp(prefix='onea_bench_'))
+    cwd = os.getcwd()
+    results, contexts = {}, {}
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    try:
+        for name, n, d in _cases(stages, sorted(stations), sorted(days)):
+            path = prepare_workspace(workdir, n, d)
+            os.chdir(path)
+            if (n, d) not in contexts:
+                from telemetry_store import TelemetryStore, DEFAULT_STATION
+                store = TelemetryStore('data/telemetry')
+                contexts[(n, d)] = {'store': store, 'station_ids': store.stations(),
+                                    'rows': store.row_count(), 'reference_rows': store.row_count(DEFAULT_STATION)}
+            ctx = contexts[(n, d)]
+            with quiet():
+                STAGES[name].get('prepare', lambda ctx: None)(ctx)
+            case = f'{name}@{n}st_{d}j'
+            results[case] = measure(name, ctx, repeat, memory)
+            print(format_result(case, results[case]))
+    finally:
+        os.chdir(cwd)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def format_result(case, r):
+    peak = f"{r['peak_mb']:>9.1f} Mo" if 'peak_mb' in r else f"{'-':>12}"
+    extra = f"  p50 {r['p50_ms']} ms, p95 {r['p95_ms']} ms, froid {r['cold_ms']} ms" if 'p50_ms' in r else ''
+    return f"{case:<55}{r['wall_s']:>10.4f} s{peak}{r['throughput'] or 0:>14.0f} {r['unit']}{extra}"
+
+# --- Références et détection des régressions ---
+def machine_info():
+    import numpy
+    import sklearn
+    return {
+        'platform': platform.platform(), 'python': platform.python_version(), 'cpu_count': os.cpu_count(),
+        'numpy': numpy.__version__, 'scikit_learn': sklearn.__version__
+    }
+
+def load_baselines(path=BASELINES_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {'machine': None, 'results': {}}
+
+def save_baselines(results, path=BASELINES_FILE):
+    """Fusionner les résultats dans le fichier de références (les autres cas sont conservés)"""
+    baselines = load_baselines(path)
+    baselines['machine'] = machine_info()
+    baselines['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    baselines['results'] = dict(baselines.get('results', {}), **results)
+    baselines['results'] = dict(sorted(baselines['results'].items()))
+    with open(path, 'w') as f:
+        json.dump(baselines, f, indent=2)
+    print(f"✓ {len(results)} références enregistrées dans {path}")
+
+def compare(results, baselines, threshold=REGRESSION_THRESHOLD):
+    """
+    Écarts par rapport aux références : [{case, metric, baseline, current, ratio, regression}]
+    Régression = temps ou pic mémoire au-delà de (1 + threshold) × la référence
+    """
+    report = []
+    for case, current in results.items():
+        base = baselines.get('results', {}).get(case)
+        if base is None:
+            continue
+        for metric in ('wall_s', 'peak_mb'):
+            if metric not in current or not base.get(metric):
+                continue
+            ratio = current[metric] / base[metric]
+            noise = metric == 'wall_s' and current[metric] - base[metric] < MIN_DELTA_S
+            report.append({
+                'case': case, 'metric': metric, 'baseline': base[metric], 'current': current[metric],
+                'ratio': round(ratio, 3), 'regression': ratio > 1 + threshold and not noise
+            })
+    return report
+
+def print_report(report, baselines, threshold=REGRESSION_THRESHOLD):
+    if not report:
+        print("\nAucune référence comparable pour ces cas (voir --save-baseline)")
+        return
+    if baselines.get('machine') and baselines['machine'] != machine_info():
+        print("\n⚠ Références mesurées sur une autre machine : comparaison indicative")
+    regressions = [r for r in report if r['regression']]
+    print(f"\nComparaison aux références (seuil +{threshold * 100:.0f} %) :")
+    for r in report:
+        flag = '✗ RÉGRESSION' if r['regression'] else '✓'
+        print(f"  {flag:<13}{r['case']:<55}{r['metric']:<9}{r['baseline']:>10} -> {r['current']:<10} (×{r['ratio']})")
+    print(f"\n{len(regressions)} régression(s) sur {len(report)} mesures comparées")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Banc d'essai des performances ONEA")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick',
+                        help="quick : 1 et 100 stations × 30 jours ; full : 1/100/1000 stations × 30/365/730 jours")
+    parser.add_argument('--stages', nargs='+', metavar='ETAPE', help="Étapes à mesurer (défaut : toutes)")
+    parser.add_argument('--stations', type=int, nargs='+', help="Nombres de stations (remplace le profil)")
+    parser.add_argument('--days', type=int, nargs='+', help="Jours d'historique (remplace le profil)")
+    parser.add_argument('--repeat', type=int, help="Exécutions chronométrées par cas (médiane)")
+    parser.add_argument('--no-memory', action='store_true', help="Ne pas mesurer le pic mémoire (exécution supplémentaire)")
+    parser.add_argument('--workdir', help="Conserver les jeux de données générés dans ce dossier (réutilisés)")
+    parser.add_argument('--baseline', default=BASELINES_FILE, help="Fichier de références")
+    parser.add_argument('--save-baseline', action='store_true', help="Enregistrer les résultats comme références")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help="Seuil de régression (0.25 = +25 %%)")
+    parser.add_argument('--check', action='store_true', help="Code de sortie 1 en cas de régression")
+    parser.add_argument('--output', help="Écrire les résultats bruts (JSON)")
+    parser.add_argument('--list', action='store_true', help="Lister les étapes disponibles")
+    args = parser.parse_args()
+    if args.list:
+        for name, stage in STAGES.items():
+            print(f"{name:<30} échelles : {' × '.join(stage['axes'])}")
+        raise SystemExit(0)
+
+    profile = PROFILES[args.profile]
+    results = run_benchmarks(
+        stages=args.stages, stations=args.stations or profile['stations'], days=args.days or profile['days'],
+        repeat=args.repeat or profile['repeat'], memory=not args.no_memory, workdir=args.workdir
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine_info(), 'results': results}, f, indent=2)
+    baselines = load_baselines(args.baseline)
+    report = compare(results, baselines, args.threshold)
+    print_report(report, baselines, args.threshold)
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+    raise SystemExit(1 if args.check and any(r['regression'] for r in report) else 0)
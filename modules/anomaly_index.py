@@ -0,0 +1,164 @@
+"""
+Index des Anomalies publiées (journaux data/anomalies.ndjson + data/ml_anomalies.ndjson) pour l'API
+Construit une fois par version des fichiers : masques par valeur de filtre
+(sévérité, type d'alerte, méthode, station), horodatages et valeur de chaque
+clé de tri. Une page coûte O(taille de page) une fois le résultat d'un filtre
+calculé (résultats mémorisés)
+Identifiant d'une anomalie : journal + position dans ce journal (en ajout seul, donc stable) ;
+le curseur de pagination contient la clé de tri et l'identifiant de la dernière anomalie servie
+"""
+
+import numpy as np
+from metrics import cache_access
+
+SORT_FIELDS = ('severity_score', 'date', 'flow', 'energy', 'level')
+FILTER_FIELDS = ('severity', 'alert', 'method', 'station')
+ML_ALERT = 'COMPORTEMENT_INHABITUEL_ML'
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+MAX_CACHED_QUERIES = 64
+SOURCE_SHIFT = 40        # identifiant = (n° de journal << SOURCE_SHIFT) + position dans le journal
+
+def _severity(record):
+    """(libellé, score) : le rapport ML (3bis) stocke un score numérique dans 'severity'"""
+    severity = record.get('severity', 2)
+    score = record.get('severity_score', severity if isinstance(severity, (int, float)) else 2)
+    if not isinstance(severity, str):
+        severity = 'CRITIQUE' if score >= 4 else 'MOYENNE' if score >= 2 else 'FAIBLE'
+    return severity, score
+
+class AnomalyIndex:
+    """
+    Anomalies des deux journaux ; positions : position de chaque anomalie dans son journal
+    (par défaut 0, 1, 2...), d'où l'identifiant stable renvoyé dans le champ 'id'
+    """
+
+    def __init__(self, rule_based, ml_based, positions=None):
+        self.records = [(r, 'rule_based') for r in rule_based] + [(r, 'ml_based') for r in ml_based]
+        n = len(self.records)
+        if positions is None:
+            positions = (np.arange(len(rule_based)), np.arange(len(ml_based)))
+        self.uid = np.concatenate([np.asarray(p, dtype=np.int64) + (source << SOURCE_SHIFT)
+                                   for source, p in enumerate(positions)]).astype(np.int64)
+        severities = [_severity(r) for r, _ in self.records]
+        self.timestamp = np.array([f"{r['date']}T{int(r['hour']):02d}" for r, _ in self.records],
+                                  dtype='datetime64[h]')
+        self.hour = np.array([int(r['hour']) for r, _ in self.records], dtype=np.int16)
+
+        # Index inversés : valeur -> masque booléen des anomalies concernées
+        values = {
+            'severity': [[s] for s, _ in severities],
+            'alert': [r.get('alerts') or [ML_ALERT] for r, _ in self.records],
+            'method': [[r.get('detection_method', '')] for r, _ in self.records],
+            'station': [[r.get('station_id', '')] for r, _ in self.records]
+        }
+        self.postings = {}
+        for field, per_record in values.items():
+            postings = {}
+            for i, keys in enumerate(per_record):
+                for key in keys:
+                    postings.setdefault(key, np.zeros(n, dtype=bool))[i] = True
+            self.postings[field] = postings
+
+        # Valeur de chaque clé de tri (égalités départagées par identifiant)
+        self.sort_values = {
+            'severity_score': np.array([s for _, s in severities], dtype=float),
+            'date': self.timestamp.astype(np.int64).astype(float),
+            'flow': np.array([r.get('flow', 0) for r, _ in self.records], dtype=float),
+            'energy': np.array([r.get('energy', 0) for r, _ in self.records], dtype=float),
+            'level': np.array([r.get('level', 0) for r, _ in self.records], dtype=float)
+        }
+        self._results = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def facets(self):
+        """Valeurs disponibles pour chaque filtre (avec effectifs), pour construire les listes de choix"""
+        return {field: {k: int(m.sum()) for k, m in sorted(p.items())} for field, p in self.postings.items()}
+
+    def _select(self, filters, start, end, hour_min, hour_max, sort, order):
+        """
+        Anomalies retenues dans l'ordre demandé : (indices, valeurs de tri, identifiants), valeurs
+        et identifiants négatifs en ordre décroissant pour que le couple soit toujours croissant
+        """
+        key = (tuple(sorted((f, tuple(v)) for f, v in filters.items())), start, end, hour_min, hour_max, sort, order)
+        cache_access('anomaly_query', key in self._results)
+        if key in self._results:
+            return self._results[key]
+        mask = np.ones(len(self.records), dtype=bool)
+        for field, wanted in filters.items():
+            postings = self.postings[field]
+            mask &= np.logical_or.reduce([postings[v] for v in wanted if v in postings] or [np.zeros_like(mask)])
+        if start is not None:
+            mask &= self.timestamp >= start
+        if end is not None:
+            mask &= self.timestamp <= end
+        if hour_min is not None:
+            mask &= self.hour >= hour_min
+        if hour_max is not None:
+            mask &= self.hour <= hour_max
+        ids = np.flatnonzero(mask)
+        sign = 1 if order == 'asc' else -1
+        values, uids = self.sort_values[sort][ids] * sign, self.uid[ids] * sign
+        sorted_pos = np.lexsort((uids, values))
+        result = (ids[sorted_pos], values[sorted_pos], uids[sorted_pos])
+        if len(self._results) >= MAX_CACHED_QUERIES:
+            self._results.pop(next(iter(self._results)))
+        self._results[key] = result
+        return result
+
+    def query(self, filters=None, start=None, end=None, hour_min=None, hour_max=None,
+              sort='severity_score', order='desc', cursor=None, limit=DEFAULT_LIMIT):
+        """
+        Page d'anomalies filtrées et triées
+        filters : {champ: [valeurs]} (OU entre valeurs d'un champ, ET entre champs)
+        start/end : bornes incluses (date ou date+heure), hour_min/hour_max : heures de la journée
+        cursor : valeur 'next_cursor' de la page précédente (pagination par clé : la page suivante
+        commence après (valeur de tri, identifiant) de la dernière anomalie servie, même si des
+        anomalies ont été ajoutées entre-temps)
+        """
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"tri inconnu : {sort} (valeurs : {', '.join(SORT_FIELDS)})")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"ordre inconnu : {order}")
+        unknown = set(filters or {}) - set(FILTER_FIELDS)
+        if unknown:
+            raise ValueError(f"filtre inconnu : {', '.join(sorted(unknown))}")
+        start = None if start is None else np.datetime64(start, 'h')
+        end = None if end is None else _inclusive_end(end)
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        sign = 1 if order == 'asc' else -1
+
+        ids, values, uids = self._select(filters or {}, start, end, hour_min, hour_max, sort, order)
+        first = 0
+        if cursor is not None:
+            value, uid = _parse_cursor(cursor)
+            lo = np.searchsorted(values, value * sign, side='left')
+            hi = np.searchsorted(values, value * sign, side='right')
+            first = int(lo + np.searchsorted(uids[lo:hi], uid * sign, side='right'))
+        page = ids[first:first + limit]
+        items = [dict(self.records[i][0], id=int(self.uid[i]), source=self.records[i][1]) for i in page]
+        has_more = first + limit < len(ids)
+        last = first + limit - 1
+        return {
+            'items': items,
+            'total': int(len(ids)),
+            'limit': limit,
+            'next_cursor': f"{float(values[last] * sign)!r}_{int(uids[last] * sign)}" if has_more else None
+        }
+
+def _parse_cursor(cursor):
+    """'valeur_identifiant' -> (valeur de tri, identifiant)"""
+    try:
+        value, uid = str(cursor).rsplit('_', 1)
+        return float(value), int(uid)
+    except ValueError:
+        raise ValueError(f"curseur invalide : {cursor}") from None
+
+def _inclusive_end(end):
+    """Une date seule ('2026-02-05') inclut toute la journée"""
+    end = str(end)
+    if 'T' in end or ' ' in end:
+        return np.datetime64(end.replace(' ', 'T'), 'h')
+    return np.datetime64(end, 'D').astype('datetime64[h]') + np.timedelta64(23, 'h')
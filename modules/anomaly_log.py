@@ -0,0 +1,124 @@
+"""
+Journal des Anomalies (NDJSON en ajout seul + index des positions)
+Chaque anomalie est une ligne JSON compacte de <nom>.ndjson, identifiée par (station, date,
+heure, méthode de détection) : une anomalie déjà journalisée par un run précédent n'est pas
+réécrite, un nouveau run n'ajoute que les nouvelles et le fichier grandit avec elles
+<nom>.idx contient une entrée binaire de taille fixe par ligne (position, longueur, empreinte
+de la clé) : les n dernières anomalies, ou celles ajoutées depuis la position k, sont lues
+sans parcourir le reste du journal
+Un seul écrivain par journal (module 3 : data/anomalies.ndjson, module 3bis : data/ml_anomalies.ndjson)
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+
+ANOMALY_LOG = 'data/anomalies.ndjson'
+ML_ANOMALY_LOG = 'data/ml_anomalies.ndjson'
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('length', '<i4'), ('key', '<u8')])
+
+def record_key(record):
+    """Empreinte 64 bits de (station, date, heure, méthode de détection)"""
+    text = f"{record.get('station_id', '')}|{record['date']}|{int(record['hour'])}|{record.get('detection_method', '')}"
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+class AnomalyLog:
+    """Journal d'anomalies d'un détecteur ; les positions (ordre d'ajout) ne changent jamais"""
+
+    def __init__(self, path=ANOMALY_LOG):
+        self.path = path
+        base = os.path.splitext(path)[0]
+        self.index_path = base + '.idx'
+        self.legacy_path = base + '.json'   # ancien format, réécrit en entier à chaque run
+
+    def __len__(self):
+        self._import_legacy()
+        try:
+            return os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self, start, stop):
+        if stop <= start:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        with open(self.index_path, 'rb') as f:
+            f.seek(start * INDEX_DTYPE.itemsize)
+            return np.fromfile(f, dtype=INDEX_DTYPE, count=stop - start)
+
+    # --- Lecture ---
+    def read(self, start=0, stop=None):
+        """Anomalies aux positions [start, stop) : une seule lecture de la plage d'octets correspondante"""
+        start, stop, _ = slice(start, stop).indices(len(self))
+        entries = self._entries(start, stop)
+        if not len(entries):
+            return []
+        begin = int(entries['offset'][0])
+        end = int(entries['offset'][-1]) + int(entries['length'][-1])
+        with open(self.path, 'rb') as f:
+            f.seek(begin)
+            chunk = f.read(end - begin)
+        # Une ligne JSON ne contient pas de saut de ligne brut : la plage devient un seul tableau JSON
+        return json.loads(b'[' + chunk.rstrip(b'\n').replace(b'\n', b',') + b']')
+
+    def tail(self, n):
+        """Les n dernières anomalies ajoutées (ordre d'ajout)"""
+        return self.read(max(0, len(self) - n))
+
+    # --- Écriture ---
+    def append(self, records):
+        """
+        Ajouter les anomalies dont la clé est absente du journal (les doublons du lot sont
+        aussi écartés) ; retourne les anomalies effectivement ajoutées
+        """
+        self._import_legacy()
+        self._repair()
+        records = list(records)
+        keys = np.array([record_key(r) for r in records], dtype=np.uint64)
+        _, first = np.unique(keys, return_index=True)
+        known = self._entries(0, len(self))['key']
+        fresh = np.sort(first[~np.isin(keys[first], known)])
+        added = [records[i] for i in fresh]
+        self._write(added, keys[fresh])
+        return added
+
+    def _write(self, records, keys):
+        """Lignes puis entrées d'index : une entrée n'existe que si sa ligne est complète sur disque"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lines = [(json.dumps(r, separators=(',', ':'), ensure_ascii=False) + '\n').encode() for r in records]
+        entries = np.zeros(len(lines), dtype=INDEX_DTYPE)
+        entries['length'] = [len(line) for line in lines]
+        start = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        entries['offset'] = start + np.cumsum(entries['length']) - entries['length']
+        entries['key'] = keys
+        with open(self.path, 'ab') as f:
+            f.write(b''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, 'ab') as f:
+            f.write(entries.tobytes())
+
+    def _repair(self):
+        """Écriture interrompue : retirer l'entrée d'index incomplète et les lignes non indexées"""
+        if not os.path.exists(self.index_path):
+            return
+        n = len(self)
+        if os.path.getsize(self.index_path) != n * INDEX_DTYPE.itemsize:
+            os.truncate(self.index_path, n * INDEX_DTYPE.itemsize)
+        last = self._entries(n - 1, n) if n else None
+        end = int(last['offset'][0]) + int(last['length'][0]) if n else 0
+        if os.path.exists(self.path) and os.path.getsize(self.path) > end:
+            os.truncate(self.path, end)
+
+    def _import_legacy(self):
+        """Premier accès : reprendre les anomalies de l'ancien fichier JSON (data/anomalies.json...)"""
+        if os.path.exists(self.index_path) or not os.path.exists(self.legacy_path):
+            return
+        with open(self.legacy_path, 'r') as f:
+            records = json.load(f)
+        keys = np.array([record_key(r) for r in records], dtype=np.uint64)
+        _, first = np.unique(keys, return_index=True)
+        first = np.sort(first)
+        if os.path.exists(self.path):
+            os.truncate(self.path, 0)
+        self._write([records[i] for i in first], keys[first])
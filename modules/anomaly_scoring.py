@@ -0,0 +1,84 @@
+"""
+Service de Scoring d'Anomalies (Isolation Forest partagé)
+Un seul modèle et un seul calcul de scores par lot de télémétrie, utilisés à la fois
+par la fusion règles + ML du module 3 et par le rapport ML du module 3bis
+Le modèle est versionné dans le registre (models/), les scores sont mis en cache
+(mémoire + data/anomaly_scores.npz) par empreinte des données
+"""
+
+import os
+import threading
+import numpy as np
+from model_registry import ModelRegistry, data_fingerprint
+from metrics import cache_access, model_call
+
+MODEL_NAME = 'anomaly_iforest'
+# Features communes : mesures + contexte Solaire/Réseau
+FEATURES = ['flow', 'energy', 'level', 'hour', 'solar_capacity', 'grid_status']
+CONTAMINATION = 0.08             # proportion d'anomalies attendue
+SCORES_CACHE = 'data/anomaly_scores.npz'
+
+# Scores déjà calculés dans ce processus : (empreinte du lot, empreinte d'entraînement) -> résultat
+_SCORES = {}
+# Modules 3 et 3bis peuvent tourner en parallèle (pipeline) : le second attend le premier
+# et réutilise ses scores au lieu d'entraîner un deuxième modèle
+_LOCK = threading.Lock()
+
+def build_features(data):
+    """Matrice de features (N × 6) à partir des colonnes de télémétrie"""
+    return np.column_stack([np.asarray(data[f], dtype=float) for f in FEATURES])
+
+def load_model(X, registry=None):
+    """
+    Modèle entraîné sur X : rechargé depuis le registre si une version a déjà été
+    entraînée sur exactement ces données, sinon entraîné une fois et enregistré
+    """
+    registry = registry or ModelRegistry()
+    fingerprint = data_fingerprint(X)
+    latest = registry.latest(MODEL_NAME)
+    if latest and latest.get('fingerprint') == fingerprint:
+        return registry.load(MODEL_NAME), latest['version']
+    from sklearn.ensemble import IsolationForest   # import à la demande (coûteux au démarrage)
+    model = IsolationForest(contamination=CONTAMINATION, random_state=42, n_estimators=100)
+    with model_call(MODEL_NAME, 'fit', len(X)):
+        model.fit(X)
+    entry = registry.register(MODEL_NAME, model, fingerprint=fingerprint, rows_trained=len(X),
+                              features=FEATURES, contamination=CONTAMINATION)
+    print(f"  → Isolation Forest entraîné sur {len(X)} points (v{entry['version']})")
+    return model, entry['version']
+
+def score_telemetry(data, training=None, registry=None, cache_path=SCORES_CACHE):
+    """
+    Scores d'anomalie d'un lot de télémétrie (dict de colonnes)
+    Le modèle est entraîné sur `training` (par défaut : le lot lui-même)
+    Retourne {'score': (N,), 'is_anomaly': (N,) bool, 'model_version': int}
+    (score plus négatif = plus anormal ; is_anomaly <=> predict() == -1)
+    """
+    with _LOCK:
+        return _score_telemetry(data, training, registry, cache_path)
+
+def _score_telemetry(data, training, registry, cache_path):
+    X = build_features(data)
+    X_train = X if training is None else build_features(training)
+    key = (data_fingerprint(X), data_fingerprint(X_train))
+    cached = _SCORES.get(key)
+    if cached is None and cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as f:
+            if (str(f['fingerprint']), str(f['training'])) == key:
+                cached = {'score': f['score'], 'is_anomaly': f['is_anomaly'],
+                          'model_version': int(f['model_version'])}
+    cache_access('anomaly_scores', cached is not None)
+    if cached is not None:
+        return cached
+
+    model, version = load_model(X_train, registry)
+    with model_call(MODEL_NAME, 'predict', len(X)):
+        scores = model.score_samples(X)
+    result = {'score': scores, 'is_anomaly': scores < model.offset_, 'model_version': version}
+    _SCORES[key] = result
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        tmp = cache_path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp, fingerprint=key[0], training=key[1], **result)
+        os.replace(tmp, cache_path)
+    return result
@@ -0,0 +1,255 @@
+"""
+Backtest Walk-Forward du Modèle de Prévision
+Pour chaque station et chaque jour de la période testée : entraînement sur les TRAIN_DAYS
+jours précédents uniquement, puis prévision du jour suivant (aucune heure future dans
+l'entraînement). Les folds sont répartis sur un pool de processus ; la matrice de features
+et le tableau des prévisions sont en mémoire partagée (multiprocessing.shared_memory) :
+chaque worker lit ses tranches et écrit ses prévisions sans copie ni pickle des données
+Rapport : MAE / MAPE par heure, par saison et par station, comparés à la persistance (J-1)
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from telemetry_store import open_store
+from module1_prediction import FEATURES, BACKENDS, DEFAULT_BACKEND, fit_backend
+
+TRAIN_DAYS = 28          # fenêtre glissante d'entraînement (jours)
+STEP_DAYS = 1            # ré-entraînement tous les N jours (le modèle prévoit les N jours suivants)
+TREES = 50               # arbres par modèle de fold (forest / flat)
+FOLDS_PER_TASK = 16      # folds envoyés ensemble à un worker
+MIN_TRAIN_FRACTION = 0.5 # fold ignoré si moins de la moitié des heures de la fenêtre sont présentes
+REPORT_PATH = 'data/backtest_report.json'
+
+# Saisons du Burkina Faso (mêmes mois que le générateur de données du module 1)
+SEASONS = {'seche_fraiche': (10, 11, 12, 1, 2), 'chaude': (3, 4, 5), 'pluies': (6, 7, 8, 9)}
+_MONTH_SEASON = np.zeros(13, dtype=np.int8)
+for _i, _months in enumerate(SEASONS.values()):
+    _MONTH_SEASON[list(_months)] = _i
+
+MATRIX_COLUMNS = FEATURES + ['energy', 'day']
+_TARGET = MATRIX_COLUMNS.index('energy')
+_DAY = MATRIX_COLUMNS.index('day')
+
+def build_matrix(data):
+    """
+    Colonnes du store (plusieurs stations) -> matrice float64 (lignes × MATRIX_COLUMNS)
+    triée par station puis par heure, avec l'indice de station et l'horodatage de chaque ligne
+    """
+    timestamps = np.asarray(data['timestamp'], dtype='datetime64[h]')
+    station_index = np.asarray(data['station_index'])
+    order = np.lexsort((timestamps, station_index))
+    matrix = np.empty((len(order), len(MATRIX_COLUMNS)))
+    for j, c in enumerate(FEATURES + ['energy']):
+        matrix[:, j] = np.asarray(data[c], dtype=float)[order]
+    matrix[:, _DAY] = timestamps[order].astype('datetime64[D]').astype(np.int64)
+    return matrix, station_index[order], timestamps[order]
+
+def plan_folds(station_index, days, n_stations, train_days=TRAIN_DAYS, step=STEP_DAYS, first_day=None, last_day=None):
+    """
+    Folds (début, fin des lignes d'entraînement, début, fin des lignes de test) : les lignes
+    d'une station étant contiguës et triées, chaque fold est une paire de tranches
+    """
+    folds = []
+    bounds = np.searchsorted(station_index, np.arange(n_stations + 1))
+    min_rows = train_days * 24 * MIN_TRAIN_FRACTION
+    for s in range(n_stations):
+        lo, hi = bounds[s], bounds[s + 1]
+        if hi == lo:
+            continue
+        station_days = days[lo:hi]
+        first = int(station_days[0]) + train_days
+        if first_day is not None:
+            first = max(first, first_day)
+        last = int(station_days[-1]) if last_day is None else min(int(station_days[-1]), last_day)
+        for d in range(first, last + 1, step):
+            train = lo + np.searchsorted(station_days, [d - train_days, d])
+            test = lo + np.searchsorted(station_days, [d, min(d + step, last + 1)])
+            if train[1] - train[0] >= min_rows and test[1] > test[0]:
+                folds.append((int(train[0]), int(train[1]), int(test[0]), int(test[1])))
+    return folds
+
+# --- Workers (état par processus : segments partagés attachés une fois) ---
+_WORKER = {}
+
+def _attach(matrix_spec, output_spec, backend, trees):
+    for key, (name, shape, dtype) in (('matrix', matrix_spec), ('predicted', output_spec)):
+        segment = shared_memory.SharedMemory(name=name)
+        _WORKER[key] = (segment, np.ndarray(shape, dtype=dtype, buffer=segment.buf))
+    _WORKER['config'] = (backend, trees)
+
+def _run_folds(folds):
+    """Entraîner et prévoir une liste de folds ; prévisions écrites dans le tableau partagé"""
+    matrix, predicted = _WORKER['matrix'][1], _WORKER['predicted'][1]
+    backend, trees = _WORKER['config']
+    n_features = len(FEATURES)
+    for train_start, train_end, test_start, test_end in folds:
+        model = fit_backend(backend, matrix[train_start:train_end, :n_features],
+                            matrix[train_start:train_end, _TARGET], n_estimators=trees, random_state=0)
+        predicted[test_start:test_end] = model.predict(matrix[test_start:test_end, :n_features])
+    return len(folds)
+
+def _shared_copy(array):
+    segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)
+    view[...] = array
+    return segment, view, (segment.name, array.shape, array.dtype.str)
+
+def walk_forward(matrix, folds, backend=DEFAULT_BACKEND, trees=TREES, workers=None):
+    """Prévisions walk-forward pour toutes les lignes testées (NaN ailleurs)"""
+    workers = workers or os.cpu_count()
+    matrix_segment, _, matrix_spec = _shared_copy(matrix)
+    output_segment, predicted, output_spec = _shared_copy(np.full(len(matrix), np.nan))
+    tasks = [folds[i:i + FOLDS_PER_TASK] for i in range(0, len(folds), FOLDS_PER_TASK)]
+    try:
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(matrix_spec, output_spec, backend, trees)) as pool:
+                for _ in pool.map(_run_folds, tasks):
+                    pass
+        else:
+            _attach(matrix_spec, output_spec, backend, trees)
+            for task in tasks:
+                _run_folds(task)
+            _WORKER.clear()
+        return predicted.copy()
+    finally:
+        del predicted
+        for segment in (matrix_segment, output_segment):
+            segment.close()
+            segment.unlink()
+
+# --- Rapport ---
+def error_table(actual, predicted, groups, labels):
+    """MAE (kWh), MAPE (%) et nombre d'heures par groupe"""
+    groups = np.asarray(groups, dtype=np.int64)
+    abs_error = np.abs(actual - predicted)
+    count = np.bincount(groups, minlength=len(labels))
+    mae = np.bincount(groups, abs_error, minlength=len(labels))
+    ape = np.bincount(groups, abs_error / np.abs(actual), minlength=len(labels))
+    return {
+        str(label): {'mae': round(float(mae[i] / count[i]), 2), 'mape': round(float(ape[i] / count[i] * 100), 2),
+                     'hours': int(count[i])}
+        for i, label in enumerate(labels) if count[i]
+    }
+
+def persistence(matrix, station_index, timestamps):
+    """Prévision naïve de référence : même heure la veille (NaN si absente)"""
+    key = station_index.astype(np.int64) << 32 | timestamps.astype(np.int64)
+    previous = key - 24
+    j = np.minimum(np.searchsorted(key, previous), len(key) - 1)
+    return np.where(key[j] == previous, matrix[j, _TARGET], np.nan)
+
+def build_report(matrix, station_index, timestamps, predicted, stations):
+    tested = ~np.isnan(predicted) & (matrix[:, _TARGET] != 0)
+    actual, forecast = matrix[tested, _TARGET], predicted[tested]
+    hours = matrix[tested, FEATURES.index('hour')]
+    months = timestamps[tested].astype('datetime64[M]').astype(np.int64) % 12 + 1
+    overall = error_table(actual, forecast, np.zeros(len(actual)), ['all'])['all']
+    naive = persistence(matrix, station_index, timestamps)[tested]
+    has_naive = ~np.isnan(naive)
+    if has_naive.any():
+        naive_mae = float(np.abs(actual[has_naive] - naive[has_naive]).mean())
+        model_mae = float(np.abs(actual[has_naive] - forecast[has_naive]).mean())
+        overall['persistence_mae'] = round(naive_mae, 2)
+        overall['skill'] = round(1 - model_mae / naive_mae, 3)
+    return {
+        'period': [str(timestamps[tested].min()), str(timestamps[tested].max())] if tested.any() else None,
+        'overall': overall,
+        'by_hour': error_table(actual, forecast, hours, range(24)),
+        'by_season': error_table(actual, forecast, _MONTH_SEASON[months], list(SEASONS)),
+        'by_station': error_table(actual, forecast, station_index[tested], stations)
+    }
+
+def run_backtest(data=None, stations=None, start=None, end=None, train_days=TRAIN_DAYS, step=STEP_DAYS,
+                 backend=DEFAULT_BACKEND, trees=TREES, workers=None, report_path=REPORT_PATH):
+    """
+    Backtest walk-forward : jours prévus entre start et end (dates, défaut tout l'historique
+    disponible après la première fenêtre d'entraînement) -> rapport (écrit dans report_path)
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend inconnu : {backend} (valeurs : {', '.join(BACKENDS)})")
+    begin = time.perf_counter()
+    if data is None:
+        read_from = None
+        if start:
+            read_from = np.datetime64(start, 'D') - np.timedelta64(train_days, 'D')
+        data = open_store().read(stations=stations, start=read_from, end=end,
+                                 columns=FEATURES + ['energy', 'timestamp'])
+    matrix, station_index, timestamps = build_matrix(data)
+    days = matrix[:, _DAY].astype(np.int64)
+    first_day = int(np.datetime64(start, 'D').astype(np.int64)) if start else None
+    last_day = int(np.datetime64(end, 'D').astype(np.int64)) - 1 if end else None
+    folds = plan_folds(station_index, days, len(data['stations']), train_days, step, first_day, last_day)
+    if not folds:
+        raise ValueError(f"aucun fold : il faut au moins {train_days} jours d'historique avant la période testée")
+    predicted = walk_forward(matrix, folds, backend, trees, workers)
+    report = build_report(matrix, station_index, timestamps, predicted, data['stations'])
+    report['config'] = {
+        'backend': backend, 'trees': trees, 'train_days': train_days, 'step_days': step,
+        'stations': len(data['stations']), 'folds': len(folds), 'workers': workers or os.cpu_count(),
+        'duration_s': round(time.perf_counter() - begin, 1)
+    }
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+def generated_history(n_stations, n_days, seed=None):
+    """Historique simulé en mémoire (module 1), au format d'une lecture multi-stations du store"""
+    from datetime import datetime, timedelta
+    from module1_prediction import iter_generated_chunks, build_station_table
+    table = build_station_table(n_stations, seed)
+    start = datetime.now() - timedelta(days=n_days)
+    chunk = next(iter_generated_chunks(n_days, table, start, seed, chunk_days=n_days))
+    start_day = np.datetime64(start.strftime('%Y-%m-%d'), 'D')
+    chunk['timestamp'] = (start_day + chunk['day']).astype('datetime64[h]') + chunk['hour'].astype('timedelta64[h]')
+    chunk['station_index'] = chunk['station']
+    chunk['stations'] = table['id'].tolist()
+    return chunk
+
+def print_report(report):
+    config, overall = report['config'], report['overall']
+    print(f"\nBacktest walk-forward {report['period'][0]} -> {report['period'][1]} : {config['stations']} station(s), "
+          f"{config['folds']} folds ({config['backend']}, fenêtre {config['train_days']} j, "
+          f"pas {config['step_days']} j) en {config['duration_s']} s sur {config['workers']} processus")
+    line = f"MAE {overall['mae']} kWh, MAPE {overall['mape']} %"
+    if 'persistence_mae' in overall:
+        line += f" (persistance J-1 : MAE {overall['persistence_mae']} kWh, skill {overall['skill']:+.1%})"
+    print(line)
+    print(f"\n{'Heure':<8}{'MAE (kWh)':>11}{'MAPE (%)':>10}")
+    for hour, r in report['by_hour'].items():
+        print(f"{hour + 'h':<8}{r['mae']:>11}{r['mape']:>10}")
+    print(f"\n{'Saison':<15}{'MAE (kWh)':>11}{'MAPE (%)':>10}{'Heures':>9}")
+    for season, r in report['by_season'].items():
+        print(f"{season:<15}{r['mae']:>11}{r['mape']:>10}{r['hours']:>9}")
+    worst = sorted(report['by_station'].items(), key=lambda kv: -kv[1]['mape'])[:5]
+    if len(report['by_station']) > 1:
+        print("\nStations les moins bien prévues : " + ", ".join(f"{s} ({r['mape']} %)" for s, r in worst))
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Backtest walk-forward du modèle de prévision")
+    parser.add_argument('--stations', nargs='+', help="Stations du store (défaut : toutes)")
+    parser.add_argument('--start', help="Premier jour prévu (AAAA-MM-JJ)")
+    parser.add_argument('--end', help="Fin de la période prévue (exclue)")
+    parser.add_argument('--train-days', type=int, default=TRAIN_DAYS, help="Fenêtre d'entraînement (jours)")
+    parser.add_argument('--step', type=int, default=STEP_DAYS, help="Ré-entraînement tous les N jours")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND)
+    parser.add_argument('--trees', type=int, default=TREES, help="Arbres par modèle (forest / flat)")
+    parser.add_argument('--workers', type=int, help="Processus (défaut : nombre de cœurs)")
+    parser.add_argument('--generate', type=int, metavar='STATIONS', help="Historique simulé en mémoire (N stations)")
+    parser.add_argument('--days', type=int, default=365, help="Jours d'historique simulé (avec --generate)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', default=REPORT_PATH, help="Rapport JSON")
+    args = parser.parse_args()
+
+    data = generated_history(args.generate, args.days, args.seed) if args.generate else None
+    report = run_backtest(data, args.stations, args.start, args.end, args.train_days, args.step,
+                          args.backend, args.trees, args.workers, args.output)
+    print_report(report)
+    print(f"\n✓ Rapport enregistré dans {args.output}")
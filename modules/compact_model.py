@@ -0,0 +1,156 @@
+"""
+Modèle de Prévision Compact (forêt aplatie en tableaux NumPy)
+Les arbres d'une RandomForestRegressor sont exportés en tableaux de nœuds
+(feature, seuil, fils gauche/droit, valeur), enregistrés en .npy dans un dossier
+et rechargés en memory-map : chargement quasi instantané, sans pickle ni import de scikit-learn
+La prédiction fait descendre toutes les lignes dans tous les arbres à la fois, un niveau par
+itération ; les lignes arrivées sur une feuille sont retirées du lot actif
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+
+FORMAT = 'flat'
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+PREDICT_CHUNK = 2048    # lignes par passe (mémoire de travail : arbres × lignes indices de nœuds)
+
+def _float32_floor(threshold):
+    """
+    Seuils float64 -> float32 arrondis vers le bas : pour x float32 (scikit-learn convertit
+    les entrées en float32), x <= t64 équivaut exactement à x <= t32, splits identiques
+    """
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+class FlatForest:
+    """
+    Forêt de régression à plat : les nœuds de tous les arbres sont concaténés, arbre par arbre
+    children[i] = (fils gauche, fils droit) ; une feuille pointe sur elle-même, ce qui suffit
+    à détecter la fin du parcours (nœud suivant = nœud courant)
+    """
+
+    artifact_format = FORMAT
+
+    def __init__(self, feature, threshold, children, value, roots, features, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.features = list(features)
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_forest(cls, forest, features):
+        """Exporter une RandomForestRegressor (ou tout ensemble d'arbres de régression scikit-learn)"""
+        parts = {k: [] for k in ARRAYS}
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left == -1
+            index = np.arange(tree.node_count) + offset
+            parts['feature'].append(np.where(leaf, 0, tree.feature).astype(np.int16))
+            parts['threshold'].append(_float32_floor(np.where(leaf, 0.0, tree.threshold)))
+            parts['children'].append(np.column_stack([np.where(leaf, index, tree.children_left + offset),
+                                                      np.where(leaf, index, tree.children_right + offset)]
+                                                     ).astype(np.int32))
+            parts['value'].append(tree.value[:, 0, 0].astype(np.float32))
+            parts['roots'].append(np.array([offset], dtype=np.int32))
+            offset += tree.node_count
+        max_depth = max(e.tree_.max_depth for e in forest.estimators_)
+        return cls(*(np.concatenate(parts[k]) for k in ARRAYS), features=features, max_depth=max_depth)
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, k).nbytes for k in ARRAYS)
+
+    # --- Prédiction ---
+    def predict(self, X):
+        """Moyenne des feuilles atteintes ; X : DataFrame (colonnes self.features) ou tableau N × F"""
+        if hasattr(X, 'columns'):
+            X = X[self.features]
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != len(self.features):
+            raise ValueError(f"{len(self.features)} features attendues ({', '.join(self.features)}), reçu {X.shape}")
+        out = np.empty(len(X))
+        for start in range(0, len(X), PREDICT_CHUNK):
+            out[start:start + PREDICT_CHUNK] = self._predict_chunk(X[start:start + PREDICT_CHUNK])
+        return out
+
+    def _predict_chunk(self, X):
+        n_rows, n_features = X.shape
+        flat = np.ascontiguousarray(X).ravel()
+        children = self.children.ravel()
+        # Lot actif (arbre-major) : nœud courant, début de la ligne dans flat, position du résultat
+        node = np.repeat(np.asarray(self.roots), n_rows)
+        row = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, len(self.roots))
+        position = np.arange(node.size, dtype=np.int32)
+        leaf = np.empty(node.size, dtype=np.int32)
+        while node.size:
+            go_right = flat[row + self.feature[node]] > self.threshold[node]
+            following = children[2 * node + go_right]
+            done = following == node
+            if done.any():
+                leaf[position[done]] = node[done]
+                active = ~done
+                node, row, position = following[active], row[active], position[active]
+            else:
+                node = following
+        return self.value[leaf].reshape(len(self.roots), n_rows).mean(axis=0, dtype=np.float64)
+
+    def score(self, X, y):
+        """Coefficient de détermination R2 (même définition que scikit-learn)"""
+        y = np.asarray(y, dtype=float)
+        residual = ((y - self.predict(X)) ** 2).sum()
+        return 1 - residual / ((y - y.mean()) ** 2).sum()
+
+    # --- Mise à jour incrémentale (équivalent du warm start de la RandomForest) ---
+    def extend(self, other):
+        """Nouvelle forêt : arbres de self puis ceux de other (indices de nœuds décalés)"""
+        if other.features != self.features:
+            raise ValueError(f"features différentes : {self.features} / {other.features}")
+        offset = len(self.feature)
+        arrays = {k: np.concatenate([getattr(self, k), getattr(other, k)]) for k in ('feature', 'threshold', 'value')}
+        for k in ('children', 'roots'):
+            arrays[k] = np.concatenate([getattr(self, k), getattr(other, k) + offset]).astype(np.int32)
+        return FlatForest(**arrays, features=self.features, max_depth=max(self.max_depth, other.max_depth))
+
+    def trim(self, max_trees):
+        """Nouvelle forêt limitée aux max_trees arbres les plus récents"""
+        if self.n_estimators <= max_trees:
+            return self
+        first = int(self.roots[-max_trees])
+        arrays = {k: np.array(getattr(self, k)[first:]) for k in ('feature', 'threshold', 'value')}
+        arrays['children'] = np.array(self.children[first:]) - first
+        arrays['roots'] = np.array(self.roots[-max_trees:]) - first
+        return FlatForest(**arrays, features=self.features, max_depth=self.max_depth)
+
+    # --- Format disque : un .npy par tableau + meta.json ---
+    def save(self, path):
+        tmp = path + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for k in ARRAYS:
+            np.save(os.path.join(tmp, f'{k}.npy'), np.asarray(getattr(self, k)))
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'format': FORMAT, 'features': self.features, 'max_depth': self.max_depth,
+                       'n_estimators': self.n_estimators, 'n_nodes': len(self.feature)}, f, indent=2)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Recharger une forêt ; mmap=True : tableaux en memory-map (pages lues à la demande)"""
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        arrays = {k: np.load(os.path.join(path, f'{k}.npy'), mmap_mode=mode) for k in ARRAYS}
+        return cls(**arrays, features=meta['features'], max_depth=meta['max_depth'])
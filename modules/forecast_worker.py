@@ -0,0 +1,414 @@
+"""
+Worker de Prévision et d'Optimisation (processus longue durée)
+Garde en mémoire le modèle de prévision et l'Isolation Forest du registre (rechargés quand
+une nouvelle version est enregistrée) et répond aux simulations "what-if" envoyées par
+l'API (/api/forecast) ou le client en ligne de commande
+Les demandes simultanées sont regroupées en micro-lots : un seul model.predict pour tout
+le lot, un seul optimize_fleet par (horizon, mode), un seul score_samples pour les scorings
+Transport : multiprocessing.connection (TCP local, clé d'authentification partagée : variable
+ONEA_WORKER_KEY, sinon clé aléatoire créée au premier lancement dans data/worker.key, lisible
+par son seul propriétaire)
+"""
+
+import os
+import queue
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client, deliver_challenge, answer_challenge
+import numpy as np
+from model_registry import ModelRegistry, REGISTRY_DIR
+from telemetry_store import DEFAULT_STATION
+from metrics import REGISTRY, log_event
+
+WORKER_ADDRESS = (os.environ.get('ONEA_WORKER_HOST', '127.0.0.1'), int(os.environ.get('ONEA_WORKER_PORT', 6010)))
+WORKER_KEY_FILE = 'data/worker.key'
+MAX_BATCH = 64          # demandes regroupées au plus par lot
+MAX_WAIT = 0.005        # attente maximale (s) après la première demande d'un lot
+MAX_STATIONS = 1000     # stations par demande de prévision
+REQUEST_TIMEOUT = 30    # délai de réponse côté client (s)
+LISTEN_BACKLOG = 128    # connexions en attente d'acceptation (défaut de Listener : 1)
+WORKER_METRICS = 'data/worker_metrics.json'
+METRICS_INTERVAL = 10   # écriture de l'instantané des métriques au plus toutes les 10 s
+
+BATCH_SIZE = REGISTRY.histogram('onea_worker_batch_size', "Demandes regroupées par micro-lot",
+                                ('kind',), (1, 2, 4, 8, 16, 32, 64))
+BATCH_SECONDS = REGISTRY.histogram('onea_worker_batch_seconds', "Durée de traitement d'un micro-lot", ('kind',))
+WORKER_REQUESTS = REGISTRY.counter('onea_worker_requests_total', "Demandes traitées par le worker",
+                                   ('kind', 'result'))
+
+def worker_authkey(path=WORKER_KEY_FILE):
+    """
+    Clé partagée entre l'API et le worker : ONEA_WORKER_KEY, sinon le fichier de clé (créé en
+    mode 0600 s'il n'existe pas) ; sous POSIX, un fichier lisible par d'autres utilisateurs est
+    refusé. Sous Windows, st_mode ne reflète pas les droits : la protection du fichier repose
+    sur les ACL NTFS du dossier data/
+    """
+    if os.environ.get('ONEA_WORKER_KEY'):
+        return os.environ['ONEA_WORKER_KEY'].encode()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        if os.name == 'posix' and os.stat(path).st_mode & 0o077:
+            raise PermissionError(f"{path} est accessible à d'autres utilisateurs (chmod 600 {path})") from None
+        with open(path, 'r') as f:
+            key = f.read().strip()
+        if not key:
+            raise ValueError(f"clé du worker vide : {path}")
+        return key.encode()
+    key = secrets.token_hex(32)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key + '\n')
+    return key.encode()
+
+def _hourly(value, horizon, name):
+    """Valeur scalaire ou liste horaire (longueur = horizon) -> tableau (horizon,)"""
+    values = np.asarray(value, dtype=float)
+    if values.ndim == 0:
+        return np.full(horizon, float(values))
+    if values.shape != (horizon,):
+        raise ValueError(f"{name} : {len(values)} valeurs pour un horizon de {horizon}h")
+    return values
+
+def parse_forecast_request(request):
+    """
+    Valider une demande de simulation et la normaliser :
+    stations, start (date ou date+heure, défaut demain 00h), horizon_hours (1 à 168),
+    temp_ext / humidity (valeur ou liste horaire, remplacent la météo simulée), temp_offset (°C),
+    outage_hours (heures de coupure SONABEL, défaut [19]), solar_factor, initial_level (%),
+    optimize (défaut True), mode ('heuristic' ou 'dp')
+    """
+    from module1_prediction import MAX_HORIZON_HOURS, next_day
+    from module2_optimization import FLEET_OPTIMIZERS
+    unknown = set(request) - {'stations', 'start', 'horizon_hours', 'temp_ext', 'humidity', 'temp_offset',
+                              'outage_hours', 'solar_factor', 'initial_level', 'optimize', 'mode'}
+    if unknown:
+        raise ValueError(f"paramètre inconnu : {', '.join(sorted(unknown))}")
+    stations = request.get('stations') or [DEFAULT_STATION]
+    if isinstance(stations, str):
+        stations = stations.split(',')
+    if not 1 <= len(stations) <= MAX_STATIONS:
+        raise ValueError(f"1 à {MAX_STATIONS} stations par demande")
+    horizon = int(request.get('horizon_hours', 24))
+    if not 1 <= horizon <= MAX_HORIZON_HOURS:
+        raise ValueError(f"horizon_hours : 1 à {MAX_HORIZON_HOURS}")
+    start = next_day()
+    if request.get('start'):
+        start = np.datetime64(request['start'], 'h').astype(datetime)
+    outage_hours = request.get('outage_hours', [19])
+    if any(not 0 <= int(h) <= 23 for h in outage_hours):
+        raise ValueError("outage_hours : heures de 0 à 23")
+    mode = request.get('mode', 'heuristic')
+    if mode not in FLEET_OPTIMIZERS:
+        raise ValueError(f"mode inconnu : {mode} (valeurs : {', '.join(FLEET_OPTIMIZERS)})")
+    initial_level = float(request.get('initial_level', 65.0))
+    if not 0 <= initial_level <= 100:
+        raise ValueError("initial_level : 0 à 100 %")
+    solar_factor = float(request.get('solar_factor', 1.0))
+    if solar_factor < 0:
+        raise ValueError("solar_factor : valeur positive attendue")
+    weather = {k: _hourly(request[k], horizon, k) for k in ('temp_ext', 'humidity') if request.get(k) is not None}
+    return {
+        'stations': [str(s) for s in stations], 'start': start, 'horizon_hours': horizon, 'weather': weather,
+        'temp_offset': float(request.get('temp_offset', 0.0)), 'outage_hours': [int(h) for h in outage_hours],
+        'solar_factor': solar_factor, 'initial_level': initial_level,
+        'optimize': bool(request.get('optimize', True)), 'mode': mode
+    }
+
+def scenario_inputs(params):
+    """Entrées de prévision (stations × heures) avec les hypothèses de la simulation appliquées"""
+    from module1_prediction import build_forecast_features
+    inputs = build_forecast_features(params['stations'], params['start'], params['horizon_hours'], params['weather'])
+    inputs['temp_ext'] = inputs['temp_ext'] + params['temp_offset']
+    inputs['solar_capacity'] = inputs['solar_capacity'] * params['solar_factor']
+    inputs['grid_status'] = np.where(np.isin(inputs['hour'], params['outage_hours']), 0, 1)
+    return inputs
+
+class ForecastWorker:
+    """Modèles chargés une fois, file de demandes, micro-lots traités par un seul thread"""
+
+    def __init__(self, registry_root=REGISTRY_DIR, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.registry_root = registry_root
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self._registry_version = None
+        self._models = {}
+        self._metrics_written = 0.0
+
+    # --- Modèles (rechargés uniquement quand registry.json change) ---
+    def models(self):
+        path = os.path.join(self.registry_root, 'registry.json')
+        version = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        if version != self._registry_version:
+            from module1_prediction import MODEL_NAME as ENERGY_MODEL
+            from anomaly_scoring import MODEL_NAME as ANOMALY_MODEL
+            registry = ModelRegistry(self.registry_root)
+            self._models = {}
+            for kind, name in (('forecast', ENERGY_MODEL), ('score', ANOMALY_MODEL)):
+                entry = registry.latest(name)
+                if entry is not None:
+                    self._models[kind] = (registry.load(name), entry['version'])
+            self._registry_version = version
+            log_event('worker', 'models_loaded', versions={k: v for k, (_, v) in self._models.items()})
+        return self._models
+
+    def _model(self, kind):
+        model = self.models().get(kind)
+        if model is None:
+            hint = 'module1_prediction.py' if kind == 'forecast' else 'module3_anomalies.py'
+            raise RuntimeError(f"aucun modèle '{kind}' dans le registre (exécutez d'abord {hint})")
+        return model
+
+    # --- Demandes ---
+    def submit(self, kind, payload):
+        """Ajouter une demande à la file -> Future (résultat ou exception)"""
+        if kind not in ('forecast', 'score'):
+            raise ValueError(f"type de demande inconnu : {kind}")
+        future = Future()
+        self.queue.put((kind, payload, future))
+        return future
+
+    def run_batches(self):
+        """Boucle du thread de traitement (s'arrête sur None dans la file)"""
+        from streaming_anomalies import _micro_batches
+        for batch in _micro_batches(self.queue, self.max_batch, self.max_wait):
+            self.process(batch)
+
+    def process(self, batch):
+        for kind, handler in (('forecast', self._forecast_batch), ('score', self._score_batch)):
+            items = [(payload, future) for k, payload, future in batch if k == kind]
+            if not items:
+                continue
+            BATCH_SIZE.observe(len(items), kind=kind)
+            with BATCH_SECONDS.time(kind=kind):
+                try:
+                    handler(items)
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+            for _, future in items:
+                WORKER_REQUESTS.inc(kind=kind, result='ok' if future.exception() is None else 'error')
+        if time.monotonic() - self._metrics_written > METRICS_INTERVAL:
+            REGISTRY.write_snapshot(WORKER_METRICS)
+            self._metrics_written = time.monotonic()
+
+    def _forecast_batch(self, items):
+        """Une prédiction pour tout le lot, puis une optimisation de flotte par (horizon, mode)"""
+        from module1_prediction import predict_energy
+        from module2_optimization import optimize_fleet
+        model, version = self._model('forecast')
+        valid = []
+        for payload, future in items:
+            try:
+                params = parse_forecast_request(payload)
+                valid.append((params, scenario_inputs(params), future))
+            except (ValueError, TypeError) as e:
+                future.set_exception(ValueError(str(e)))
+        if not valid:
+            return
+        energies = predict_energy(model, [inputs for _, inputs, _ in valid])
+
+        plans = [None] * len(valid)
+        groups = {}
+        for i, (params, _, _) in enumerate(valid):
+            if params['optimize']:
+                groups.setdefault((params['horizon_hours'], params['mode']), []).append(i)
+        for (_, mode), members in groups.items():
+            stack = lambda key: np.concatenate([np.asarray(valid[i][1][key], dtype=float) for i in members])
+            demand = np.concatenate([energies[i] for i in members])
+            levels = np.concatenate([np.full(len(valid[i][0]['stations']), valid[i][0]['initial_level'])
+                                     for i in members])
+            fleet = optimize_fleet(demand, stack('solar_capacity'), stack('grid_status'), flow=stack('flow'),
+                                   initial_level=levels, mode=mode)
+            offset = 0
+            for i in members:
+                n = len(valid[i][0]['stations'])
+                plans[i] = {k: v[offset:offset + n] for k, v in fleet.items()}
+                offset += n
+
+        for (params, inputs, future), energy, plan in zip(valid, energies, plans):
+            future.set_result(self._forecast_result(params, inputs, energy, plan, version, len(valid)))
+
+    @staticmethod
+    def _forecast_result(params, inputs, energy, plan, version, batch_size):
+        timestamps = np.datetime_as_string(inputs['timestamp'][0], unit='h').tolist()
+        stations = []
+        for s, station_id in enumerate(params['stations']):
+            entry = {
+                'station_id': station_id,
+                'energy_predicted': np.round(energy[s], 2).tolist(),
+                'temp_ext': np.round(inputs['temp_ext'][s], 1).tolist(),
+                'solar_capacity': np.round(inputs['solar_capacity'][s], 1).tolist(),
+                'grid_status': np.asarray(inputs['grid_status'][s]).astype(int).tolist()
+            }
+            totals = {'energy_kwh': round(float(energy[s].sum()), 1)}
+            if plan is not None:
+                entry['schedule'] = {
+                    'pump_rate': plan['pump_rate'][s].astype(int).tolist(),
+                    'reservoir_level': np.round(plan['reservoir_level'][s], 1).tolist(),
+                    'cost_fcfa': np.round(plan['cost_fcfa'][s], 0).tolist()
+                }
+                totals.update({
+                    'energy_used_kwh': round(float(plan['energy_used'][s].sum()), 1),
+                    'cost_fcfa': round(float(plan['cost_fcfa'][s].sum()), 0),
+                    'solar_kwh': round(float(plan['mix_solar_kwh'][s].sum()), 1),
+                    'gasoil_liters': round(float(plan['gasoil_used_liters'][s].sum()), 1),
+                    'co2_kg': round(float(plan['co2_emissions_kg'][s].sum()), 1),
+                    'min_level': round(float(plan['reservoir_level'][s].min()), 1)
+                })
+            entry['totals'] = totals
+            stations.append(entry)
+        return {
+            'model_version': version, 'batch_size': batch_size, 'start': timestamps[0],
+            'horizon_hours': params['horizon_hours'], 'mode': params['mode'] if plan is not None else None,
+            'timestamps': timestamps, 'stations': stations
+        }
+
+    def _score_batch(self, items):
+        """Scores d'anomalie de toutes les mesures du lot en un seul score_samples"""
+        from anomaly_scoring import FEATURES
+        model, version = self._model('score')
+        valid = []
+        for payload, future in items:
+            try:
+                records = payload.get('records') if isinstance(payload, dict) else None
+                if not records:
+                    raise ValueError("'records' : liste de mesures attendue")
+                X = np.array([[float(r[f]) for f in FEATURES] for r in records])
+                valid.append((X, future))
+            except (KeyError, ValueError, TypeError) as e:
+                future.set_exception(ValueError(f"mesure invalide ({FEATURES} attendus) : {e}"))
+        if not valid:
+            return
+        scores = model.score_samples(np.concatenate([X for X, _ in valid]))
+        bounds = np.cumsum([len(X) for X, _ in valid])[:-1]
+        for part, (_, future) in zip(np.split(scores, bounds), valid):
+            future.set_result({
+                'model_version': version, 'batch_size': len(valid),
+                'score': np.round(part, 4).tolist(), 'is_anomaly': (part < model.offset_).tolist()
+            })
+
+    # --- Serveur ---
+    def serve(self, address=WORKER_ADDRESS, authkey=None):
+        """Accepter les connexions (un thread par client) ; les demandes rejoignent la file commune"""
+        authkey = authkey or worker_authkey()
+        self.models()
+        threading.Thread(target=self.run_batches, daemon=True).start()
+        # Authentification faite dans le thread du client : un client lent ne bloque pas accept()
+        with Listener(address, backlog=LISTEN_BACKLOG) as listener:
+            print(f"✓ Worker de prévision prêt sur {address[0]}:{address[1]} (modèles : "
+                  + ", ".join(f"{k} v{v}" for k, (_, v) in self._models.items()) + ")")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn, authkey), daemon=True).start()
+
+    def _serve_connection(self, conn, authkey):
+        with conn:
+            try:
+                deliver_challenge(conn, authkey)
+                answer_challenge(conn, authkey)
+            except Exception as e:   # mauvaise clé, client déconnecté
+                log_event('worker', 'connection_refused', error=f"{type(e).__name__}: {e}")
+                return
+            while True:
+                try:
+                    kind, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send({'ok': True, 'result': self.submit(kind, payload).result()})
+                except ValueError as e:
+                    conn.send({'ok': False, 'error': str(e), 'status': 400})
+                except Exception as e:
+                    log_event('worker', 'error', kind=kind, error=f"{type(e).__name__}: {e}")
+                    conn.send({'ok': False, 'error': str(e), 'status': 500})
+
+class WorkerUnavailable(Exception):
+    """Worker arrêté ou injoignable"""
+
+class WorkerError(Exception):
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+def request_worker(kind, payload, address=WORKER_ADDRESS, authkey=None, timeout=REQUEST_TIMEOUT):
+    """Envoyer une demande au worker et attendre la réponse (une connexion par demande)"""
+    try:
+        authkey = authkey or worker_authkey()
+    except (OSError, ValueError) as e:
+        raise WorkerError(f"clé du worker indisponible : {e}") from None
+    try:
+        conn = Client(address, authkey=authkey)
+    except AuthenticationError:
+        raise WorkerError("clé refusée par le worker (ONEA_WORKER_KEY ou data/worker.key différents)") from None
+    except OSError as e:
+        raise WorkerUnavailable(f"worker injoignable sur {address[0]}:{address[1]} ({e})") from None
+    with conn:
+        conn.send((kind, payload))
+        if not conn.poll(timeout):
+            raise WorkerError(f"pas de réponse du worker en {timeout} s", status=504)
+        reply = conn.recv()
+    if not reply['ok']:
+        raise WorkerError(reply['error'], reply.get('status', 500))
+    return reply['result']
+
+def print_forecast(result):
+    print(f"Simulation du {result['start']} sur {result['horizon_hours']}h "
+          f"(modèle v{result['model_version']}, lot de {result['batch_size']} demande(s))")
+    print(f"{'Station':<10}{'Énergie (kWh)':>15}{'Coût (FCFA)':>14}{'Solaire (kWh)':>15}{'Gasoil (L)':>12}"
+          f"{'CO2 (kg)':>10}{'Niv. min':>10}")
+    for s in result['stations']:
+        t = s['totals']
+        print(f"{s['station_id']:<10}{t['energy_kwh']:>15}{t.get('cost_fcfa', '-'):>14}{t.get('solar_kwh', '-'):>15}"
+              f"{t.get('gasoil_liters', '-'):>12}{t.get('co2_kg', '-'):>10}{t.get('min_level', '-'):>10}")
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Worker de prévision / optimisation ONEA (serveur et client)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('serve', help="Démarrer le worker (garde les modèles en mémoire)")
+    fc = sub.add_parser('forecast', help="Envoyer une simulation au worker")
+    fc.add_argument('--stations', nargs='+', default=[DEFAULT_STATION])
+    fc.add_argument('--start', help="Début (AAAA-MM-JJ ou AAAA-MM-JJTHH), défaut demain 00h")
+    fc.add_argument('--horizon', type=int, default=24, help="Horizon en heures (max 168)")
+    fc.add_argument('--temp-offset', type=float, default=0.0, help="Écart de température simulé (°C)")
+    fc.add_argument('--outage-hours', type=int, nargs='*', default=[19], help="Heures de coupure SONABEL")
+    fc.add_argument('--solar-factor', type=float, default=1.0, help="Facteur sur le potentiel solaire")
+    fc.add_argument('--level', type=float, default=65.0, help="Niveau initial du réservoir (%%)")
+    fc.add_argument('--mode', choices=['heuristic', 'dp'], default='heuristic')
+    fc.add_argument('--no-optimize', action='store_true', help="Prévision seule, sans planning")
+    fc.add_argument('--json', action='store_true', help="Afficher la réponse JSON complète")
+    sc = sub.add_parser('score', help="Scorer des mesures (fichier JSON : liste d'enregistrements)")
+    sc.add_argument('input')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        ForecastWorker().serve()
+    try:
+        if args.command == 'forecast':
+            result = request_worker('forecast', {
+                'stations': args.stations, 'start': args.start, 'horizon_hours': args.horizon,
+                'temp_offset': args.temp_offset, 'outage_hours': args.outage_hours,
+                'solar_factor': args.solar_factor, 'initial_level': args.level,
+                'optimize': not args.no_optimize, 'mode': args.mode
+            })
+            print(json.dumps(result, indent=2) if args.json else '', end='\n' if args.json else '')
+            if not args.json:
+                print_forecast(result)
+        else:
+            with open(args.input, 'r') as f:
+                result = request_worker('score', {'records': json.load(f)})
+            flagged = sum(result['is_anomaly'])
+            print(f"✓ {len(result['score'])} mesures scorées, {flagged} anomalies (modèle v{result['model_version']})")
+    except (WorkerUnavailable, WorkerError) as e:
+        print(f"✗ {e}")
+        if isinstance(e, WorkerUnavailable):
+            print("  Démarrez le worker : python modules/forecast_worker.py serve")
+        raise SystemExit(1)
@@ -0,0 +1,210 @@
+"""
+Instrumentation ONEA : compteurs, jauges et histogrammes au format texte Prometheus
+Un registre par processus (REGISTRY) alimenté par les modules (entraînement et prédiction
+des modèles, caches, artefacts lus/écrits) ; le pipeline publie un instantané de son
+registre (data/pipeline_metrics.json) que l'API fusionne dans /metrics
+Journaux structurés : un événement JSON par ligne (data/logs/*.ndjson)
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Bornes des histogrammes (secondes) : requêtes HTTP et appels de modèles / étapes du pipeline
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+LOG_DIR = 'data/logs'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + '}'
+
+class Metric:
+    """Famille de séries (une par combinaison de labels)"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} : labels attendus {self.labelnames}, reçus {tuple(labels)}")
+        try:
+            return tuple(str(labels[l]) for l in self.labelnames)
+        except KeyError:
+            raise ValueError(f"{self.name} : labels attendus {self.labelnames}, reçus {tuple(labels)}") from None
+
+    def samples(self):
+        """[(nom de la série, labels, valeur)]"""
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in sorted(self._values.items())]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)   # effectifs par intervalle, cumulés à l'export
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', dict(labels, le=_format_value(bound)), cumulative))
+            samples.append((f'{self.name}_sum', labels, total))
+            samples.append((f'{self.name}_count', labels, cumulative))
+        return samples
+
+class Registry:
+    """Familles de métriques d'un processus ; counter()/gauge()/histogram() créent ou retrouvent une famille"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} est déjà enregistrée comme {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        """Instantané sérialisable en JSON : {famille: {'type', 'help', 'samples'}}"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: {'type': m.kind, 'help': m.documentation, 'samples': m.samples()} for m in metrics}
+
+    def write_snapshot(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+def render(*sources):
+    """
+    Format texte Prometheus (version 0.0.4) à partir d'instantanés (snapshot, labels ajoutés)
+    Les familles présentes dans plusieurs instantanés sont regroupées sous un seul en-tête
+    """
+    families = {}
+    for snapshot, extra in sources:
+        for name, family in snapshot.items():
+            merged = families.setdefault(name, {'type': family['type'], 'help': family['help'], 'samples': []})
+            merged['samples'].extend((s, dict(extra or {}, **labels), v) for s, labels, v in family['samples'])
+    lines = []
+    for name, family in sorted(families.items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        lines.extend(f"{s}{_format_labels(labels)} {_format_value(v)}" for s, labels, v in family['samples'])
+    return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# --- Familles communes aux modules ---
+MODEL_SECONDS = REGISTRY.histogram(
+    'onea_model_seconds', "Durée des entraînements (fit) et prédictions (predict) des modèles",
+    ('model', 'op'), DURATION_BUCKETS)
+MODEL_ROWS = REGISTRY.counter(
+    'onea_model_rows_total', "Lignes traitées par les modèles", ('model', 'op'))
+CACHE_REQUESTS = REGISTRY.counter(
+    'onea_cache_requests_total', "Accès aux caches (hit : résultat réutilisé, miss : recalcul ou relecture)",
+    ('cache', 'result'))
+ARTIFACT_READ_BYTES = REGISTRY.counter(
+    'onea_artifact_read_bytes_total', "Octets lus par artefact", ('artifact',))
+ARTIFACT_WRITTEN_BYTES = REGISTRY.counter(
+    'onea_artifact_written_bytes_total', "Octets écrits par artefact", ('artifact',))
+
+def cache_access(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+@contextmanager
+def model_call(model, op, rows):
+    """Chronométrer un fit/predict de modèle et compter les lignes traitées"""
+    with MODEL_SECONDS.time(model=model, op=op):
+        yield
+    MODEL_ROWS.inc(rows, model=model, op=op)
+
+def path_size(path):
+    """Taille d'un fichier, ou somme des fichiers d'un dossier (store télémétrie), 0 si absent"""
+    paths = [os.path.join(root, f) for root, _, files in os.walk(path) for f in files] if os.path.isdir(path) else [path]
+    total = 0
+    for p in paths:
+        try:
+            total += os.path.getsize(p)
+        except FileNotFoundError:
+            pass   # fichier temporaire remplacé pendant le parcours
+    return total
+
+def log_event(log, event, **fields):
+    """Ajouter un événement au journal structuré data/logs/<log>.ndjson"""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    record = {'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields}
+    with open(os.path.join(LOG_DIR, f'{log}.ndjson'), 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+    return record
@@ -0,0 +1,125 @@
+"""
+Registre des Modèles ML
+Chaque entraînement produit une version numérotée (models/<nom>/v0001.pkl, ou dossier
+v0001.flat pour une forêt compacte) décrite dans models/registry.json : fenêtre
+d'entraînement, score, empreinte des données
+Seules les KEEP_VERSIONS dernières versions sont conservées : les plus anciennes sont retirées
+de l'index et leurs artefacts supprimés (les numéros de version ne sont jamais réutilisés)
+Un modèle donné n'est chargé qu'une seule fois par processus (cache en mémoire)
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+from metrics import cache_access, path_size
+
+REGISTRY_DIR = 'models'
+KEEP_VERSIONS = int(os.environ.get('ONEA_MODEL_KEEP', 5))   # versions conservées par modèle
+
+# Cache des modèles déjà chargés dans ce processus : (racine, nom, version) -> modèle
+_LOADED = {}
+
+def data_fingerprint(*arrays):
+    """Empreinte SHA-1 du contenu binaire des tableaux (détecte toute modification des données)"""
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str(a.dtype).encode())
+        h.update(str(a.shape).encode())
+        h.update(a.tobytes())
+    return h.hexdigest()
+
+class ModelRegistry:
+    """Index des versions (registry.json) + artefacts (joblib ou forêt compacte), un dossier par modèle"""
+
+    def __init__(self, root=REGISTRY_DIR, keep=KEEP_VERSIONS):
+        self.root = root
+        self.keep = max(1, keep)
+        self.index_path = os.path.join(root, 'registry.json')
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.index = json.load(f)
+
+    def _save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def versions(self, name):
+        return self.index.get(name, {}).get('versions', [])
+
+    def latest(self, name):
+        """Métadonnées de la dernière version (ou None)"""
+        versions = self.versions(name)
+        return versions[-1] if versions else None
+
+    def register(self, name, model, **metadata):
+        """Enregistrer une nouvelle version du modèle avec ses métadonnées (puis retirer les plus anciennes)"""
+        latest = self.latest(name)
+        version = latest['version'] + 1 if latest else 1
+        artifact_format = getattr(model, 'artifact_format', 'joblib')
+        suffix = 'pkl' if artifact_format == 'joblib' else artifact_format
+        path = os.path.join(self.root, name, f'v{version:04d}.{suffix}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if artifact_format == 'joblib':
+            import joblib   # import à la demande, comme pour les chargements
+            joblib.dump(model, path)
+        else:
+            model.save(path)
+        entry = {
+            'version': version,
+            'path': path,
+            'format': artifact_format,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'size_bytes': path_size(path),
+            **metadata
+        }
+        versions = self.index.setdefault(name, {'versions': []})['versions']
+        versions.append(entry)
+        pruned = versions[:-self.keep]
+        del versions[:-self.keep]
+        self._save_index()
+        # Artefacts supprimés après l'index : une version listée a toujours son fichier
+        for old in pruned:
+            _LOADED.pop((self.root, name, old['version']), None)
+            if os.path.isdir(old['path']):
+                shutil.rmtree(old['path'], ignore_errors=True)
+            elif os.path.exists(old['path']):
+                os.remove(old['path'])
+        _LOADED[(self.root, name, version)] = model
+        return entry
+
+    def load(self, name, version=None, cached=True):
+        """
+        Charger un modèle (dernière version par défaut)
+        cached=False renvoie une copie fraîche lue sur disque (à utiliser avant de la modifier)
+        """
+        if version is None:
+            entry = self.latest(name)
+        else:
+            entry = next((e for e in self.versions(name) if e['version'] == version), None)
+        if entry is None:
+            return None
+        key = (self.root, name, entry['version'])
+        if not cached:
+            return _read_artifact(entry)
+        cache_access('model_registry', key in _LOADED)
+        if key not in _LOADED:
+            _LOADED[key] = _read_artifact(entry)
+        return _LOADED[key]
+
+def _read_artifact(entry):
+    """Lire l'artefact d'une version selon son format (les versions antérieures sont en joblib)"""
+    if entry.get('format', 'joblib') == 'joblib':
+        import joblib
+        return joblib.load(entry['path'])
+    from compact_model import FlatForest, FORMAT
+    if entry['format'] != FORMAT:
+        raise ValueError(f"format de modèle inconnu : {entry['format']}")
+    return FlatForest.load(entry['path'])
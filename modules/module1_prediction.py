@@ -1,162 +1,442 @@
 import numpy as np
-import pandas as pd
 import json
 from datetime import datetime, timedelta
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import train_test_split
-import joblib
 import os
+from telemetry_store import TelemetryStore, open_store, DEFAULT_STATION
+from model_registry import ModelRegistry, data_fingerprint
+from metrics import model_call
+from weather_features import DEFAULT_SITE, clear_sky_potential, station_features, save_sites, solar_potential
+# pandas et scikit-learn sont importés à la demande (entraînement, prévision) : les commandes
+# qui ne touchent pas au modèle démarrent sans payer leur import
 
-# Créer les dossiers si ils n'existent pas
-os.makedirs('data', exist_ok=True)
-os.makedirs('models', exist_ok=True)
+# Table des paramètres par station (la station de référence reproduit le comportement historique)
+# base_flow : débit de base (m³/h), energy_ratio : kWh par m³, solar_scale : taille relative du parc solaire,
+# outage_scale : fréquence relative des coupures SONABEL, temp_offset : écart climatique (°C),
+# latitude / longitude : position du site (potentiel solaire en ciel clair)
+REFERENCE_STATION = {
+    'id': 'ST_01', 'base_flow': 150.0, 'energy_ratio': 0.8,
+    'solar_scale': 1.0, 'outage_scale': 1.0, 'temp_offset': 0.0,
+    'latitude': DEFAULT_SITE['latitude'], 'longitude': DEFAULT_SITE['longitude']
+}
 
-def generate_data():
+GENERATED_COLUMNS = [
+    'station', 'day', 'hour', 'day_of_week', 'temp_ext', 'humidity',
+    'solar_capacity', 'grid_status', 'flow', 'energy', 'level'
+]
+
+# Profils horaires (index = heure) utilisés par le générateur vectorisé
+_HOURS = np.arange(24)
+_TEMP_LOW = np.select([_HOURS <= 6, _HOURS <= 11, _HOURS <= 16], [-12, -5, 0], -7).astype(float)
+_TEMP_HIGH = np.select([_HOURS <= 6, _HOURS <= 11, _HOURS <= 16], [-8, -2, 3], -3).astype(float)
+_PEAK_HOURS = (_HOURS >= 18) & (_HOURS <= 22)
+_FLOW_MEAN = np.select([(_HOURS >= 6) & (_HOURS <= 8), (_HOURS >= 18) & (_HOURS <= 21)], [50, 70], 0).astype(float)
+_FLOW_STD = np.select([(_HOURS >= 6) & (_HOURS <= 8), (_HOURS >= 18) & (_HOURS <= 21)], [10, 15], 20).astype(float)
+_LEVEL_MEAN = np.select([_HOURS < 6, _HOURS <= 12, _HOURS <= 18], [60, 75, 65], 55).astype(float)
+
+def build_station_table(n_stations=1, seed=None):
+    """
+    Construire la table des paramètres pour n stations (dict de tableaux NumPy)
+    La première station est la station de référence, les autres sont tirées autour d'elle
+    """
+    rng = np.random.default_rng(seed)
+    table = {key: np.full(n_stations, value, dtype=float)
+             for key, value in REFERENCE_STATION.items() if key != 'id'}
+    table['id'] = np.array([f'ST_{i + 1:02d}' for i in range(n_stations)])
+    if n_stations > 1:
+        others = slice(1, None)
+        table['base_flow'][others] = rng.uniform(80, 400, n_stations - 1)
+        table['energy_ratio'][others] = rng.uniform(0.6, 1.0, n_stations - 1)
+        table['solar_scale'][others] = rng.choice([0.0, 0.5, 1.0, 2.0], n_stations - 1)
+        table['outage_scale'][others] = rng.uniform(0.5, 2.0, n_stations - 1)
+        table['temp_offset'][others] = rng.normal(0, 1.5, n_stations - 1)
+        table['latitude'][others] = rng.uniform(10.0, 14.5, n_stations - 1)    # Burkina Faso
+        table['longitude'][others] = rng.uniform(-4.5, 1.5, n_stations - 1)
+    return table
+
+def station_sites(stations):
+    """Table des stations -> sites pour la couche météo/solaire (data/stations.json)"""
+    return {str(s): {'latitude': round(float(lat), 4), 'longitude': round(float(lon), 4),
+                     'solar_kwp': float(DEFAULT_SITE['solar_kwp'] * scale)}
+            for s, lat, lon, scale in zip(stations['id'], stations['latitude'], stations['longitude'],
+                                          stations['solar_scale'])}
+
+def iter_generated_chunks(n_days=30, stations=None, start_date=None, seed=None, chunk_days=30):
+    """
+    Générer les données par blocs de jours : chaque bloc est un dict de tableaux
+    à plat (ordre station × jour × heure), calculé d'un seul coup sans boucle par enregistrement
+    """
+    stations = stations if stations is not None else build_station_table(1)
+    start_date = start_date or datetime.now() - timedelta(days=n_days)
+    start_day = np.datetime64(start_date.strftime('%Y-%m-%d'), 'D')
+    rng = np.random.default_rng(seed)
+    n_stations = len(stations['id'])
+    col = lambda key: stations[key][:, None, None]
+
+    for first in range(0, n_days, chunk_days):
+        n = min(chunk_days, n_days - first)
+        shape = (n_stations, n, 24)
+        days = start_day + np.arange(first, first + n)
+        months = days.astype('datetime64[M]').astype(int) % 12 + 1
+        rainy = np.isin(months, [6, 7, 8, 9])
+        hot = np.isin(months, [3, 4, 5])
+
+        # Température de base par station et par jour, puis profil horaire
+        temp_mean = np.where(hot, 38, np.where(rainy, 30, 33))
+        temp_std = np.where(hot, 3, 2)
+        temp_day_base = rng.normal(temp_mean, temp_std, (n_stations, n)) + stations['temp_offset'][:, None]
+        temp_ext = temp_day_base[:, :, None] + rng.uniform(_TEMP_LOW, _TEMP_HIGH, shape)
+        temp_ext = np.clip(temp_ext, 20, 45)
+        humidity = np.where(rainy[None, :, None], rng.uniform(60, 85, shape), rng.uniform(15, 40, shape))
+
+        # Potentiel Solaire (kWh disponibles) : ciel clair au site de la station, réduit par l'humidité/nuages de 0 à 30%
+        timestamps = days.astype('datetime64[h]')[:, None] + _HOURS
+        clear = clear_sky_potential(col('latitude'), col('longitude'), DEFAULT_SITE['solar_kwp'], timestamps)
+        solar_capacity = (solar_potential(clear, humidity / 100) + rng.normal(0, 5, shape)) * col('solar_scale')
+        solar_capacity = np.where(clear > 0, np.maximum(0, np.round(solar_capacity, 2)), 0.0)
+
+        # Statut Réseau SONABEL (1 = OK, 0 = Coupure), plus fréquent en pointe ou forte chaleur
+        outage_scale = col('outage_scale')
+        outage = (temp_ext > 40) & (rng.random(shape) < 0.15 * outage_scale)
+        outage |= _PEAK_HOURS & (rng.random(shape) < 0.10 * outage_scale)
+        outage |= rng.random(shape) < 0.05 * outage_scale
+        grid_status = np.where(outage, 0, 1).astype(np.int8)
+
+        # Débit et Énergie
+        heat_factor = np.where(temp_ext > 35, (temp_ext - 35) * 3, 0)
+        flow = col('base_flow') + heat_factor + rng.normal(_FLOW_MEAN, _FLOW_STD, shape)
+        flow = np.maximum(50, flow)
+        energy = np.maximum(20, flow * col('energy_ratio') + rng.normal(0, 10, shape))
+
+        # Niveau réservoir
+        level = np.clip(_LEVEL_MEAN + rng.normal(0, 5, shape), 30, 95)
+
+        day_index = np.broadcast_to(np.arange(first, first + n)[None, :, None], shape)
+        yield {
+            'station': np.broadcast_to(np.arange(n_stations)[:, None, None], shape).ravel().astype(np.int32),
+            'day': day_index.ravel().astype(np.int32),
+            'hour': np.broadcast_to(_HOURS, shape).ravel().astype(np.int8),
+            'day_of_week': np.broadcast_to(((days.astype(int) + 3) % 7)[None, :, None], shape).ravel().astype(np.int8),
+            'temp_ext': np.round(temp_ext, 1).ravel(),
+            'humidity': np.round(humidity, 1).ravel(),
+            'solar_capacity': solar_capacity.ravel(),
+            'grid_status': grid_status.ravel(),
+            'flow': np.round(flow, 2).ravel(),
+            'energy': np.round(energy, 2).ravel(),
+            'level': np.round(level, 2).ravel()
+        }
+
+def write_generated_data(directory, n_days=365, n_stations=100, seed=None, chunk_days=30, start_date=None):
+    """
+    Écrire un jeu de données de charge en streaming : une colonne binaire brute par champ
+    (<colonne>.bin) + schema.json, sans jamais garder tout le jeu de données en mémoire
+    """
+    os.makedirs(directory, exist_ok=True)
+    stations = build_station_table(n_stations, seed)
+    start_date = start_date or datetime.now() - timedelta(days=n_days)
+    files = {c: open(os.path.join(directory, f'{c}.bin'), 'wb') for c in GENERATED_COLUMNS}
+    n_rows, dtypes = 0, {}
+    try:
+        for chunk in iter_generated_chunks(n_days, stations, start_date, seed, chunk_days):
+            for c, values in chunk.items():
+                values.tofile(files[c])
+                dtypes[c] = values.dtype.str
+            n_rows += len(chunk['hour'])
+    finally:
+        for f in files.values():
+            f.close()
+
+    schema = {
+        'rows': n_rows, 'order': 'station, day, hour', 'chunk_days': chunk_days,
+        'start_date': start_date.strftime('%Y-%m-%d'), 'dtypes': dtypes,
+        'stations': {k: v.tolist() for k, v in stations.items()}
+    }
+    with open(os.path.join(directory, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=2)
+    print(f"✓ {n_rows} enregistrements écrits dans {directory} ({n_stations} stations × {n_days} jours)")
+    return schema
+
+def write_generated_store(root, n_days=365, n_stations=100, seed=None, chunk_days=366, start_date=None):
+    """
+    Même générateur, écrit directement dans un TelemetryStore (une partition par station et par année)
+    """
+    stations = build_station_table(n_stations, seed)
+    start_date = start_date or datetime.now() - timedelta(days=n_days)
+    store = TelemetryStore(root)
+    # Sites (coordonnées, parc solaire) à côté du store : data/telemetry -> data/stations.json
+    save_sites(station_sites(stations), os.path.join(os.path.dirname(os.path.normpath(root)), 'stations.json'))
+    for chunk in iter_generated_chunks(n_days, stations, start_date, seed, chunk_days):
+        bounds = np.flatnonzero(np.diff(chunk['station'])) + 1
+        for rows in np.split(np.arange(len(chunk['station'])), bounds):
+            station_id = stations['id'][chunk['station'][rows[0]]]
+            part = {c: v[rows[0]:rows[-1] + 1] for c, v in chunk.items()}
+            store.append(str(station_id), _chunk_to_columns(part, start_date))
+    print(f"✓ {store.row_count()} enregistrements dans {root} ({n_stations} stations × {n_days} jours)")
+    return store
+
+def generate_data(n_days=30, seed=None, station=DEFAULT_STATION):
     """
     Générer 30 jours de données pour une station de pompage
     [MISE À JOUR V2] : Intégration Solaire et Coupures Réseau SONABEL
+    [MISE À JOUR V3] : Génération vectorisée, stockage colonnaire (data/telemetry)
+    [MISE À JOUR V4] : Seuls les jours postérieurs à la dernière mesure stockée sont générés :
+                       l'historique existant n'est jamais réécrit (un run le même jour n'ajoute rien)
     """
     print("Génération des données historiques (Météo, Solaire, Réseau)...")
     
-    data =[]
-    start_date = datetime.now() - timedelta(days=30)
-    
-    for day in range(30):
-        current_date = start_date + timedelta(days=day)
-        month = current_date.month
+    store = TelemetryStore()
+    today = np.datetime64(datetime.now().strftime('%Y-%m-%d'), 'D')
+    first_day = today - n_days
+    last = store.last_timestamp(station)
+    if last is not None:
+        first_day = max(first_day, last.astype('datetime64[D]') + 1)
+    n_new = int((today - first_day).astype(int))
+    if n_new > 0:
+        start_date = datetime.strptime(str(first_day), '%Y-%m-%d')
+        chunk = next(iter_generated_chunks(n_new, start_date=start_date, seed=seed, chunk_days=n_new))
+        store.append(station, _chunk_to_columns(chunk, start_date))
+    data = store.read(stations=[station])
         
-        # Température de base
-        if month in [3, 4, 5]: temp_day_base = np.random.normal(38, 3) # Saison chaude
-        elif month in[6, 7, 8, 9]: temp_day_base = np.random.normal(30, 2) # Pluies
-        else: temp_day_base = np.random.normal(33, 2)
-        
-        for hour in range(24):
-            # Température et Humidité
-            if 0 <= hour <= 6: temp_ext = temp_day_base - np.random.uniform(8, 12)
-            elif 7 <= hour <= 11: temp_ext = temp_day_base - np.random.uniform(2, 5)
-            elif 12 <= hour <= 16: temp_ext = temp_day_base + np.random.uniform(0, 3)
-            else: temp_ext = temp_day_base - np.random.uniform(3, 7)
-            
-            temp_ext = max(20, min(45, temp_ext))
-            humidity = np.random.uniform(60, 85) if month in [6, 7, 8, 9] else np.random.uniform(15, 40)
-            
-            # [NOUVEAU] Potentiel Solaire (kWh disponibles)
-            # Dépendant de l'heure et de la couverture nuageuse (estimée par humidité)
-            solar_capacity = 0
-            if 7 <= hour <= 17:
-                # Pic solaire entre 11h et 14h
-                base_solar = 80 if 11 <= hour <= 14 else 40
-                # L'humidité/nuages réduit le rendement de 0 à 30%
-                cloud_factor = 1 - (humidity / 100 * 0.3)
-                solar_capacity = base_solar * cloud_factor + np.random.normal(0, 5)
-            solar_capacity = max(0, round(solar_capacity, 2))
-            
-            # [NOUVEAU] Statut Réseau SONABEL (1 = OK, 0 = Coupure)
-            # Les coupures sont plus fréquentes en pointe (18h-22h) ou saison très chaude
-            grid_status = 1
-            if temp_ext > 40 and np.random.random() > 0.85: grid_status = 0
-            elif 18 <= hour <= 22 and np.random.random() > 0.90: grid_status = 0
-            elif np.random.random() > 0.95: grid_status = 0 # Coupure aléatoire
-
-            # Débit et Énergie
-            base_flow = 150
-            heat_factor = (temp_ext - 35) * 3 if temp_ext > 35 else 0
-            
-            if 6 <= hour <= 8: flow = base_flow + heat_factor + np.random.normal(50, 10)
-            elif 18 <= hour <= 21: flow = base_flow + heat_factor + np.random.normal(70, 15)
-            else: flow = base_flow + heat_factor + np.random.normal(0, 20)
-            
-            flow = max(50, flow)
-            energy = flow * 0.8 + np.random.normal(0, 10)
-            energy = max(20, energy)
-            
-            # Niveau réservoir
-            if hour < 6: level = 60 + np.random.normal(0, 5)
-            elif 6 <= hour <= 12: level = 75 + np.random.normal(0, 5)
-            elif 12 <= hour <= 18: level = 65 + np.random.normal(0, 5)
-            else: level = 55 + np.random.normal(0, 5)
-            
-            level = max(30, min(95, level))
-            
-            data.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'hour': hour,
-                'day_of_week': current_date.weekday(),
-                'temp_ext': round(temp_ext, 1),
-                'humidity': round(humidity, 1),
-                'solar_capacity': solar_capacity,
-                'grid_status': grid_status,
-                'flow': round(flow, 2),
-                'energy': round(energy, 2),
-                'level': round(level, 2)
-            })
-            
-    with open('data/historical_data.json', 'w') as f:
-        json.dump(data, f, indent=2)
-        
-    print(f"✓ {len(data)} enregistrements générés avec données Solaires et Réseau")
+    print(f"✓ {max(n_new, 0) * 24} nouveaux enregistrements générés avec données Solaires et Réseau "
+          f"({len(data['timestamp'])} au total)")
     return data
 
-def train_model(data):
+def _chunk_to_columns(chunk, start_date):
+    start_day = np.datetime64(start_date.strftime('%Y-%m-%d'), 'D')
+    columns = {c: chunk[c] for c in GENERATED_COLUMNS if c not in ('station', 'day')}
+    columns['timestamp'] = (start_day + chunk['day']).astype('datetime64[h]') + chunk['hour'].astype('timedelta64[h]')
+    return columns
+
+def load_history(station=DEFAULT_STATION, start=None, end=None):
+    """Charger l'historique d'une station depuis le store télémétrie (dict de colonnes)"""
+    return open_store().read(stations=[station], start=start, end=end)
+
+FEATURES = ['hour', 'day_of_week', 'temp_ext', 'humidity']
+MODEL_NAME = 'energy_model'
+RECENT_DAYS = 7          # fenêtre des nouveaux arbres lors d'un ré-entraînement incrémental
+TREES_PER_UPDATE = 20    # arbres ajoutés à chaque nouvelle journée
+MAX_ESTIMATORS = 200     # au-delà, les arbres les plus anciens sont retirés
+
+# Format du modèle de prévision (comparaison : benchmarks/compare_models.py)
+# forest : RandomForestRegressor picklée (joblib)
+# flat   : la même forêt exportée en tableaux NumPy (compact_model), chargée en memory-map sans scikit-learn
+# hgb    : HistGradientBoostingRegressor (modèle beaucoup plus petit, prédiction plus rapide)
+BACKENDS = ('forest', 'flat', 'hgb')
+DEFAULT_BACKEND = os.environ.get('ONEA_MODEL_BACKEND', 'forest')
+
+def fit_backend(backend, X, y, n_estimators=100, random_state=42):
+    """Entraîner un modèle de prévision au format demandé (n_estimators : arbres des forêts)"""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend inconnu : {backend} (valeurs : {', '.join(BACKENDS)})")
+    if backend == 'hgb':
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(random_state=random_state).fit(X, y)
+    from sklearn.ensemble import RandomForestRegressor
+    model = RandomForestRegressor(n_estimators=n_estimators, random_state=random_state).fit(X, y)
+    if backend == 'flat':
+        from compact_model import FlatForest
+        return FlatForest.from_forest(model, FEATURES)
+    return model
+
+def model_size(model):
+    """Nombre d'arbres (forêts) ou d'itérations de boosting"""
+    if hasattr(model, 'n_iter_'):
+        return int(model.n_iter_)
+    return model.n_estimators if hasattr(model, 'roots') else len(model.estimators_)
+
+def train_model(data, registry=None, force_full=False, backend=None):
+    """
+    Entraîner (ou mettre à jour) le modèle de prévision et l'enregistrer dans le registre
+    - Données inchangées (même empreinte, même backend) : pas de ré-entraînement, on recharge la version existante
+    - Nouvelles heures après la dernière fenêtre (forêts) : warm start, on ajoute des arbres entraînés
+      sur les RECENT_DAYS derniers jours seulement (coût constant, indépendant de l'historique)
+    - Sinon : entraînement complet
+    """
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    backend = backend or DEFAULT_BACKEND
     print("\nEntraînement du modèle de prévision IA...")
-    df = pd.DataFrame(data)
+    registry = registry or ModelRegistry()
+    df = pd.DataFrame({c: np.asarray(data[c]) for c in FEATURES + ['energy']})
+    timestamps = np.asarray(data['timestamp'], dtype='datetime64[h]') if 'timestamp' in data else None
     
     # Features : On inclut les données météo pour prédire l'énergie nécessaire
-    X = df[['hour', 'day_of_week', 'temp_ext', 'humidity']]
+    X = df[FEATURES]
     y = df['energy']
+    fingerprint = data_fingerprint(X.to_numpy(), y.to_numpy())
+    window = {}
+    if timestamps is not None and len(timestamps):
+        window = {'window_start': str(timestamps.min()), 'window_end': str(timestamps.max())}
     
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
+    latest = registry.latest(MODEL_NAME)
+    same_backend = latest is not None and latest.get('backend', 'forest') == backend
+    if same_backend and latest.get('fingerprint') == fingerprint and not force_full:
+        print(f"✓ Données inchangées : version v{latest['version']} réutilisée (R2 {latest['score']:.3f})")
+        return registry.load(MODEL_NAME)
     
-    print(f"✓ Score du modèle (R2): {model.score(X_test, y_test):.3f}")
-    joblib.dump(model, 'models/energy_model.pkl')
+    incremental = (
+        same_backend and backend != 'hgb' and not force_full and timestamps is not None
+        and 'window_end' in latest and timestamps.max() > np.datetime64(latest['window_end'], 'h')
+    )
+    if incremental:
+        model = registry.load(MODEL_NAME, cached=False)
+        new_rows = timestamps > np.datetime64(latest['window_end'], 'h')
+        recent = timestamps > timestamps.max() - np.timedelta64(RECENT_DAYS * 24, 'h')
+        # Score "jour suivant" : le modèle précédent n'a jamais vu les nouvelles heures
+        score = model.score(X[new_rows], y[new_rows])
+        with model_call(MODEL_NAME, 'fit', int(recent.sum())):
+            if backend == 'flat':
+                # Forêt compacte : nouveaux arbres exportés puis ajoutés aux tableaux existants
+                update = fit_backend('flat', X[recent], y[recent], TREES_PER_UPDATE, random_state=latest['version'])
+                model = model.extend(update).trim(MAX_ESTIMATORS)
+            else:
+                model.set_params(warm_start=True, n_estimators=len(model.estimators_) + TREES_PER_UPDATE)
+                model.fit(X[recent], y[recent])
+                if len(model.estimators_) > MAX_ESTIMATORS:
+                    model.estimators_ = model.estimators_[-MAX_ESTIMATORS:]
+                    model.set_params(n_estimators=MAX_ESTIMATORS)
+        mode, rows = 'incremental', int(recent.sum())
+    else:
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        with model_call(MODEL_NAME, 'fit', len(X_train)):
+            model = fit_backend(backend, X_train, y_train)
+        score = model.score(X_test, y_test)
+        mode, rows = 'full', len(X_train)
+    
+    entry = registry.register(
+        MODEL_NAME, model, mode=mode, backend=backend, fingerprint=fingerprint, score=round(float(score), 4),
+        rows_trained=rows, n_estimators=model_size(model), features=FEATURES, **window
+    )
+    unit = 'itérations' if backend == 'hgb' else 'arbres'
+    print(f"✓ Score du modèle (R2): {score:.3f} [{backend}, {mode}, v{entry['version']}, {entry['n_estimators']} {unit}]")
     return model
 
-def make_predictions(model, data):
+MAX_HORIZON_HOURS = 7 * 24
+
+def build_forecast_features(stations, start_date, horizon_hours=24, weather=None):
+    """
+    Construire d'un coup les entrées de prévision pour N stations × H heures (tableaux N × H)
+    Météo et potentiel solaire : cache de features par (station, date) (weather_features)
+    weather : dict optionnel {'temp_ext': N × H, 'humidity': N × H} pour remplacer la météo prévue
+    """
+    if not 1 <= horizon_hours <= MAX_HORIZON_HOURS:
+        raise ValueError(f"Horizon de prévision invalide : {horizon_hours}h (max {MAX_HORIZON_HOURS}h)")
+    shape = (len(stations), horizon_hours)
+    start = np.datetime64(start_date.strftime('%Y-%m-%dT%H'), 'h')
+    timestamps = start + np.arange(horizon_hours)
+    hour = np.broadcast_to((timestamps - timestamps.astype('datetime64[D]')).astype(int), shape)
+    day_of_week = np.broadcast_to((timestamps.astype('datetime64[D]').astype(int) + 3) % 7, shape)
+    
+    features = station_features(stations, start, horizon_hours)
+    weather = weather or {}
+    temp_ext = np.broadcast_to(weather.get('temp_ext', features['temp_ext']), shape)
+    humidity = np.broadcast_to(weather.get('humidity', features['humidity']), shape)
+    solar_capacity = features['solar_capacity']
+    if 'humidity' in weather:
+        # Humidité imposée : la couverture nuageuse en est déduite, comme sans prévision de nébulosité
+        solar_capacity = solar_potential(features['clear_potential'], humidity / 100)
+    
+    # Simulation d'une coupure SONABEL probable à 19h (Pic de conso national)
+    grid_status = np.where(hour == 19, 0, 1)
+    
+    # Estimation du débit
+    peak = ((hour >= 6) & (hour <= 9)) | ((hour >= 18) & (hour <= 21))
+    flow = np.where(peak, 220.0, 150.0)
+    
+    return {
+        'timestamp': np.broadcast_to(timestamps, shape), 'hour': hour, 'day_of_week': day_of_week,
+        'temp_ext': temp_ext, 'humidity': humidity, 'solar_capacity': solar_capacity,
+        'grid_status': grid_status, 'flow': flow
+    }
+
+def predict_energy(model, batch):
+    """
+    Énergie prévue pour plusieurs jeux d'entrées (build_forecast_features) en un seul model.predict
+    Retourne une liste de tableaux, chacun à la forme des entrées correspondantes
+    """
+    import pandas as pd
+    X = pd.DataFrame({f: np.concatenate([np.ravel(inputs[f]) for inputs in batch]) for f in FEATURES})
+    with model_call(MODEL_NAME, 'predict', len(X)):
+        energy = model.predict(X)
+    bounds = np.cumsum([inputs['hour'].size for inputs in batch])[:-1]
+    return [e.reshape(inputs['hour'].shape) for e, inputs in zip(np.split(energy, bounds), batch)]
+
+def next_day():
+    """Début de la prévision par défaut : demain à 00h"""
+    return (datetime.now() + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+def forecast(model, stations=(DEFAULT_STATION,), start_date=None, horizon_hours=24,
+             weather=None, as_frame=True):
+    """
+    Prévoir l'énergie de N stations sur H heures (jusqu'à 7 jours) en un seul appel model.predict
+    Retourne un DataFrame (une ligne par station et par heure) ou un dict de tableaux N × H
+    """
+    stations = list(stations)
+    inputs = build_forecast_features(stations, start_date or next_day(), horizon_hours, weather)
+    shape = inputs['hour'].shape
+    energy = predict_energy(model, [inputs])[0]
+    
+    arrays = {
+        'timestamp': inputs['timestamp'],
+        'hour': inputs['hour'],
+        'temp_ext_predicted': np.round(inputs['temp_ext'], 1),
+        'solar_capacity_predicted': np.round(inputs['solar_capacity'], 1),
+        'grid_status_predicted': inputs['grid_status'],
+        'energy_predicted': np.round(energy, 2),
+        'flow_estimated': np.round(inputs['flow'], 1)
+    }
+    if not as_frame:
+        arrays['stations'] = stations
+        return arrays
+    
+    import pandas as pd
+    frame = pd.DataFrame({k: np.ravel(v) for k, v in arrays.items()})
+    frame.insert(0, 'station_id', np.repeat(stations, shape[1]))
+    frame.insert(1, 'date', frame['timestamp'].dt.strftime('%Y-%m-%d'))
+    frame['heat_alert'] = np.where(frame['temp_ext_predicted'] > 38, 'OUI', 'NON')
+    return frame.drop(columns='timestamp')
+
+def make_predictions(model, data, export=True):
     print("\nGénération des prévisions à 24h...")
-    predictions =[]
-    tomorrow = datetime.now() + timedelta(days=1)
+    frame = forecast(model, horizon_hours=24)
+    predictions = frame.drop(columns='station_id').to_dict(orient='records')
     
-    for hour in range(24):
-        # Météo simulée pour demain
-        temp_ext = 35 + np.sin(hour/24 * np.pi) * 8 + np.random.normal(0, 2)
-        humidity = 40 + np.cos(hour/24 * np.pi) * 20
-        
-        # Prédiction Solaire
-        solar_capacity = 0
-        if 7 <= hour <= 17:
-            solar_capacity = (80 if 11 <= hour <= 14 else 40) * (1 - (humidity/100 * 0.3))
-        
-        # Simulation d'une coupure SONABEL probable à 19h (Pic de conso national)
-        grid_status = 0 if hour == 19 else 1
-        
-        features = [[hour, tomorrow.weekday(), temp_ext, humidity]]
-        energy_pred = model.predict(features)[0]
-        
-        # Estimation du débit
-        if 6 <= hour <= 9 or 18 <= hour <= 21: flow_pred = 220
-        else: flow_pred = 150
-        
-        predictions.append({
-            'date': tomorrow.strftime('%Y-%m-%d'),
-            'hour': hour,
-            'temp_ext_predicted': round(temp_ext, 1),
-            'solar_capacity_predicted': round(solar_capacity, 1),
-            'grid_status_predicted': grid_status,
-            'energy_predicted': round(energy_pred, 2),
-            'flow_estimated': round(flow_pred, 1),
-            'heat_alert': 'OUI' if temp_ext > 38 else 'NON'
-        })
-        
-    with open('data/predictions.json', 'w') as f:
-        json.dump(predictions, f, indent=2)
+    if export:
+        # Fichier réécrit seulement si son contenu change : un run sans nouvelle donnée ne modifie
+        # ni l'empreinte des étapes aval du pipeline ni la version vue par les caches de l'API
+        text = json.dumps(predictions, indent=2)
+        previous = None
+        if os.path.exists('data/predictions.json'):
+            with open('data/predictions.json', 'r') as f:
+                previous = f.read()
+        if text != previous:
+            os.makedirs('data', exist_ok=True)
+            with open('data/predictions.json', 'w') as f:
+                f.write(text)
         
     print(f"✓ Prévisions enregistrées. Coupure réseau anticipée à 19h.")
     return predictions
 
+def run_prediction(seed=None, backend=None):
+    """Étape complète du module 1 (données -> modèle -> prévisions 24h), utilisée par le pipeline"""
+    data = generate_data(seed=seed)
+    model = train_model(data, backend=backend)
+    return make_predictions(model, data)
+
 if __name__ == '__main__':
-    data = generate_data()
-    model = train_model(data)
-    predictions = make_predictions(model, data)
+    import argparse
+    parser = argparse.ArgumentParser(description="Module 1 - Prévision énergétique")
+    parser.add_argument('--stations', type=int, help="Générer un jeu de données de charge pour N stations")
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--out', default='data/load_test')
+    parser.add_argument('--store', action='store_true', help="Écrire dans un store télémétrie plutôt qu'en .bin brut")
+    parser.add_argument('--backend', choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="Format du modèle de prévision (défaut : variable ONEA_MODEL_BACKEND ou forest)")
+    args = parser.parse_args()
+    if args.stations:
+        writer = write_generated_store if args.store else write_generated_data
+        writer(args.out, n_days=args.days, n_stations=args.stations, seed=args.seed)
+        raise SystemExit(0)
+
+    run_prediction(seed=args.seed, backend=args.backend)
     print("="*50 + "\nMODULE 1 TERMINÉ\n" + "="*50)
\ No newline at end of file
@@ -1,6 +1,10 @@
 import json
+import os
 import numpy as np
 from datetime import datetime
+from model_registry import data_fingerprint
+from telemetry_store import DEFAULT_STATION
+from weather_features import FeatureCache
 
 # --- CONSTANTES ONEA (Tirées du document technique) ---
 TARIF_SONABEL_HP = 118      # Heures de pointe (17h-24h) FCFA/kWh
@@ -8,19 +12,287 @@ TARIF_SONABEL_HC = 54       # Heures pleines (00h-17h) FCFA/kWh
 PRIX_GASOIL_LITRE = 675     # FCFA par litre de gasoil (Arrêté 2022)
 KWH_PER_LITER = 3.0         # 1 litre de gasoil produit environ 3 kWh
 EMISSION_CO2_LITRE = 2.6    # kg de CO2 par litre de gasoil
-MAX_POWER_SONABEL = 90      # kW max autorisés par la SONABEL avant pénalité
+MAX_POWER_SONABEL = 90      # kW souscrits : plafond strict du soutirage SONABEL (au-delà : groupe électrogène)
+PRIME_FIXE_KW = 5366        # FCFA par kW de puissance souscrite/mois (facturée sur la pointe du mois)
+CONSUMPTION_RATE = 120      # Consommation du réseau aval (m³/h)
+NIVEAU_MIN, NIVEAU_MAX = 25, 95   # Bornes physiques du réservoir (%)
+
+# --- PROGRAMMATION DYNAMIQUE (optimum global sur l'horizon) ---
+# Actions de pompage possibles : (libellé, taux de pompage %, multiplicateur de débit)
+DP_ACTIONS = [
+    ('ARRET', 0, 0.0),
+    ('MAINTIEN_VITAL', 15, 0.2),
+    ('POMPER_MIN', 25, 0.4),
+    ('POMPER_URGENCE', 60, 0.8),
+    ('POMPER_NORMAL', 80, 1.1),
+    ('POMPER_MAX', 100, 1.3)
+]
+DP_LEVEL_STEP = 0.5          # pas de discrétisation du niveau réservoir (%)
+NIVEAU_CRITIQUE = 35         # en dessous : pénalité de sécurité par % manquant
+PENALITE_NIVEAU_PCT = 2000   # FCFA par % sous le niveau critique
+PENALITE_RUPTURE_PCT = 20000 # FCFA par % de demande non servie (réservoir vide)
+VALEUR_FINALE_PCT = 1000     # FCFA par % de niveau final sous le niveau initial
 
 def get_sonabel_price(hour):
     return TARIF_SONABEL_HC if hour < 17 else TARIF_SONABEL_HP
 
-def optimize_pumping():
-    print("Optimisation du Mix Énergétique (Solaire / SONABEL / Groupe Électrogène)...")
-    
-    with open('data/predictions.json', 'r') as f:
-        predictions = json.load(f)
+def energy_mix(energy_used, solar_available, grid_ok, sonabel_price):
+    """
+    Répartition vectorisée du mix énergétique (tableaux de même forme, ou diffusables)
+    Solaire d'abord, puis SONABEL jusqu'à MAX_POWER_SONABEL, puis groupe électrogène
+    La puissance souscrite est une limite stricte : la prime PRIME_FIXE_KW est mensuelle et
+    porte sur la pointe du mois, elle n'a pas d'équivalent au kWh comparable au prix du gasoil
+    Retourne (solaire, sonabel, générateur, coût)
+    """
+    solar = np.minimum(energy_used, np.maximum(solar_available, 0))
+    remaining = energy_used - solar
+    sonabel = np.where(grid_ok, np.minimum(remaining, MAX_POWER_SONABEL), 0.0)
+    generator = remaining - sonabel
+    cost = sonabel * sonabel_price + generator * (PRIX_GASOIL_LITRE / KWH_PER_LITER)
+    return solar, sonabel, generator, cost
+
+def telemetry_mix(energy, solar_available, grid_status, hour):
+    """
+    Mix réalisé heure par heure à partir de colonnes de télémétrie (tarif selon l'heure)
+    Retourne un dict de tableaux : kWh par source, coût (FCFA), gasoil (L), CO2 (kg)
+    """
+    price = np.where(np.asarray(hour) < 17, TARIF_SONABEL_HC, TARIF_SONABEL_HP)
+    solar, sonabel, generator, cost = energy_mix(
+        np.asarray(energy, dtype=float), np.asarray(solar_available, dtype=float), np.asarray(grid_status) == 1, price
+    )
+    gasoil = generator / KWH_PER_LITER
+    return {
+        'solar_kwh': solar,
+        'sonabel_kwh': sonabel,
+        'generator_kwh': generator,
+        'cost_fcfa': cost,
+        'gasoil_liters': gasoil,
+        'co2_kg': gasoil * EMISSION_CO2_LITRE
+    }
+
+DP_SOLUTION_PATH = 'data/dp_solution.npz'
+DP_INPUTS = ('energy', 'solar', 'grid_ok', 'price', 'flow')
+
+class DPSolution:
+    """Tables de la programmation dynamique : coût restant V[t, niveau] et politique optimale"""
+
+    def __init__(self, levels, value, policy, stage_cost, level_delta, inputs, fingerprint=''):
+        self.levels = levels            # grille des niveaux (S,)
+        self.value = value              # coût restant optimal (H + 1, S)
+        self.policy = policy            # indice de l'action optimale (H, S)
+        self.stage_cost = stage_cost    # coût de chaque action heure par heure (H, A)
+        self.level_delta = level_delta  # variation de niveau de chaque action (H, A)
+        self.inputs = inputs            # entrées horaires (énergie, solaire, réseau, prix, débit)
+        self.fingerprint = fingerprint  # empreinte des prévisions résolues (predictions_fingerprint)
+
+    def save(self, path=DP_SOLUTION_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        np.savez(path, levels=self.levels, value=self.value, policy=self.policy,
+                 stage_cost=self.stage_cost, level_delta=self.level_delta,
+                 fingerprint=np.array(self.fingerprint), **self.inputs)
+
+    @classmethod
+    def load(cls, path=DP_SOLUTION_PATH):
+        with np.load(path) as f:
+            tables = {k: f[k] for k in f.files}
+        inputs = {k: tables.pop(k) for k in DP_INPUTS}
+        fingerprint = str(tables.pop('fingerprint', ''))
+        return cls(inputs=inputs, fingerprint=fingerprint, **tables)
+
+    def replan(self, current_hour, observed_level, grid_status=None, outage_hours=1,
+               solar_observed=None, solar_hours=3):
+        """
+        Re-planification glissante à partir de l'état observé (heure, niveau réel, réseau, solaire)
+        - Seul le niveau diffère : la politique existante est réutilisée telle quelle (simple déroulé)
+        - Réseau ou solaire différent : seules les heures modifiées sont re-coûtées et la récurrence
+          arrière ne repart que de la dernière heure modifiée jusqu'à l'heure courante
+          (les tables V des heures suivantes sont conservées)
+        Retourne (nouvelle solution, actions, niveaux) pour les heures [current_hour, fin]
+        """
+        horizon = self.policy.shape[0]
+        inputs = {k: v.copy() for k, v in self.inputs.items()}
+        changed = []
+        if grid_status is not None:
+            for t in range(current_hour, min(current_hour + outage_hours, horizon)):
+                if inputs['grid_ok'][t] != bool(grid_status):
+                    inputs['grid_ok'][t] = bool(grid_status)
+                    changed.append(t)
+        if solar_observed is not None and inputs['solar'][current_hour] > 0:
+            # Persistance : l'écart observé (nuages) est appliqué aux prochaines heures solaires
+            ratio = solar_observed / inputs['solar'][current_hour]
+            hours = slice(current_hour, min(current_hour + solar_hours, horizon))
+            inputs['solar'][hours] *= ratio
+            changed.extend(range(hours.start, hours.stop))
         
+        solution = DPSolution(self.levels, self.value.copy(), self.policy.copy(),
+                              self.stage_cost.copy(), self.level_delta.copy(), inputs, self.fingerprint)
+        if changed:
+            last = max(changed)
+            window = slice(current_hour, last + 1)
+            cost, delta = _dp_inputs(*(inputs[k][window] for k in DP_INPUTS))
+            solution.stage_cost[window], solution.level_delta[window] = cost, delta
+            dp_backward(solution.stage_cost, solution.level_delta, None, self.levels,
+                        solution.value, solution.policy, last_hour=last, first_hour=current_hour)
+        actions, levels = solution.rollout(observed_level, start_hour=current_hour)
+        return solution, actions, levels
+
+    def rollout(self, initial_level, start_hour=0):
+        """Suivre la politique optimale depuis un niveau donné -> (actions, niveaux après chaque heure)"""
+        horizon = self.policy.shape[0]
+        actions = np.zeros(horizon - start_hour, dtype=int)
+        levels = np.zeros(horizon - start_hour)
+        level = initial_level
+        for i, t in enumerate(range(start_hour, horizon)):
+            s = int(np.clip(np.rint((level - NIVEAU_MIN) / DP_LEVEL_STEP), 0, len(self.levels) - 1))
+            a = self.policy[t, s]
+            level = float(np.clip(level + self.level_delta[t, a], NIVEAU_MIN, NIVEAU_MAX))
+            actions[i], levels[i] = a, level
+        return actions, levels
+
+def _dp_inputs(energy, solar, grid_ok, price, flow):
+    """Coûts et variations de niveau de chaque action pour chaque heure : (..., H, A)"""
+    rates = np.array([a[1] for a in DP_ACTIONS]) / 100
+    factors = np.array([a[2] for a in DP_ACTIONS])
+    energy_used = energy[..., None] * rates
+    *_, cost = energy_mix(energy_used, solar[..., None], grid_ok[..., None], price[..., None])
+    level_delta = (flow[..., None] * factors - CONSUMPTION_RATE) / 10
+    return cost, level_delta
+
+def _level_penalty(raw_levels):
+    """Pénalités de sécurité : niveau sous le seuil critique et demande non servie"""
+    below_critical = np.maximum(NIVEAU_CRITIQUE - raw_levels, 0)
+    shortage = np.maximum(NIVEAU_MIN - raw_levels, 0)
+    return below_critical * PENALITE_NIVEAU_PCT + shortage * PENALITE_RUPTURE_PCT
+
+def dp_backward(stage_cost, level_delta, terminal_value, levels, value=None, policy=None,
+                last_hour=None, first_hour=0):
+    """
+    Récurrence arrière de Bellman, vectorisée sur (niveaux × actions) pour chaque heure
+    value/policy existants + last_hour/first_hour : ne recalcule que les heures [first_hour, last_hour]
+    """
+    horizon = stage_cost.shape[0]
+    if value is None:
+        value = np.zeros((horizon + 1, len(levels)))
+        policy = np.zeros((horizon, len(levels)), dtype=np.int8)
+        value[horizon] = terminal_value
+        last_hour = horizon - 1
+    for t in range(last_hour, first_hour - 1, -1):
+        raw = levels[:, None] + level_delta[t][None, :]
+        nxt = np.clip(raw, NIVEAU_MIN, NIVEAU_MAX)
+        q = stage_cost[t][None, :] + _level_penalty(raw) + np.interp(nxt, levels, value[t + 1])
+        policy[t] = np.argmin(q, axis=1)
+        value[t] = q[np.arange(len(levels)), policy[t]]
+    return value, policy
+
+def solve_dp(energy, solar, grid_ok, price, flow, initial_level=65.0):
+    """
+    Planning optimal sur tout l'horizon (24 à 168 h) par programmation dynamique sur le niveau réservoir
+    Minimise coût énergétique (SONABEL plafonnée à la puissance souscrite) + pénalités de niveau,
+    avec une valeur finale qui interdit de vider le réservoir en fin d'horizon
+    """
+    energy, solar, price, flow = (np.asarray(x, dtype=float) for x in (energy, solar, price, flow))
+    grid_ok = np.asarray(grid_ok, dtype=bool)
+    levels = np.arange(NIVEAU_MIN, NIVEAU_MAX + DP_LEVEL_STEP / 2, DP_LEVEL_STEP)
+    stage_cost, level_delta = _dp_inputs(energy, solar, grid_ok, price, flow)
+    terminal_value = np.maximum(initial_level - levels, 0) * VALEUR_FINALE_PCT
+    value, policy = dp_backward(stage_cost, level_delta, terminal_value, levels)
+    inputs = dict(zip(DP_INPUTS, (energy, solar, grid_ok, price, flow)))
+    return DPSolution(levels, value, policy, stage_cost, level_delta, inputs)
+
+def build_schedule(predictions, actions, levels):
+    """Construire les lignes de pump_schedule.json à partir des actions retenues (indices DP_ACTIONS)"""
+    pump_plan = []
+    for pred, a, level in zip(predictions, actions, levels):
+        label, pump_rate, _ = DP_ACTIONS[a]
+        grid_ok = pred['grid_status_predicted'] == 1
+        price = get_sonabel_price(pred['hour'])
+        energy_used = pred['energy_predicted'] * (pump_rate / 100)
+        solar, sonabel, generator, cost = (float(x) for x in energy_mix(
+            np.float64(energy_used), pred['solar_capacity_predicted'], np.bool_(grid_ok), price))
+        gasoil_liters = generator / KWH_PER_LITER
+        pump_plan.append({
+            'date': pred['date'],
+            'hour': pred['hour'],
+            'pump_action': label + " (Optimum DP)",
+            'pump_rate': pump_rate,
+            'energy_used': round(energy_used, 2),
+            'mix_solar_kwh': round(solar, 2),
+            'mix_sonabel_kwh': round(sonabel, 2),
+            'mix_generator_kwh': round(generator, 2),
+            'cost_fcfa': round(cost, 2),
+            'gasoil_used_liters': round(gasoil_liters, 2),
+            'co2_emissions_kg': round(gasoil_liters * EMISSION_CO2_LITRE, 2),
+            'reservoir_level': round(float(level), 1),
+            'grid_status': "OK" if grid_ok else "COUPURE"
+        })
+    return pump_plan
+
+def predictions_to_arrays(predictions):
+    """Liste de prévisions (predictions.json) -> tableaux d'entrée de l'optimiseur"""
+    return {
+        'energy': np.array([p['energy_predicted'] for p in predictions], dtype=float),
+        'solar': np.array([p['solar_capacity_predicted'] for p in predictions], dtype=float),
+        'grid_ok': np.array([p['grid_status_predicted'] == 1 for p in predictions]),
+        'price': np.array([get_sonabel_price(p['hour']) for p in predictions], dtype=float),
+        'flow': np.array([p['flow_estimated'] for p in predictions], dtype=float)
+    }
+
+def predictions_fingerprint(predictions):
+    """Empreinte des prévisions d'un planning (heures et entrées de l'optimiseur)"""
+    timestamps = np.array([f"{p['date']}T{int(p['hour']):02d}" for p in predictions], dtype='datetime64[h]')
+    return data_fingerprint(timestamps, *predictions_to_arrays(predictions).values())
+
+def optimize_pumping_dp(predictions, initial_level=65.0, return_solution=False):
+    """Mode optimal : programmation dynamique puis mise en forme identique au mode heuristique"""
+    inputs = predictions_to_arrays(predictions)
+    solution = solve_dp(initial_level=initial_level, **inputs)
+    solution.fingerprint = predictions_fingerprint(predictions)
+    actions, levels = solution.rollout(initial_level)
+    pump_plan = build_schedule(predictions, actions, levels)
+    return (pump_plan, solution) if return_solution else pump_plan
+
+def replan_pumping(current_hour, observed_level, grid_status=None, solar_observed=None, outage_hours=1,
+                   solution_path=DP_SOLUTION_PATH, output='data/pump_schedule.json'):
+    """
+    Re-planifier les heures restantes du planning DP à partir des mesures temps réel
+    Les heures déjà écoulées du planning publié sont conservées telles quelles
+    Le planning publié et les tables DP doivent venir d'un run --mode dp sur les prévisions
+    actuelles (ValueError sinon)
+    """
+    with open('data/predictions.json', 'r') as f:
+        predictions = cached_solar(json.load(f))
+    if not 0 <= current_hour < len(predictions):
+        raise ValueError(f"heure de re-planification hors horizon : {current_hour} (0 à {len(predictions) - 1})")
+    with open(output, 'r') as f:
+        previous_plan = json.load(f)
+    if len(previous_plan) != len(predictions) or not all('(Optimum DP)' in p['pump_action'] for p in previous_plan):
+        raise ValueError(f"{output} ne vient pas du mode dp : relancer l'optimisation avec --mode dp")
+    if not os.path.exists(solution_path):
+        raise ValueError(f"tables DP absentes ({solution_path}) : relancer l'optimisation avec --mode dp")
+    solution = DPSolution.load(solution_path)
+    if solution.fingerprint != predictions_fingerprint(predictions):
+        raise ValueError(f"{solution_path} ne correspond pas aux prévisions actuelles : "
+                         "relancer l'optimisation avec --mode dp")
+    solution, actions, levels = solution.replan(current_hour, observed_level, grid_status, outage_hours,
+                                                solar_observed)
+    
+    # Les prévisions reflètent l'état observé pour la mise en forme des heures re-planifiées
+    remaining = [dict(p) for p in predictions[current_hour:]]
+    for p, grid_ok, solar in zip(remaining, solution.inputs['grid_ok'][current_hour:],
+                                 solution.inputs['solar'][current_hour:]):
+        p['grid_status_predicted'] = int(grid_ok)
+        p['solar_capacity_predicted'] = float(solar)
+    pump_plan = previous_plan[:current_hour] + build_schedule(remaining, actions, levels)
+    
+    solution.save(solution_path)
+    with open(output, 'w') as f:
+        json.dump(pump_plan, f, indent=2)
+    print(f"✓ Planning re-calculé à partir de {current_hour}h (niveau observé {observed_level}%)")
+    return pump_plan
+
+def optimize_pumping_heuristic(predictions, initial_level=65.0):
     pump_plan =[]
-    current_level = 65  # Niveau initial du château d'eau (%)
+    current_level = initial_level  # Niveau initial du château d'eau (%)
     
     for pred in predictions:
         hour = pred['hour']
@@ -89,9 +361,8 @@ def optimize_pumping():
         co2_emissions = gasoil_liters * EMISSION_CO2_LITRE
         
         # Simulation niveau réservoir
-        consumption_rate = 120 
-        level_change = (flow_actual - consumption_rate) / 10
-        current_level = max(25, min(95, current_level + level_change))
+        level_change = (flow_actual - CONSUMPTION_RATE) / 10
+        current_level = max(NIVEAU_MIN, min(NIVEAU_MAX, current_level + level_change))
         
         pump_plan.append({
             'date': pred['date'],
@@ -110,8 +381,151 @@ def optimize_pumping():
             'reservoir_level': round(current_level, 1),
             'grid_status': "OK" if grid_ok else "COUPURE"
         })
+    return pump_plan
+
+OPTIMIZERS = {'heuristic': optimize_pumping_heuristic, 'dp': optimize_pumping_dp}
+
+# --- OPTIMISATION DE FLOTTE (toutes les stations d'un coup, tableaux stations × heures) ---
+FLEET_CHUNK = 250   # stations par tâche lorsque la flotte est répartie sur plusieurs processus
+
+def _fleet_heuristic(energy, solar, grid_ok, price, flow, initial_level):
+    """Même cascade de décision que optimize_pumping_heuristic, vectorisée sur les stations"""
+    n_stations, horizon = energy.shape
+    rates = np.zeros((n_stations, horizon))
+    levels = np.zeros((n_stations, horizon))
+    level = np.broadcast_to(np.asarray(initial_level, dtype=float), (n_stations,)).copy()
+    for t in range(horizon):
+        off_peak = price[:, t] <= TARIF_SONABEL_HC
+        peak = price[:, t] >= TARIF_SONABEL_HP
+        conditions = [
+            (solar[:, t] > 50) & (level < 90),
+            grid_ok[:, t] & off_peak & (level < 85),
+            grid_ok[:, t] & peak & (level > 35),
+            ~grid_ok[:, t] & (level > 25)
+        ]
+        rates[:, t] = np.select(conditions, [100, 80, 25, 15], 60)
+        flow_factor = np.select(conditions, [1.3, 1.1, 0.4, 0.2], 0.8)
+        level = np.clip(level + (flow[:, t] * flow_factor - CONSUMPTION_RATE) / 10, NIVEAU_MIN, NIVEAU_MAX)
+        levels[:, t] = level
+    return rates, levels
+
+def _interp_uniform(values, positions):
+    """Interpolation linéaire sur la grille uniforme des niveaux, station par station"""
+    x = (positions - NIVEAU_MIN) / DP_LEVEL_STEP
+    lo = np.clip(np.floor(x).astype(int), 0, values.shape[-1] - 2)
+    w = np.clip(x - lo, 0, 1)
+    flat_lo = lo.reshape(len(values), -1)
+    v_lo = np.take_along_axis(values, flat_lo, axis=1).reshape(positions.shape)
+    v_hi = np.take_along_axis(values, flat_lo + 1, axis=1).reshape(positions.shape)
+    return v_lo * (1 - w) + v_hi * w
+
+def _fleet_dp(energy, solar, grid_ok, price, flow, initial_level):
+    """Programmation dynamique de solve_dp, vectorisée sur (stations × niveaux × actions)"""
+    n_stations, horizon = energy.shape
+    levels = np.arange(NIVEAU_MIN, NIVEAU_MAX + DP_LEVEL_STEP / 2, DP_LEVEL_STEP)
+    stage_cost, level_delta = _dp_inputs(energy, solar, grid_ok, price, flow)
+    initial_level = np.broadcast_to(np.asarray(initial_level, dtype=float), (n_stations,))
+    value = np.maximum(initial_level[:, None] - levels[None, :], 0) * VALEUR_FINALE_PCT
+    policy = np.zeros((horizon, n_stations, len(levels)), dtype=np.int8)
+    for t in range(horizon - 1, -1, -1):
+        raw = levels[None, :, None] + level_delta[:, t, None, :]
+        nxt = np.clip(raw, NIVEAU_MIN, NIVEAU_MAX)
+        q = stage_cost[:, t, None, :] + _level_penalty(raw) + _interp_uniform(value, nxt)
+        policy[t] = np.argmin(q, axis=2)
+        value = np.take_along_axis(q, policy[t][..., None].astype(int), axis=2)[..., 0]
+    
+    rates_table = np.array([a[1] for a in DP_ACTIONS], dtype=float)
+    rows = np.arange(n_stations)
+    rates = np.zeros((n_stations, horizon))
+    levels_out = np.zeros((n_stations, horizon))
+    level = initial_level.copy()
+    for t in range(horizon):
+        s = np.clip(np.rint((level - NIVEAU_MIN) / DP_LEVEL_STEP).astype(int), 0, len(levels) - 1)
+        a = policy[t, rows, s]
+        rates[:, t] = rates_table[a]
+        level = np.clip(level + level_delta[rows, t, a], NIVEAU_MIN, NIVEAU_MAX)
+        levels_out[:, t] = level
+    return rates, levels_out
+
+FLEET_OPTIMIZERS = {'heuristic': _fleet_heuristic, 'dp': _fleet_dp}
+
+def _optimize_fleet_chunk(args):
+    mode, energy, solar, grid_ok, price, flow, initial_level = args
+    rates, levels = FLEET_OPTIMIZERS[mode](energy, solar, grid_ok, price, flow, initial_level)
+    energy_used = energy * rates / 100
+    mix_solar, sonabel, generator, cost = energy_mix(energy_used, solar, grid_ok, price)
+    gasoil = generator / KWH_PER_LITER
+    return {
+        'pump_rate': rates, 'energy_used': energy_used,
+        'mix_solar_kwh': mix_solar, 'mix_sonabel_kwh': sonabel, 'mix_generator_kwh': generator,
+        'cost_fcfa': cost, 'gasoil_used_liters': gasoil, 'co2_emissions_kg': gasoil * EMISSION_CO2_LITRE,
+        'reservoir_level': levels
+    }
+
+def optimize_fleet(demand, solar, grid_status, tariffs=None, flow=None, initial_level=65.0,
+                   mode='heuristic', workers=None):
+    """
+    Optimiser toute une flotte en un appel : entrées en tableaux (stations × heures)
+    demand : énergie prévue (kWh), solar : potentiel solaire (kWh), grid_status : 1 = OK / 0 = coupure,
+    tariffs : prix SONABEL (FCFA/kWh, par défaut grille horaire E2), flow : débit estimé (m³/h)
+    Retourne un dict de tableaux (stations × heures) : mix, coûts, CO2, trajectoire du réservoir
+    workers > 1 : les stations sont réparties par paquets de FLEET_CHUNK sur un pool de processus
+    """
+    demand = np.atleast_2d(np.asarray(demand, dtype=float))
+    shape = demand.shape
+    solar = np.broadcast_to(np.asarray(solar, dtype=float), shape)
+    grid_ok = np.broadcast_to(np.asarray(grid_status) == 1, shape)
+    if tariffs is None:
+        tariffs = [get_sonabel_price(h % 24) for h in range(shape[1])]
+    price = np.broadcast_to(np.asarray(tariffs, dtype=float), shape)
+    flow = np.broadcast_to(np.asarray(150.0 if flow is None else flow, dtype=float), shape)
+    initial_level = np.broadcast_to(np.asarray(initial_level, dtype=float), (shape[0],))
+    
+    bounds = range(0, shape[0], FLEET_CHUNK)
+    tasks = [(mode, demand[i:i + FLEET_CHUNK], solar[i:i + FLEET_CHUNK], grid_ok[i:i + FLEET_CHUNK],
+              price[i:i + FLEET_CHUNK], flow[i:i + FLEET_CHUNK], initial_level[i:i + FLEET_CHUNK]) for i in bounds]
+    if workers and workers > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_optimize_fleet_chunk, tasks))
+    else:
+        parts = [_optimize_fleet_chunk(task) for task in tasks]
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+def cached_solar(predictions, station=DEFAULT_STATION, refresh=False):
+    """
+    Potentiel solaire de chaque heure prévue, lu dans le cache de features (station, date)
+    Seules les heures sans solar_capacity_predicted sont complétées ; refresh=True remplace aussi
+    les valeurs fournies (prévision météo déposée après la prévision d'énergie)
+    """
+    if not refresh and all('solar_capacity_predicted' in p for p in predictions):
+        return predictions
+    timestamps = np.array([f"{p['date']}T{p['hour']:02d}" for p in predictions], dtype='datetime64[h]')
+    dates = timestamps.astype('datetime64[D]')
+    days = np.unique(dates)
+    solar = FeatureCache().days([station], days)['solar_capacity'][0]
+    values = solar[np.searchsorted(days, dates), (timestamps - dates).astype(int)]
+    return [p if not refresh and 'solar_capacity_predicted' in p else dict(p, solar_capacity_predicted=round(float(v), 1))
+            for p, v in zip(predictions, values)]
+
+def optimize_pumping(mode='heuristic', predictions=None, output='data/pump_schedule.json', station=DEFAULT_STATION,
+                     refresh_solar=False):
+    print("Optimisation du Mix Énergétique (Solaire / SONABEL / Groupe Électrogène)...")
+    
+    if predictions is None:
+        with open('data/predictions.json', 'r') as f:
+            predictions = json.load(f)
+    predictions = cached_solar(predictions, station, refresh=refresh_solar)
+    
+    if mode == 'dp':
+        # Les tables DP sont conservées pour les re-planifications en cours de journée
+        pump_plan, solution = optimize_pumping_dp(predictions, return_solution=True)
+        solution.save()
+    else:
+        pump_plan = OPTIMIZERS[mode](predictions)
         
-    with open('data/pump_schedule.json', 'w') as f:
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
         json.dump(pump_plan, f, indent=2)
         
     # --- 4. STATISTIQUES ET MÉTRIQUES POUR LE JURY ---
@@ -135,6 +549,59 @@ def optimize_pumping():
     
     return pump_plan
 
+def benchmark_optimizers(predictions, days=(1, 7), repeat=20):
+    """
+    Comparer heuristique et programmation dynamique : coût énergétique facturé (solaire, SONABEL,
+    gasoil ; les pénalités de niveau de la DP ne sont pas des coûts, le niveau minimal est affiché
+    à part) et temps de calcul, sur 24 h puis sur un horizon de 7 jours (prévisions répétées)
+    """
+    import time
+    results = []
+    for n_days in days:
+        horizon = [dict(p) for _ in range(n_days) for p in predictions]
+        for mode, optimizer in OPTIMIZERS.items():
+            start = time.perf_counter()
+            for _ in range(repeat):
+                plan = optimizer(horizon)
+            elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+            levels = np.array([p['reservoir_level'] for p in plan])
+            results.append({
+                'mode': mode, 'horizon_h': len(horizon), 'runtime_ms': round(elapsed_ms, 2),
+                'cost_fcfa': round(sum(p['cost_fcfa'] for p in plan), 0),
+                'gasoil_liters': round(sum(p['gasoil_used_liters'] for p in plan), 1),
+                'min_level': round(float(levels.min()), 1), 'final_level': round(float(levels[-1]), 1)
+            })
+    print(f"\n{'Mode':<10}{'Horizon':>8}{'Temps (ms)':>12}{'Coût (FCFA)':>14}{'Gasoil (L)':>12}{'Niv. min':>10}{'Niv. fin':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['horizon_h']:>8}{r['runtime_ms']:>12}{r['cost_fcfa']:>14.0f}"
+              f"{r['gasoil_liters']:>12}{r['min_level']:>10}{r['final_level']:>10}")
+    return results
+
 if __name__ == '__main__':
-    optimize_pumping()
+    import argparse
+    parser = argparse.ArgumentParser(description="Module 2 - Optimisation du pompage")
+    parser.add_argument('--mode', choices=sorted(OPTIMIZERS), default='heuristic')
+    parser.add_argument('--benchmark', action='store_true', help="Comparer heuristique et programmation dynamique")
+    parser.add_argument('--replan', type=int, metavar='HEURE', help="Re-planifier à partir de l'heure courante")
+    parser.add_argument('--level', type=float, help="Niveau réservoir observé (%%)")
+    parser.add_argument('--grid', type=int, choices=[0, 1], help="Statut réseau observé (1 = OK, 0 = coupure)")
+    parser.add_argument('--outage-hours', type=int, default=1, help="Durée supposée de la coupure observée")
+    parser.add_argument('--solar', type=float, help="Potentiel solaire observé (kWh)")
+    parser.add_argument('--refresh-solar', action='store_true',
+                        help="Relire le potentiel solaire dans le cache météo (remplace celui des prévisions)")
+    args = parser.parse_args()
+    if args.replan is not None and args.level is None:
+        parser.error("--replan exige --level (niveau réservoir observé)")
+    if args.benchmark:
+        with open('data/predictions.json', 'r') as f:
+            benchmark_optimizers(json.load(f))
+        raise SystemExit(0)
+    if args.replan is not None:
+        try:
+            replan_pumping(args.replan, args.level, args.grid, args.solar, args.outage_hours)
+        except ValueError as e:
+            print(f"✗ {e}")
+            raise SystemExit(1)
+        raise SystemExit(0)
+    optimize_pumping(args.mode, refresh_solar=args.refresh_solar)
     print("="*50 + "\nMODULE 2 TERMINÉ\n" + "="*50)
\ No newline at end of file
@@ -2,121 +2,157 @@ import json
 import numpy as np
 from datetime import datetime
 import os
-from sklearn.ensemble import IsolationForest
 import warnings
+from telemetry_store import open_store, DEFAULT_STATION
+from anomaly_scoring import score_telemetry
+from anomaly_log import AnomalyLog, ANOMALY_LOG
 warnings.filterwarnings('ignore')
 
 def detect_ml_anomalies(data):
-    print("  → Détection ML (Isolation Forest) avec contexte Solaire/Réseau...")
-    
-    features = []
-    for record in data:
-        #[MISE À JOUR] L'IA observe maintenant le soleil et les coupures SONABEL
-        features.append([
-            record['flow'],
-            record['energy'],
-            record['level'],
-            record['hour'],
-            record.get('solar_capacity', 0),
-            record.get('grid_status', 1)
-        ])
-    
-    X = np.array(features)
-    model = IsolationForest(contamination=0.08, random_state=42, n_estimators=100)
-    predictions = model.fit_predict(X)
-    anomaly_scores = model.score_samples(X)
+    print("  → Détection ML (Isolation Forest partagé) avec contexte Solaire/Réseau...")
     
+    # Scores calculés une seule fois par lot (service commun aux modules 3 et 3bis)
+    result = score_telemetry(data)
     ml_anomalies = {}
-    for i, (pred, score) in enumerate(zip(predictions, anomaly_scores)):
-        if pred == -1:
-            ml_anomalies[i] = {
-                'index': i, 'anomaly_score': float(score), 'severity': 'MOYENNE'
-            }
+    for i in np.flatnonzero(result['is_anomaly']):
+        ml_anomalies[int(i)] = {
+            'index': int(i), 'anomaly_score': float(result['score'][i]), 'severity': 'MOYENNE'
+        }
     
     print(f"  → ML a détecté {len(ml_anomalies)} anomalies contextuelles")
     return ml_anomalies
 
-def detect_anomalies():
+# --- RÈGLES EXPERTES (table déclarative : condition, score, libellé) ---
+# Seuils par défaut ; surcharge possible par station dans data/anomaly_thresholds.json :
+#   {"default": {...}, "stations": {"ST_02": {"peak_flow_max": 400}}}
+THRESHOLDS_FILE = 'data/anomaly_thresholds.json'
+DEFAULT_THRESHOLDS = {
+    'gasoil_flow_max': 120,      # débit max toléré sur groupe électrogène (m³/h)
+    'solar_capacity_min': 60,    # potentiel solaire considéré comme "grand soleil" (kWh)
+    'solar_flow_min': 100,       # débit minimal attendu en plein soleil (m³/h)
+    'solar_level_max': 80,       # au-delà, un faible débit solaire est normal (réservoir plein)
+    'level_critical': 40,        # niveau bas critique (%)
+    'peak_hour_start': 18,       # heures de pointe SONABEL
+    'peak_hour_end': 22,
+    'peak_flow_max': 200,        # débit max en heure de pointe (m³/h)
+    'pump_failure_flow': 70      # débit sous lequel une panne pompe est probable (m³/h)
+}
+MIN_SEVERITY_SCORE = 2           # score minimal pour publier une anomalie (remplace le filtre aléatoire)
+
+EXPERT_RULES = [
+    # [NOUVELLE RÈGLE] Gaspillage de Gasoil : Pompage fort pendant une coupure SONABEL
+    {'label': 'GASPILLAGE_GASOIL_GROUPE_ELECTROGENE', 'score': 4,  # Très critique financièrement
+     'condition': lambda d, t: (d['grid_status'] == 0) & (d['flow'] > t['gasoil_flow_max'])},
+    # [NOUVELLE RÈGLE] Potentiel Solaire Perdu : Grand soleil mais faible débit
+    {'label': 'RENDEMENT_SOLAIRE_ANORMAL (Plaques sales ?)', 'score': 2,
+     'condition': lambda d, t: (d['solar_capacity'] > t['solar_capacity_min']) & (d['flow'] < t['solar_flow_min'])
+                               & (d['level'] < t['solar_level_max'])},
+    # Règle classique : Niveau trop bas
+    {'label': 'NIVEAU_BAS_CRITIQUE', 'score': 3,
+     'condition': lambda d, t: d['level'] < t['level_critical']},
+    # Règle classique : Pompage aux heures de pointe SONABEL
+    {'label': 'DEPASSEMENT_PUISSANCE_HEURE_POINTE', 'score': 3,
+     'condition': lambda d, t: (d['hour'] >= t['peak_hour_start']) & (d['hour'] <= t['peak_hour_end'])
+                               & (d['flow'] > t['peak_flow_max']) & (d['grid_status'] == 1)},
+    # Règle adaptée : Débit faible MAIS réseau OK (si réseau coupé, le débit faible est normal)
+    {'label': 'PANNE_POMPE_PROBABLE', 'score': 2,
+     'condition': lambda d, t: (d['flow'] < t['pump_failure_flow']) & (d['grid_status'] == 1)}
+]
+RULE_LABELS = np.array([r['label'] for r in EXPERT_RULES])
+RULE_SCORES = np.array([r['score'] for r in EXPERT_RULES])
+# Les anomalies ML ne sont pas publiées sur les enregistrements déjà couverts par ces règles
+ML_OVERRIDING_RULES = ['GASPILLAGE_GASOIL_GROUPE_ELECTROGENE', 'NIVEAU_BAS_CRITIQUE']
+
+def load_thresholds(path=THRESHOLDS_FILE):
+    """Seuils par défaut + surcharges par station (fichier optionnel)"""
+    config = {'default': dict(DEFAULT_THRESHOLDS), 'stations': {}}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            user = json.load(f)
+        config['default'].update(user.get('default', {}))
+        config['stations'] = user.get('stations', {})
+    return config
+
+def resolve_thresholds(config, stations, station_index):
+    """
+    Seuils effectifs : un scalaire par seuil si aucune station n'a de surcharge,
+    sinon un tableau par enregistrement (valeur de la station de chaque ligne)
+    """
+    thresholds = dict(config['default'])
+    overrides = {s: config['stations'][s] for s in stations if s in config['stations']}
+    for key in {k for o in overrides.values() for k in o}:
+        per_station = np.array([overrides.get(s, {}).get(key, thresholds[key]) for s in stations])
+        thresholds[key] = per_station[station_index]
+    return thresholds
+
+def evaluate_rules(data, thresholds):
+    """
+    Évaluer toutes les règles d'un coup sur les colonnes de télémétrie
+    Retourne (masques booléens règles × enregistrements, score de sévérité par enregistrement)
+    """
+    masks = np.vstack([np.asarray(rule['condition'](data, thresholds), dtype=bool) for rule in EXPERT_RULES])
+    scores = RULE_SCORES @ masks
+    return masks, scores
+
+def severity_label(score):
+    return 'CRITIQUE' if score >= 4 else 'MOYENNE' if score >= 2 else 'FAIBLE'
+
+def detect_anomalies(stations=(DEFAULT_STATION,), start=None, end=None, min_score=MIN_SEVERITY_SCORE):
     print("Détection des anomalies expertes ONEA...")
     
-    with open('data/historical_data.json', 'r') as f:
-        data = json.load(f)
+    data = open_store().read(stations=list(stations), start=start, end=end)
+    if not len(data['timestamp']):
+        print("⚠ Aucune donnée de télémétrie sur la période demandée (data/telemetry)")
+        print("  Exécutez d'abord module1_prediction.py")
+        return []
+    thresholds = resolve_thresholds(load_thresholds(), data['stations'], data['station_index'])
+    masks, scores = evaluate_rules(data, thresholds)
     
-    anomalies =[]
+    dates = np.datetime_as_string(data['timestamp'].astype('datetime64[D]'))
+    station_ids = np.asarray(data['stations'] or [''])[data['station_index']]
     
-    for i, record in enumerate(data):
-        alert_list =[]
-        score = 0
-        
-        flow = record['flow']
-        energy = record['energy']
-        level = record['level']
-        hour = record['hour']
-        grid_status = record.get('grid_status', 1)
-        solar_capacity = record.get('solar_capacity', 0)
-        
-        # [NOUVELLE RÈGLE] Gaspillage de Gasoil : Pompage fort pendant une coupure SONABEL
-        if grid_status == 0 and flow > 120:
-            alert_list.append("GASPILLAGE_GASOIL_GROUPE_ELECTROGENE")
-            score += 4  # Très critique financièrement
-            
-        # [NOUVELLE RÈGLE] Potentiel Solaire Perdu : Grand soleil mais faible débit
-        if solar_capacity > 60 and flow < 100 and level < 80:
-            alert_list.append("RENDEMENT_SOLAIRE_ANORMAL (Plaques sales ?)")
-            score += 2
-            
-        # Règle classique : Niveau trop bas
-        if level < 40:
-            alert_list.append("NIVEAU_BAS_CRITIQUE")
-            score += 3
-            
-        # Règle classique : Pompage aux heures de pointe SONABEL
-        if 18 <= hour <= 22 and flow > 200 and grid_status == 1:
-            alert_list.append("DEPASSEMENT_PUISSANCE_HEURE_POINTE")
-            score += 3
-        
-        # Règle adaptée : Débit faible MAIS réseau OK (si réseau coupé, le débit faible est normal)
-        if flow < 70 and grid_status == 1:
-            alert_list.append("PANNE_POMPE_PROBABLE")
-            score += 2
-
-        if score > 0:
-            # On filtre un peu pour ne garder que les vraies alertes
-            if np.random.random() > 0.5 or score >= 3:
-                anomalies.append({
-                    'date': record['date'],
-                    'hour': hour,
-                    'flow': flow,
-                    'energy': energy,
-                    'level': level,
-                    'grid_status': grid_status,
-                    'alerts': alert_list,
-                    'severity_score': score,
-                    'severity': 'CRITIQUE' if score >= 4 else 'MOYENNE' if score >= 2 else 'FAIBLE',
-                    'detection_method': 'RULE_BASED'
-                })
+    # Seuls les enregistrements en alerte sont matérialisés en dicts
+    anomalies =[]
+    flagged = np.flatnonzero(scores >= min_score)
+    for i in flagged:
+        score = int(scores[i])
+        anomalies.append({
+            'station_id': str(station_ids[i]),
+            'date': str(dates[i]),
+            'hour': int(data['hour'][i]),
+            'flow': float(data['flow'][i]),
+            'energy': float(data['energy'][i]),
+            'level': float(data['level'][i]),
+            'grid_status': int(data['grid_status'][i]),
+            'alerts': RULE_LABELS[masks[:, i]].tolist(),
+            'severity_score': score,
+            'severity': severity_label(score),
+            'detection_method': 'RULE_BASED'
+        })
     
     # Intégration ML
     ml_anomalies = detect_ml_anomalies(data)
-    rule_based_indices = set([i for i, r in enumerate(data) if any(a in r.get('alerts', []) for a in['GASPILLAGE_GASOIL_GROUPE_ELECTROGENE', 'NIVEAU_BAS_CRITIQUE'])])
+    overriding = np.isin(RULE_LABELS, ML_OVERRIDING_RULES)
+    rule_based_indices = set(np.flatnonzero(masks[overriding].any(axis=0)).tolist())
     
     for idx, ml_info in ml_anomalies.items():
         if idx not in rule_based_indices:
-            record = data[idx]
             anomalies.append({
-                'date': record['date'], 'hour': record['hour'],
-                'flow': record['flow'], 'energy': record['energy'], 'level': record['level'],
+                'station_id': str(station_ids[idx]),
+                'date': str(dates[idx]), 'hour': int(data['hour'][idx]),
+                'flow': float(data['flow'][idx]), 'energy': float(data['energy'][idx]), 'level': float(data['level'][idx]),
+                'grid_status': int(data['grid_status'][idx]),
                 'alerts':['COMPORTEMENT_INHABITUEL_ML'],
                 'severity_score': 2, 'severity': 'MOYENNE',
                 'detection_method': 'MACHINE_LEARNING', 'ml_anomaly_score': ml_info['anomaly_score']
             })
 
+    # Journal en ajout seul : seules les anomalies absentes des runs précédents sont écrites
+    added = AnomalyLog(ANOMALY_LOG).append(sorted(anomalies, key=lambda x: (x['date'], x['hour'])))
     anomalies.sort(key=lambda x: x['severity_score'], reverse=True)
-    
-    with open('data/anomalies.json', 'w') as f:
-        json.dump(anomalies, f, indent=2)
         
-    print(f"\n✓ {len(anomalies)} anomalies détectées (Gasoil, Solaire, SONABEL, ML)")
+    print(f"\n✓ {len(anomalies)} anomalies détectées (Gasoil, Solaire, SONABEL, ML), "
+          f"{len(added)} nouvelles ajoutées à {ANOMALY_LOG}")
     return anomalies
 
 if __name__ == '__main__':
@@ -2,192 +2,113 @@
 Module 3bis - Détection d'Anomalies par Machine Learning
 Utilise Isolation Forest pour détecter des patterns anormaux
 Complète les règles du module 3 avec une approche ML
+Le modèle et les scores sont partagés avec le module 3 (modules/anomaly_scoring.py)
 """
 
-import json
 import numpy as np
-from sklearn.ensemble import IsolationForest
 from datetime import datetime
-import os
+from telemetry_store import open_store, records_to_columns, DEFAULT_STATION
+from anomaly_scoring import score_telemetry
+from anomaly_log import AnomalyLog, ML_ANOMALY_LOG
 
-def train_isolation_forest(historical_data):
+def detect_ml_anomalies(current_data):
     """
-    Entraîner le modèle Isolation Forest sur données historiques
-    
-    Isolation Forest détecte les anomalies en isolant les observations
-    Les points anormaux sont plus faciles à isoler que les points normaux
+    Rapport détaillé des anomalies ML (sous-type probable pour les opérateurs)
+    Les scores viennent du service partagé : même modèle et même calcul que
+    la fusion règles + ML du module 3 (aucun ré-entraînement ni re-scoring)
     """
-    # Extraire features pour ML
-    features = []
-    for record in historical_data:
-        features.append([
-            record['flow'],
-            record['energy'],
-            record['level'],
-            record['hour']
-        ])
-    
-    X = np.array(features)
-    
-    # Créer et entraîner le modèle
-    # contamination=0.1 signifie qu'on s'attend à ~10% d'anomalies
-    model = IsolationForest(
-        contamination=0.1,
-        random_state=42,
-        n_estimators=100
-    )
+    if isinstance(current_data, list):
+        current_data = records_to_columns(current_data)
+    result = score_telemetry(current_data)
+    anomaly_scores = result['score']
+    flagged = np.flatnonzero(result['is_anomaly'])
+    
+    # Déterminer le type probable basé sur les features (uniquement pour les anomalies)
+    flow, energy, level = (np.asarray(current_data[c], dtype=float)[flagged] for c in ('flow', 'energy', 'level'))
+    anomaly_types = determine_anomaly_types(flow, energy, level)
+    dates = np.datetime_as_string(np.asarray(current_data['timestamp'])[flagged].astype('datetime64[D]'))
+    hours = np.asarray(current_data['hour'])[flagged]
+    stations = current_data.get('stations') or ['']
+    station_index = current_data.get('station_index', np.zeros(len(anomaly_scores), dtype=int))
     
-    model.fit(X)
-    
-    print("✓ Modèle Isolation Forest entraîné")
-    print(f"  - Données d'entraînement: {len(X)} points")
-    print(f"  - Features: flow, energy, level, hour")
+    anomalies = []
+    for i, idx in enumerate(flagged):
+        anomaly_type = str(anomaly_types[i])
+        anomalies.append({
+            'station_id': str(stations[station_index[idx]]),
+            'date': str(dates[i]),
+            'hour': int(hours[i]),
+            'type': 'ML_DETECTED',
+            'subtype': anomaly_type,
+            'description': f"Pattern anormal détecté par ML: {anomaly_type}",
+            'severity': 2,  # Moyenne par défaut
+            'anomaly_score': float(anomaly_scores[idx]),
+            'flow': float(flow[i]),
+            'energy': float(energy[i]),
+            'level': float(level[i]),
+            'detection_method': 'Isolation Forest'
+        })
     
-    return model
+    return anomalies
 
-def detect_ml_anomalies(model, current_data):
+def determine_anomaly_types(flow, energy, level):
     """
-    Détecter anomalies avec le modèle ML entraîné
-    Retourne liste d'anomalies avec score de confiance
+    Version vectorisée de determine_anomaly_type : même ordre de priorité,
+    évalué par masques sur des tableaux
     """
-    anomalies = []
-    
-    for record in current_data:
-        # Préparer features
-        features = np.array([[
-            record['flow'],
-            record['energy'],
-            record['level'],
-            record['hour']
-        ]])
-        
-        # Prédire: -1 = anomalie, 1 = normal
-        prediction = model.predict(features)[0]
-        
-        # Score d'anomalie (plus négatif = plus anormal)
-        anomaly_score = model.score_samples(features)[0]
-        
-        if prediction == -1:
-            # C'est une anomalie ML
-            # Déterminer le type probable basé sur les features
-            anomaly_type = determine_anomaly_type(record)
-            
-            anomalies.append({
-                'date': record['date'],
-                'hour': record['hour'],
-                'type': 'ML_DETECTED',
-                'subtype': anomaly_type,
-                'description': f"Pattern anormal détecté par ML: {anomaly_type}",
-                'severity': 2,  # Moyenne par défaut
-                'anomaly_score': float(anomaly_score),
-                'flow': record['flow'],
-                'energy': record['energy'],
-                'level': record['level'],
-                'detection_method': 'Isolation Forest'
-            })
-    
-    return anomalies
+    flow, energy, level = (np.asarray(x, dtype=float) for x in (flow, energy, level))
+    ratio = np.divide(energy, flow, out=np.ones_like(energy), where=flow > 0)
+    conditions = [
+        # Ratio énergie/débit anormal
+        (flow > 0) & (ratio > 1.2),
+        (flow > 0) & (ratio < 0.5),
+        # Combinaisons inhabituelles
+        (flow > 200) & (level < 35),
+        (flow < 80) & (level > 85),
+        (energy > 150) & (flow < 100)
+    ]
+    choices = [
+        "Surconsommation énergétique",
+        "Sous-consommation énergétique",
+        "Fort pompage mais niveau bas (fuite possible)",
+        "Faible pompage mais niveau haut (sur-stockage)",
+        "Forte consommation pour faible débit (inefficacité)"
+    ]
+    return np.select(conditions, choices, "Pattern inhabituel détecté")
 
 def determine_anomaly_type(record):
     """
     Essayer de déterminer le type d'anomalie basé sur les valeurs
     C'est une interprétation post-hoc pour aider les opérateurs
     """
-    flow = record['flow']
-    energy = record['energy']
-    level = record['level']
-    
-    # Ratio énergie/débit anormal
-    if flow > 0:
-        ratio = energy / flow
-        if ratio > 1.2:
-            return "Surconsommation énergétique"
-        elif ratio < 0.5:
-            return "Sous-consommation énergétique"
-    
-    # Combinaisons inhabituelles
-    if flow > 200 and level < 35:
-        return "Fort pompage mais niveau bas (fuite possible)"
-    
-    if flow < 80 and level > 85:
-        return "Faible pompage mais niveau haut (sur-stockage)"
-    
-    if energy > 150 and flow < 100:
-        return "Forte consommation pour faible débit (inefficacité)"
-    
-    return "Pattern inhabituel détecté"
+    return str(determine_anomaly_types([record['flow']], [record['energy']], [record['level']])[0])
 
-def generate_historical_data():
+def run_ml_anomaly_detection(station=DEFAULT_STATION):
     """
-    Générer données historiques 'normales' pour entraînement
-    En production, on utiliserait les vraies données ONEA
-    """
-    print("Génération données historiques pour entraînement ML...")
-    
-    historical = []
-    
-    # Simuler 30 jours de données normales
-    for day in range(30):
-        for hour in range(24):
-            # Pattern normal de consommation
-            if 6 <= hour <= 9:
-                base_flow = 220  # Pic matin
-            elif 18 <= hour <= 21:
-                base_flow = 240  # Pic soir
-            else:
-                base_flow = 150  # Normal
-            
-            # Variation aléatoire normale
-            flow = base_flow + np.random.normal(0, 15)
-            energy = flow * 0.8 + np.random.normal(0, 10)
-            level = 60 + np.random.normal(0, 10)
-            
-            historical.append({
-                'date': f'2026-02-{(day % 28) + 1:02d}',
-                'hour': hour,
-                'flow': round(flow, 1),
-                'energy': round(energy, 1),
-                'level': round(level, 1)
-            })
-    
-    print(f"✓ {len(historical)} points de données historiques générés")
-    return historical
-
-def run_ml_anomaly_detection():
-    """
-    Fonction principale: entraîner modèle et détecter anomalies
+    Fonction principale: scorer la télémétrie et détecter anomalies
     """
     print("\n" + "="*60)
     print("MODULE 3bis - DÉTECTION ANOMALIES ML (Isolation Forest)")
     print("="*60)
     
-    # 1. Générer/charger données historiques
-    historical_data = generate_historical_data()
-    
-    # 2. Entraîner le modèle
-    model = train_isolation_forest(historical_data)
-    
-    # 3. Charger données actuelles (du module 1)
-    try:
-        with open('data/historical_data.json', 'r') as f:
-            current_data = json.load(f)
-    except FileNotFoundError:
-        print("⚠ Fichier historical_data.json introuvable")
+    # 1. Charger données actuelles (du module 1, via le store télémétrie)
+    store = open_store()
+    if store.is_empty():
+        print("⚠ Aucune donnée de télémétrie (data/telemetry)")
         print("  Exécutez d'abord module1_prediction.py")
         return []
+    current_data = store.read(stations=[station])
     
-    # 4. Détecter anomalies ML
-    ml_anomalies = detect_ml_anomalies(model, current_data)
+    # 2. Détecter anomalies ML (scores partagés avec le module 3)
+    ml_anomalies = detect_ml_anomalies(current_data)
     
-    # 5. Sauvegarder résultats
-    os.makedirs('data', exist_ok=True)
-    with open('data/ml_anomalies.json', 'w') as f:
-        json.dump(ml_anomalies, f, indent=2)
+    # 3. Journaliser les nouvelles anomalies (déjà présentes d'un run précédent = ignorées)
+    added = AnomalyLog(ML_ANOMALY_LOG).append(ml_anomalies)
     
-    # 6. Afficher résumé
+    # 4. Afficher résumé
     print(f"\n✓ Détection ML terminée")
-    print(f"  - Points analysés: {len(current_data)}")
-    print(f"  - Anomalies ML détectées: {len(ml_anomalies)}")
+    print(f"  - Points analysés: {len(current_data['timestamp'])}")
+    print(f"  - Anomalies ML détectées: {len(ml_anomalies)} ({len(added)} nouvelles dans {ML_ANOMALY_LOG})")
     
     if ml_anomalies:
         print("\nAnomalies ML trouvées:")
@@ -1,105 +1,234 @@
+"""
+Module 4 - Classement des Stations (Impact Carbone & Mix Énergétique)
+Les KPI de chaque station (CO2, gasoil, couverture solaire, coût au m³) sont calculés
+à partir de la télémétrie réelle (data/telemetry) sur une fenêtre glissante de 7 jours
+Les agrégats sont des cumuls journaliers par station, mis à jour uniquement avec les
+heures arrivées depuis la dernière exécution (data/ranking_aggregates.npz)
+"""
+
 import json
+import os
 import numpy as np
+from telemetry_store import open_store
+from module2_optimization import KWH_PER_LITER, EMISSION_CO2_LITRE, telemetry_mix
+
+# Référentiel des stations ONEA (nom affiché) ; les stations inconnues gardent leur identifiant
+STATIONS = {
+    'ST_01': {'name': 'Ouagadougou Pissy', 'capacity': 500, 'solar_equipped': True},
+    'ST_02': {'name': 'Ouaga Ziga', 'capacity': 1000, 'solar_equipped': True},
+    'ST_03': {'name': 'Ouaga Sud', 'capacity': 350, 'solar_equipped': False},
+    'ST_04': {'name': 'Bobo Nasso', 'capacity': 600, 'solar_equipped': True},
+    'ST_05': {'name': 'Koudougou', 'capacity': 300, 'solar_equipped': False},
+    'ST_06': {'name': 'Banfora', 'capacity': 250, 'solar_equipped': False}
+}
+
+# Cumuls journaliers conservés par station
+AGGREGATES = ('flow_m3', 'energy_kwh', 'solar_kwh', 'sonabel_kwh', 'generator_kwh', 'cost_fcfa')
+WINDOW_DAYS = 7
+AGGREGATES_FILE = 'data/ranking_aggregates.npz'
+TOP_K = 10
+TELEMETRY_COLUMNS = ['timestamp', 'hour', 'flow', 'energy', 'solar_capacity', 'grid_status']
+
+class RankingEngine:
+    """
+    Cumuls par (station, jour) dans un tampon circulaire de WINDOW_DAYS cases :
+    une nouvelle journée recycle la case de la journée sortie de la fenêtre
+    Les KPI de toutes les stations sont recalculés en une opération vectorisée,
+    et les top-k / bottom-k obtenus par tri partiel (argpartition)
+    """
+
+    def __init__(self, window_days=WINDOW_DAYS):
+        self.window_days = window_days
+        self.station_ids = []
+        self._positions = {}
+        self.buckets = np.zeros((0, window_days, len(AGGREGATES)))
+        self.bucket_day = np.full((0, window_days), -1, dtype=np.int64)   # jour (depuis 1970) de chaque case
+        self.watermark = np.zeros(0, dtype=np.int64)                      # dernière heure agrégée (depuis 1970)
+        self._kpis = None
+
+    def __len__(self):
+        return len(self.station_ids)
+
+    def _register(self, stations):
+        """Positions des stations (les nouvelles sont ajoutées en une seule extension des tableaux)"""
+        new = [s for s in dict.fromkeys(stations) if s not in self._positions]
+        if new:
+            for s in new:
+                self._positions[s] = len(self.station_ids)
+                self.station_ids.append(s)
+            n = len(new)
+            self.buckets = np.concatenate([self.buckets, np.zeros((n,) + self.buckets.shape[1:])])
+            self.bucket_day = np.concatenate([self.bucket_day, np.full((n, self.window_days), -1, dtype=np.int64)])
+            self.watermark = np.concatenate([self.watermark, np.full(n, np.iinfo(np.int64).min)])
+        return np.array([self._positions[s] for s in stations], dtype=np.int64)
+
+    def add(self, columns, stations, station_index):
+        """
+        Agréger des heures de télémétrie (colonnes + 'stations'/'station_index' comme TelemetryStore.read)
+        Les heures déjà agrégées (antérieures au filigrane de leur station) sont ignorées
+        """
+        positions = self._register(stations)[station_index]
+        hours = np.asarray(columns['timestamp'], dtype='datetime64[h]').astype(np.int64)
+        new = hours > self.watermark[positions]
+        if not new.any():
+            return 0
+        positions, hours = positions[new], hours[new]
+        energy = np.asarray(columns['energy'], dtype=float)[new]
+        mix = telemetry_mix(energy, np.asarray(columns['solar_capacity'])[new],
+                            np.asarray(columns['grid_status'])[new], np.asarray(columns['hour'])[new])
+        values = np.column_stack([np.asarray(columns['flow'], dtype=float)[new], energy, mix['solar_kwh'],
+                                  mix['sonabel_kwh'], mix['generator_kwh'], mix['cost_fcfa']])
+
+        # Recycler les cases dont la journée est sortie de la fenêtre ; ignorer les heures trop anciennes
+        days = hours // 24
+        slots = days % self.window_days
+        cells = positions * self.window_days + slots
+        order = np.lexsort((days, cells))
+        last = np.append(cells[order][1:] != cells[order][:-1], True)
+        cell, newest = cells[order][last], days[order][last]
+        p, c = cell // self.window_days, cell % self.window_days
+        recycle = newest > self.bucket_day[p, c]
+        self.buckets[p[recycle], c[recycle]] = 0.0
+        self.bucket_day[p[recycle], c[recycle]] = newest[recycle]
+        keep = days == self.bucket_day[positions, slots]
+        np.add.at(self.buckets, (positions[keep], slots[keep]), values[keep])
+        np.maximum.at(self.watermark, positions, hours)
+        self._kpis = None
+        return int(keep.sum())
+
+    def update_from_store(self, store=None, stations=None):
+        """Agréger uniquement les heures arrivées dans le store depuis la dernière mise à jour"""
+        store = store or open_store()
+        stations = stations or store.stations()
+        known = [self.watermark[self._positions[s]] for s in stations if s in self._positions]
+        start = None
+        if known and len(known) == len(stations):
+            start = np.datetime64(int(min(known)) + 1, 'h')
+        data = store.read(stations=stations, start=start, columns=TELEMETRY_COLUMNS)
+        return self.add(data, data['stations'], data['station_index'])
+
+    def kpis(self):
+        """KPI de toutes les stations sur la fenêtre (tableaux alignés sur station_ids)"""
+        if self._kpis is None:
+            latest = self.bucket_day.max() if self.bucket_day.size else -1
+            in_window = self.bucket_day > latest - self.window_days
+            totals = (self.buckets * in_window[..., None]).sum(axis=1)
+            t = dict(zip(AGGREGATES, totals.T))
+            gasoil = t['generator_kwh'] / KWH_PER_LITER
+            with np.errstate(divide='ignore', invalid='ignore'):
+                self._kpis = {
+                    'total_flow_m3': t['flow_m3'],
+                    'total_energy_kwh': t['energy_kwh'],
+                    'solar_coverage_pct': np.where(t['energy_kwh'] > 0, t['solar_kwh'] / t['energy_kwh'] * 100, 0.0),
+                    'gasoil_liters': gasoil,
+                    'co2_emissions_kg': gasoil * EMISSION_CO2_LITRE,
+                    'total_cost_fcfa': t['cost_fcfa'],
+                    'cost_per_m3': np.where(t['flow_m3'] > 0, t['cost_fcfa'] / t['flow_m3'], np.nan)
+                }
+        return self._kpis
+
+    def top_k(self, metric, k=TOP_K, largest=True):
+        """Positions des k stations aux plus fortes (ou plus faibles) valeurs, triées : O(n + k log k)"""
+        values = self.kpis()[metric]
+        valid = np.flatnonzero(~np.isnan(values))
+        keys = -values[valid] if largest else values[valid]
+        k = min(k, len(valid))
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        part = np.argpartition(keys, k - 1)[:k] if k < len(valid) else np.arange(len(valid))
+        return valid[part[np.argsort(keys[part], kind='stable')]]
 
-def generate_stations_data():
-    print("Génération des données multi-stations (Impact Carbone & Mix Énergétique)...")
-    
-    stations =[
-        {'id': 'ST_01', 'name': 'Ouagadougou Pissy', 'capacity': 500, 'solar_equipped': True},
-        {'id': 'ST_02', 'name': 'Ouaga Ziga', 'capacity': 1000, 'solar_equipped': True},
-        {'id': 'ST_03', 'name': 'Ouaga Sud', 'capacity': 350, 'solar_equipped': False},
-        {'id': 'ST_04', 'name': 'Bobo Nasso', 'capacity': 600, 'solar_equipped': True},
-        {'id': 'ST_05', 'name': 'Koudougou', 'capacity': 300, 'solar_equipped': False},
-        {'id': 'ST_06', 'name': 'Banfora', 'capacity': 250, 'solar_equipped': False}
-    ]
-    
-    stations_data =[]
-    
-    for station in stations:
-        # Volumes hebdomadaires
-        total_flow = station['capacity'] * 24 * 7 * np.random.uniform(0.6, 0.9)
-        total_energy = total_flow * 0.8 / np.random.uniform(0.7, 1.0)
-        
-        # Mix Énergétique simulé
-        if station['solar_equipped']:
-            solar_pct = np.random.uniform(0.15, 0.35) # 15% à 35% d'énergie solaire
-            gasoil_pct = np.random.uniform(0.02, 0.05) # Peu de coupures
-        else:
-            solar_pct = 0
-            gasoil_pct = np.random.uniform(0.08, 0.15) # Forte dépendance au groupe électrogène
-            
-        sonabel_pct = 1 - solar_pct - gasoil_pct
-        
-        # Calcul des kWh
-        solar_kwh = total_energy * solar_pct
-        sonabel_kwh = total_energy * sonabel_pct
-        gasoil_kwh = total_energy * gasoil_pct
-        
-        # Coûts et Impact (Hypothèses ONEA)
-        cost_sonabel = sonabel_kwh * 85  # Prix moyen lissé
-        liters_gasoil = gasoil_kwh / 3.0
-        cost_gasoil = liters_gasoil * 675
-        
-        co2_emissions = liters_gasoil * 2.6
-        total_cost = cost_sonabel + cost_gasoil
-        
-        stations_data.append({
-            'id': station['id'],
-            'name': station['name'],
-            'total_flow_m3': round(total_flow, 0),
-            'total_energy_kwh': round(total_energy, 0),
-            'solar_coverage_pct': round(solar_pct * 100, 1),
-            'gasoil_liters': round(liters_gasoil, 0),
-            'co2_emissions_kg': round(co2_emissions, 0),
-            'total_cost_fcfa': round(total_cost, 0),
-            'cost_per_m3': round(total_cost / total_flow, 2)
-        })
-        
-    return stations_data
-
-def rank_stations(stations_data):
+    def entries(self, positions, *metrics):
+        kpis = self.kpis()
+        return [
+            dict({'rank': r + 1, 'station_id': self.station_ids[p],
+                  'station_name': STATIONS.get(self.station_ids[p], {}).get('name', self.station_ids[p])},
+                 **{m: round(float(kpis[m][p]), 2 if m == 'cost_per_m3' else 1) for m in metrics})
+            for r, p in enumerate(positions)
+        ]
+
+    # --- Persistance des agrégats (pas de relecture de l'historique d'un run à l'autre) ---
+    def save(self, path=AGGREGATES_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp, station_ids=np.array(self.station_ids), buckets=self.buckets,
+                 bucket_day=self.bucket_day, watermark=self.watermark)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=AGGREGATES_FILE, window_days=WINDOW_DAYS):
+        engine = cls(window_days)
+        if os.path.exists(path):
+            with np.load(path) as f:
+                if f['buckets'].shape[1] == window_days:
+                    engine.station_ids = f['station_ids'].tolist()
+                    engine._positions = {s: i for i, s in enumerate(engine.station_ids)}
+                    engine.buckets = f['buckets']
+                    engine.bucket_day = f['bucket_day']
+                    engine.watermark = f['watermark']
+        return engine
+
+def rank_stations(engine, k=TOP_K, schedule=None):
     print("\nClassement des stations...")
-    
+
     # 1. Les plus gros pollueurs (CO2 et Gasoil)
-    by_carbon = sorted(stations_data, key=lambda x: x['co2_emissions_kg'], reverse=True)
-    
+    by_carbon = engine.top_k('co2_emissions_kg', k)
+
     # 2. Les champions du Solaire
-    by_solar = sorted(stations_data, key=lambda x: x['solar_coverage_pct'], reverse=True)
-    
+    by_solar = engine.top_k('solar_coverage_pct', k)
+
     # 3. Les plus coûteuses au m3 produit
-    by_cost_efficiency = sorted(stations_data, key=lambda x: x['cost_per_m3'], reverse=True)
-    
+    by_cost_efficiency = engine.top_k('cost_per_m3', k)
+
+    carbon = engine.entries(by_carbon, 'co2_emissions_kg', 'gasoil_liters')
+    for entry in carbon:
+        entry['alert'] = 'URGENCE_TRANSITION_SOLAIRE' if entry['rank'] <= 2 and entry['co2_emissions_kg'] > 0 else 'NORMAL'
+
     ranking = {
-        'by_carbon_footprint':[
-            {
-                'rank': i+1, 'station_name': s['name'], 
-                'co2_emissions_kg': s['co2_emissions_kg'],
-                'gasoil_liters': s['gasoil_liters'],
-                'alert': 'URGENCE_TRANSITION_SOLAIRE' if i < 2 else 'NORMAL'
-            } for i, s in enumerate(by_carbon)
-        ],
-        'by_solar_efficiency':[
-            {
-                'rank': i+1, 'station_name': s['name'], 
-                'solar_coverage_pct': s['solar_coverage_pct']
-            } for i, s in enumerate(by_solar)
-        ],
-        'by_cost_efficiency': [
-            {
-                'rank': i+1, 'station_name': s['name'], 
-                'cost_per_m3': s['cost_per_m3']
-            } for i, s in enumerate(by_cost_efficiency)
-        ],
-        'detailed_data': stations_data
+        'window_days': engine.window_days,
+        'stations_count': len(engine),
+        'by_carbon_footprint': carbon,
+        'by_solar_efficiency': engine.entries(by_solar, 'solar_coverage_pct'),
+        'by_cost_efficiency': engine.entries(by_cost_efficiency, 'cost_per_m3'),
+        # Les meilleurs élèves (bilan carbone, coût) et les stations les moins solarisées
+        'bottom': {
+            'co2_emissions_kg': engine.entries(engine.top_k('co2_emissions_kg', k, largest=False), 'co2_emissions_kg'),
+            'solar_coverage_pct': engine.entries(engine.top_k('solar_coverage_pct', k, largest=False), 'solar_coverage_pct'),
+            'cost_per_m3': engine.entries(engine.top_k('cost_per_m3', k, largest=False), 'cost_per_m3')
+        }
     }
-    
+    if schedule:
+        # Planning publié (24h à venir) de la station optimisée par le module 2
+        ranking['planned_24h'] = {
+            'cost_fcfa': round(sum(s['cost_fcfa'] for s in schedule), 0),
+            'solar_kwh': round(sum(s['mix_solar_kwh'] for s in schedule), 1),
+            'gasoil_liters': round(sum(s['gasoil_used_liters'] for s in schedule), 1),
+            'co2_emissions_kg': round(sum(s['co2_emissions_kg'] for s in schedule), 1)
+        }
+
+    os.makedirs('data', exist_ok=True)
     with open('data/stations_ranking.json', 'w') as f:
         json.dump(ranking, f, indent=2)
-        
-    print(" Classement sauvegardé (Focus Carbone et Solaire)")
+
+    print(f" Classement sauvegardé ({len(engine)} stations, fenêtre {engine.window_days} jours)")
     return ranking
 
+def run_ranking():
+    """Étape complète du module 4 (mise à jour incrémentale des agrégats + classement), utilisée par le pipeline"""
+    print("Agrégation de la télémétrie multi-stations (Impact Carbone & Mix Énergétique)...")
+    engine = RankingEngine.load()
+    added = engine.update_from_store()
+    engine.save()
+    print(f"✓ {added} nouvelles heures agrégées")
+    if len(engine) < len(STATIONS):
+        print(f"  (astuce : python modules/module1_prediction.py --stations {len(STATIONS)} --days 30 "
+              f"--store --out data/telemetry pour simuler tout le réseau)")
+    schedule = None
+    if os.path.exists('data/pump_schedule.json'):
+        with open('data/pump_schedule.json', 'r') as f:
+            schedule = json.load(f)
+    return rank_stations(engine, schedule=schedule)
+
 if __name__ == '__main__':
-    data = generate_stations_data()
-    rank_stations(data)
-    print("="*50 + "\nMODULE 4 TERMINÉ\n" + "="*50)
\ No newline at end of file
+    run_ranking()
+    print("="*50 + "\nMODULE 4 TERMINÉ\n" + "="*50)
@@ -0,0 +1,229 @@
+"""
+Orchestrateur du Pipeline ONEA (exécution nocturne des modules 1 à 4)
+Le graphe des étapes est lu dans algorithms/system_architecture.json ('dependencies'
++ bloc 'pipeline' de chaque module). Les étapes sont importées et exécutées dans le
+même processus, les résultats passés en mémoire ; les étapes indépendantes tournent
+en parallèle et une étape est sautée si l'empreinte de ses entrées n'a pas changé
+depuis sa dernière exécution réussie
+Chaque run est instrumenté : durée et volume par étape, octets lus/écrits par artefact
+(instantané Prometheus data/pipeline_metrics.json, servi par /metrics) et journal
+structuré des événements (data/logs/pipeline.ndjson)
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from metrics import (REGISTRY, DURATION_BUCKETS, ARTIFACT_READ_BYTES, ARTIFACT_WRITTEN_BYTES,
+                     path_size, log_event)
+
+ARCHITECTURE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'algorithms',
+                                 'system_architecture.json')
+STATE_FILE = 'data/pipeline_state.json'
+METRICS_FILE = 'data/pipeline_metrics.json'
+
+STAGE_SECONDS = REGISTRY.histogram('onea_stage_duration_seconds', "Durée d'exécution des étapes du pipeline",
+                                   ('stage',), DURATION_BUCKETS)
+STAGE_RUNS = REGISTRY.counter('onea_stage_runs_total', "Étapes du pipeline par statut", ('stage', 'status'))
+STAGE_RECORDS = REGISTRY.gauge('onea_stage_records', "Enregistrements produits par la dernière exécution de l'étape",
+                               ('stage',))
+PIPELINE_SECONDS = REGISTRY.gauge('onea_pipeline_last_duration_seconds', "Durée du dernier run du pipeline")
+PIPELINE_FINISHED = REGISTRY.gauge('onea_pipeline_last_finished_timestamp_seconds',
+                                   "Fin du dernier run du pipeline (horodatage Unix)")
+PIPELINE_FAILED = REGISTRY.gauge('onea_pipeline_last_failed_stages', "Étapes en échec ou bloquées au dernier run")
+
+def load_stages(path=ARCHITECTURE_FILE):
+    """Étapes exécutables (modules ayant un bloc 'pipeline') -> {nom: description}"""
+    with open(path, 'r') as f:
+        modules = json.load(f)['modules']
+    stages = {}
+    for name, module in modules.items():
+        if 'pipeline' not in module:
+            continue
+        stages[name] = dict(module['pipeline'], dependencies=[d for d in module.get('dependencies', [])
+                                                             if 'pipeline' in modules.get(d, {})])
+    _check_acyclic(stages)
+    return stages
+
+def _check_acyclic(stages):
+    done, visiting = set(), set()
+
+    def visit(name):
+        if name in visiting:
+            raise ValueError(f"Dépendance circulaire dans le pipeline : {name}")
+        if name not in done:
+            visiting.add(name)
+            for dep in stages[name]['dependencies']:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+    for name in stages:
+        visit(name)
+
+def input_fingerprint(stage):
+    """
+    Empreinte des entrées d'une étape : contenu des fichiers déclarés, (taille, date) des
+    fichiers d'un dossier déclaré (store télémétrie), et source du module (un changement
+    de code ré-exécute l'étape)
+    """
+    h = hashlib.sha1()
+    module_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), stage['entrypoint'].split(':')[0] + '.py')
+    for path in [module_file] + stage.get('inputs', []):
+        h.update(path.encode())
+        if os.path.isdir(path):
+            for root, dirs, files in sorted(os.walk(path)):
+                dirs.sort()
+                for filename in sorted(files):
+                    st = os.stat(os.path.join(root, filename))
+                    h.update(f"{os.path.relpath(os.path.join(root, filename), path)}:{st.st_size}:{st.st_mtime_ns}".encode())
+        elif os.path.exists(path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        else:
+            h.update(b'<absent>')
+    return h.hexdigest()
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, path)
+
+def record_count(result):
+    """Enregistrements produits par une étape : liste publiée, nombre retourné ou stations classées"""
+    if isinstance(result, dict):
+        return int(result.get('stations_count', len(result)))
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return int(result) if isinstance(result, (int, float)) else 0
+
+def _run_stage(name, stage, results):
+    module_name, function_name = stage['entrypoint'].split(':')
+    function = getattr(importlib.import_module(module_name), function_name)
+    # Résultats en mémoire des étapes amont exécutées dans ce run (sinon l'étape relit ses fichiers)
+    kwargs = {arg: results[dep] for arg, dep in stage.get('args', {}).items() if dep in results}
+    start = time.perf_counter()
+    result = function(**kwargs)
+    return result, time.perf_counter() - start
+
+def _record_stage(run_id, name, stage, status, duration=None, result=None, error=None):
+    """Métriques et événement de journal d'une étape terminée (ou sautée / bloquée)"""
+    STAGE_RUNS.inc(stage=name, status=status)
+    fields = {'run_id': run_id, 'stage': name, 'status': status}
+    if duration is not None:
+        STAGE_SECONDS.observe(duration, stage=name)
+        fields['duration_s'] = round(duration, 3)
+    if status == 'exécutée':
+        records = record_count(result)
+        STAGE_RECORDS.set(records, stage=name)
+        fields['records'] = records
+        fields['bytes_read'], fields['bytes_written'] = {}, {}
+        for path in stage.get('inputs', []):
+            fields['bytes_read'][path] = size = path_size(path)
+            ARTIFACT_READ_BYTES.inc(size, artifact=path)
+        for path in stage.get('outputs', []):
+            fields['bytes_written'][path] = size = path_size(path)
+            ARTIFACT_WRITTEN_BYTES.inc(size, artifact=path)
+    if error is not None:
+        fields['error'] = error
+    log_event('pipeline', 'stage', **fields)
+
+def run_pipeline(stages=None, force=False, workers=None, state_path=STATE_FILE):
+    """
+    Exécuter le graphe : chaque étape démarre dès que ses dépendances sont terminées
+    Retourne {étape: 'exécutée' | 'sautée' | 'échec' | 'bloquée'}
+    """
+    stages = stages or load_stages()
+    state = load_state(state_path)
+    results, status = {}, {}
+    pending = dict(stages)
+    running = {}
+    started = time.perf_counter()
+    run_id = uuid.uuid4().hex[:12]
+    log_event('pipeline', 'run_start', run_id=run_id, stages=list(stages), force=force)
+
+    with ThreadPoolExecutor(max_workers=workers or len(stages)) as pool:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                deps = stage['dependencies']
+                if any(status.get(d) in ('échec', 'bloquée') for d in deps):
+                    status[name] = 'bloquée'
+                    del pending[name]
+                    print(f"✗ {name} : bloquée (dépendance en échec)")
+                    _record_stage(run_id, name, stage, 'bloquée')
+                    continue
+                if not all(d in status for d in deps):
+                    continue
+                del pending[name]
+                fingerprint = input_fingerprint(stage)
+                previous = state.get(name, {})
+                outputs_ok = all(os.path.exists(p) for p in stage.get('outputs', []))
+                if (not force and not stage.get('always_run') and outputs_ok
+                        and previous.get('input_hash') == fingerprint):
+                    status[name] = 'sautée'
+                    print(f"↷ {name} : entrées inchangées, étape sautée")
+                    _record_stage(run_id, name, stage, 'sautée')
+                    continue
+                print(f"▶ {name}")
+                running[pool.submit(_run_stage, name, stage, results)] = (name, fingerprint)
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Dépendances introuvables : {', '.join(pending)}")
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, fingerprint = running.pop(future)
+                try:
+                    results[name], duration = future.result()
+                except Exception as e:
+                    status[name] = 'échec'
+                    print(f"✗ {name} : {type(e).__name__}: {e}")
+                    _record_stage(run_id, name, stages[name], 'échec', error=f"{type(e).__name__}: {e}")
+                    continue
+                status[name] = 'exécutée'
+                _record_stage(run_id, name, stages[name], 'exécutée', duration, results[name])
+                state[name] = {
+                    'input_hash': fingerprint,
+                    'finished_at': datetime.now().isoformat(timespec='seconds'),
+                    'duration_s': round(duration, 3)
+                }
+                save_state(state, state_path)
+                print(f"✓ {name} ({duration:.2f} s)")
+
+    elapsed = time.perf_counter() - started
+    failed = sum(s in ('échec', 'bloquée') for s in status.values())
+    PIPELINE_SECONDS.set(elapsed)
+    PIPELINE_FINISHED.set(time.time())
+    PIPELINE_FAILED.set(failed)
+    REGISTRY.write_snapshot(METRICS_FILE)
+    log_event('pipeline', 'run_end', run_id=run_id, duration_s=round(elapsed, 3), status=status, failed=failed)
+    print(f"\nPipeline terminé en {elapsed:.2f} s : " + ", ".join(f"{n} {s}" for n, s in status.items()))
+    return status
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Pipeline ONEA (modules 1 à 4)")
+    parser.add_argument('--force', action='store_true', help="Ré-exécuter toutes les étapes")
+    parser.add_argument('--workers', type=int, help="Nombre maximal d'étapes simultanées")
+    parser.add_argument('--only', nargs='+', metavar='ETAPE', help="Limiter le run à ces étapes")
+    args = parser.parse_args()
+    stages = load_stages()
+    if args.only:
+        stages = {n: dict(s, dependencies=[d for d in s['dependencies'] if d in args.only])
+                  for n, s in stages.items() if n in args.only}
+    status = run_pipeline(stages, force=args.force, workers=args.workers)
+    raise SystemExit(1 if any(s in ('échec', 'bloquée') for s in status.values()) else 0)
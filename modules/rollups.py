@@ -0,0 +1,210 @@
+"""
+Agrégats Temporels Matérialisés (horaire -> journalier -> hebdomadaire -> mensuel)
+Par station : débit, énergie, niveau, mix énergétique, coût et CO2
+    data/rollups/<station>/daily.npz, weekly.npz, monthly.npz
+Le niveau journalier est mis à jour de façon incrémentale (seules les heures arrivées
+depuis la dernière mise à jour sont lues) ; les niveaux hebdomadaire et mensuel sont
+recalculés à partir des journées (quelques centaines de lignes)
+Les séries longues sont réduites à la largeur du graphique par LTTB
+(Largest-Triangle-Three-Buckets), qui conserve les pics et creux de la courbe
+"""
+
+import os
+import numpy as np
+from telemetry_store import open_store, DEFAULT_STATION
+from module2_optimization import telemetry_mix
+
+ROLLUP_DIR = 'data/rollups'
+LEVELS = ('hourly', 'daily', 'weekly', 'monthly')
+HOURS_PER_PERIOD = {'hourly': 1, 'daily': 24, 'weekly': 24 * 7, 'monthly': 24 * 30}
+# Cumuls (sommes) par période ; le niveau réservoir est moyenné (level_pct) et son minimum conservé
+SUM_METRICS = ('flow_m3', 'energy_kwh', 'solar_kwh', 'sonabel_kwh', 'generator_kwh', 'cost_fcfa', 'co2_kg')
+METRICS = SUM_METRICS + ('level_pct', 'level_min')
+TELEMETRY_COLUMNS = ['timestamp', 'hour', 'flow', 'energy', 'level', 'solar_capacity', 'grid_status']
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+def hourly_values(columns):
+    """Valeurs horaires de toutes les métriques à partir des colonnes de télémétrie"""
+    mix = telemetry_mix(columns['energy'], columns['solar_capacity'], columns['grid_status'], columns['hour'])
+    level = np.asarray(columns['level'], dtype=float)
+    return {
+        'flow_m3': np.asarray(columns['flow'], dtype=float),
+        'energy_kwh': np.asarray(columns['energy'], dtype=float),
+        'solar_kwh': mix['solar_kwh'],
+        'sonabel_kwh': mix['sonabel_kwh'],
+        'generator_kwh': mix['generator_kwh'],
+        'cost_fcfa': mix['cost_fcfa'],
+        'co2_kg': mix['co2_kg'],
+        'level_sum': level,
+        'level_min': level,
+        'hours': np.ones(len(level))
+    }
+
+def _reduce(period, values):
+    """Regrouper des lignes triées par période (sommes, minimum du niveau)"""
+    if len(period) == 0:
+        return period, values
+    starts = np.flatnonzero(np.r_[True, period[1:] != period[:-1]])
+    reduced = {k: np.add.reduceat(v, starts) for k, v in values.items() if k != 'level_min'}
+    reduced['level_min'] = np.minimum.reduceat(values['level_min'], starts)
+    return period[starts], reduced
+
+def week_start(days):
+    """Lundi de la semaine de chaque jour (le 1er janvier 1970 était un jeudi)"""
+    days = np.asarray(days, dtype='datetime64[D]')
+    return days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+
+def month_start(days):
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype('datetime64[D]')
+
+class Rollups:
+    """Accès aux agrégats matérialisés ; chaque fichier est relu uniquement s'il a changé"""
+
+    def __init__(self, root=ROLLUP_DIR):
+        self.root = root
+        self._cache = {}   # chemin -> ((mtime, taille), contenu)
+
+    def _path(self, station, level):
+        return os.path.join(self.root, station, f'{level}.npz')
+
+    def load(self, station, level):
+        """dict : 'period' (datetime64[D], début de période) + cumuls ; None si absent"""
+        path = self._path(station, level)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (st.st_mtime_ns, st.st_size)
+        cached = self._cache.get(path)
+        if cached is None or cached[0] != version:
+            with np.load(path) as f:
+                cached = (version, {k: f[k] for k in f.files})
+            self._cache[path] = cached
+        return cached[1]
+
+    def _save(self, station, level, data):
+        path = self._path(station, level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp, **data)
+        os.replace(tmp, path)
+
+    def update(self, store=None, stations=None):
+        """Intégrer les nouvelles heures du store ; retourne le nombre d'heures agrégées"""
+        store = store or open_store()
+        added = 0
+        for station in stations or store.stations():
+            daily = self.load(station, 'daily')
+            start = None if daily is None else np.datetime64(int(daily['watermark']) + 1, 'h')
+            columns = store.read(stations=[station], start=start, columns=TELEMETRY_COLUMNS)
+            if len(columns['timestamp']) == 0:
+                continue
+            days, values = _reduce(columns['timestamp'].astype('datetime64[D]'), hourly_values(columns))
+            if daily is not None:
+                # Concaténer puis regrouper : la dernière journée déjà agrégée peut être complétée
+                old = {k: daily[k] for k in values}
+                days, values = _reduce(np.concatenate([daily['period'], days]),
+                                       {k: np.concatenate([old[k], values[k]]) for k in values})
+            watermark = np.datetime64(columns['timestamp'][-1], 'h').astype(np.int64)
+            self._save(station, 'daily', dict(values, period=days, watermark=watermark))
+            for level, to_period in (('weekly', week_start), ('monthly', month_start)):
+                period, reduced = _reduce(to_period(days), values)
+                self._save(station, level, dict(reduced, period=period))
+            added += len(columns['timestamp'])
+        return added
+
+    def series(self, station, level, start=None, end=None, store=None):
+        """
+        (temps datetime64[h], {métrique: valeurs}) pour une plage [start, end[
+        Le niveau horaire est lu directement dans le store télémétrie
+        """
+        start = None if start is None else np.datetime64(start, 'h')
+        end = None if end is None else np.datetime64(end, 'h')
+        if level == 'hourly':
+            columns = (store or open_store()).read(stations=[station], start=start, end=end, columns=TELEMETRY_COLUMNS)
+            t, values = columns['timestamp'], hourly_values(columns)
+        else:
+            data = self.load(station, level)
+            if data is None:
+                return np.empty(0, dtype='datetime64[h]'), {m: np.empty(0) for m in METRICS}
+            t = data['period'].astype('datetime64[h]')
+            lo = 0 if start is None else int(np.searchsorted(t, start, side='left'))
+            hi = len(t) if end is None else int(np.searchsorted(t, end, side='left'))
+            t, values = t[lo:hi], {k: data[k][lo:hi] for k in ('level_sum', 'hours', 'level_min') + SUM_METRICS}
+        result = {m: values[m] for m in SUM_METRICS + ('level_min',)}
+        result['level_pct'] = values['level_sum'] / np.maximum(values['hours'], 1)
+        return t, result
+
+    def span(self, station):
+        """Première et dernière heure disponibles pour une station (d'après le niveau journalier)"""
+        daily = self.load(station, 'daily')
+        if daily is None or len(daily['period']) == 0:
+            return None, None
+        return daily['period'][0].astype('datetime64[h]'), np.datetime64(int(daily['watermark']), 'h')
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets : indices des `threshold` points qui conservent
+    au mieux la forme de la courbe (premier et dernier point toujours conservés)
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.nan_to_num(np.asarray(y, dtype=float))
+    edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = edges[i + 1], edges[i + 2]
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def history(rollups, station=DEFAULT_STATION, start=None, end=None, metrics=('energy_kwh',),
+            points=DEFAULT_POINTS, store=None):
+    """
+    Série d'une plage quelconque à la résolution adaptée à `points` (largeur du graphique) :
+    niveau le plus fin dont le nombre de périodes reste raisonnable, puis LTTB si nécessaire
+    """
+    unknown = set(metrics) - set(METRICS)
+    if unknown:
+        raise ValueError(f"métrique inconnue : {', '.join(sorted(unknown))} (valeurs : {', '.join(METRICS)})")
+    points = min(max(3, int(points)), MAX_POINTS)
+    first, last = rollups.span(station)
+    if first is None:
+        return {'station': station, 'level': None, 'points': 0, 'series': {}}
+    lo = first if start is None else max(first, np.datetime64(start, 'h'))
+    hi = last + 1 if end is None else min(last + 1, np.datetime64(end, 'h'))
+    hours = max(int((hi - lo).astype(int)), 1)
+    # Niveau le plus fin qui ne dépasse pas 4 fois la largeur demandée (LTTB réduit ensuite)
+    level = next((l for l in LEVELS if hours / HOURS_PER_PERIOD[l] <= 4 * points), 'monthly')
+    t, values = rollups.series(station, level, lo, hi, store=store)
+
+    series = {}
+    x = t.astype(np.int64)
+    for metric in metrics:
+        keep = lttb(x, values[metric], points)
+        series[metric] = {
+            't': np.datetime_as_string(t[keep], unit='h').tolist(),
+            'v': np.round(values[metric][keep], 2).tolist()
+        }
+    return {
+        'station': station, 'level': level, 'start': str(lo), 'end': str(hi),
+        'periods': int(len(t)), 'points': int(min(points, len(t))), 'series': series
+    }
+
+def update_rollups():
+    """Étape du pipeline : intégrer les nouvelles heures de télémétrie dans les agrégats"""
+    print("Mise à jour des agrégats temporels (journalier, hebdomadaire, mensuel)...")
+    added = Rollups().update()
+    print(f"✓ {added} heures agrégées")
+    return added
+
+if __name__ == '__main__':
+    update_rollups()
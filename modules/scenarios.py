@@ -0,0 +1,162 @@
+"""
+Moteur de Scénarios Monte Carlo - Robustesse du planning de pompage
+Tire des milliers de futurs possibles (coupures SONABEL, ensoleillement, demande)
+à partir des statistiques de la télémétrie historique, puis évalue un planning
+sur tous les scénarios à la fois (tableaux scénarios × heures)
+"""
+
+import json
+import numpy as np
+from telemetry_store import open_store, DEFAULT_STATION
+from module2_optimization import (
+    DP_ACTIONS, CONSUMPTION_RATE, NIVEAU_MIN, NIVEAU_MAX, NIVEAU_CRITIQUE,
+    KWH_PER_LITER, EMISSION_CO2_LITRE, energy_mix, predictions_to_arrays
+)
+
+# Taux de pompage -> multiplicateur de débit (mêmes couples que les stratégies de pompage)
+FLOW_FACTORS = {rate: factor for _, rate, factor in DP_ACTIONS}
+
+class ScenarioModel:
+    """
+    Statistiques historiques d'une station :
+    - coupures : chaîne de Markov par heure (P(coupure), P(coupure | coupure l'heure précédente))
+    - solaire et demande : profils journaliers relatifs (ratio à la moyenne horaire), tirés jour par jour
+      pour conserver la corrélation entre les heures d'une même journée
+    """
+
+    def __init__(self, outage_start, outage_persist, solar_days, energy_days, flow_days):
+        self.outage_start = outage_start      # P(coupure à h | réseau OK à h-1), (24,)
+        self.outage_persist = outage_persist  # P(coupure à h | coupure à h-1), (24,)
+        self.solar_days = solar_days          # ratios solaires journaliers (J, 24)
+        self.energy_days = energy_days        # ratios d'énergie journaliers (J, 24)
+        self.flow_days = flow_days            # ratios de débit (demande en eau) journaliers (J, 24)
+
+    @classmethod
+    def fit(cls, columns):
+        """
+        Estimer le modèle à partir des colonnes de télémétrie (jours complets uniquement)
+        ValueError si la fenêtre ne contient aucun jour complet (store vide ou trop récent)
+        """
+        midnight = np.flatnonzero(np.asarray(columns['hour']) == 0)
+        first = int(midnight[0]) if len(midnight) else len(columns['hour'])
+        n_days = (len(columns['hour']) - first) // 24
+        if n_days == 0:
+            raise ValueError(f"aucun jour complet de télémétrie ({len(columns['hour'])} heures) : "
+                             "impossible d'estimer les scénarios")
+        rows = slice(first, first + n_days * 24)
+        day = lambda c: np.asarray(columns[c][rows], dtype=float).reshape(n_days, 24)
+
+        outage = day('grid_status') == 0
+        previous = np.roll(outage.ravel(), 1).reshape(n_days, 24)
+        previous.flat[0] = False
+        started = (outage & ~previous).sum(axis=0)
+        persisted = (outage & previous).sum(axis=0)
+        outage_start = (started + 0.5) / ((~previous).sum(axis=0) + 1)
+        outage_persist = (persisted + 0.5) / (previous.sum(axis=0) + 1)
+
+        def ratios(values):
+            mean = values.mean(axis=0)
+            return np.divide(values, mean, out=np.ones_like(values), where=mean > 0)
+
+        return cls(outage_start, outage_persist, ratios(day('solar_capacity')),
+                   ratios(day('energy')), ratios(day('flow')))
+
+    def sample(self, n_scenarios, hours, seed=None):
+        """
+        Tirer n scénarios pour les heures données (tableau des heures de la journée, longueur H)
+        Retourne un dict de tableaux (n, H) : grid_ok, solar_factor, energy_factor, flow_factor
+        """
+        rng = np.random.default_rng(seed)
+        hours = np.asarray(hours)
+        horizon = len(hours)
+        day_index = np.cumsum(np.r_[0, hours[1:] < hours[:-1]])
+
+        # Coupures : chaîne de Markov, vectorisée sur les scénarios
+        uniform = rng.random((n_scenarios, horizon))
+        outage = np.zeros((n_scenarios, horizon), dtype=bool)
+        state = np.zeros(n_scenarios, dtype=bool)
+        for t, h in enumerate(hours):
+            p = np.where(state, self.outage_persist[h], self.outage_start[h])
+            state = uniform[:, t] < p
+            outage[:, t] = state
+
+        # Profils solaire / demande : un jour historique tiré au hasard par jour d'horizon
+        picks = rng.integers(0, len(self.solar_days), (n_scenarios, day_index[-1] + 1))[:, day_index]
+        return {
+            'grid_ok': ~outage,
+            'solar_factor': self.solar_days[picks, hours],
+            'energy_factor': self.energy_days[picks, hours],
+            'flow_factor': self.flow_days[picks, hours]
+        }
+
+def evaluate_schedule(schedule, predictions, scenarios, initial_level=65.0, critical_level=NIVEAU_CRITIQUE):
+    """
+    Rejouer un planning (pump_rate par heure) sur tous les scénarios à la fois
+    Le taux de pompage est fixé par le planning ; le mix, les coûts et le niveau dépendent du scénario
+    """
+    inputs = predictions_to_arrays(predictions)
+    rates = np.array([p['pump_rate'] for p in schedule], dtype=float)
+    flow_factor = np.array([FLOW_FACTORS.get(int(r), r / 100) for r in rates])
+
+    energy_used = inputs['energy'] * rates / 100 * scenarios['energy_factor']
+    solar = inputs['solar'] * scenarios['solar_factor']
+    _, _, generator, cost = energy_mix(energy_used, solar, scenarios['grid_ok'], inputs['price'])
+    gasoil = generator / KWH_PER_LITER
+
+    # Niveau : le débit pompé suit le planning, la consommation aval suit le scénario de demande
+    delta = (inputs['flow'] * flow_factor - CONSUMPTION_RATE * scenarios['flow_factor']) / 10
+    level = np.full(len(delta), float(initial_level))
+    min_level = level.copy()
+    for t in range(delta.shape[1]):
+        level = np.clip(level + delta[:, t], NIVEAU_MIN, NIVEAU_MAX)
+        min_level = np.minimum(min_level, level)
+
+    return {
+        'cost_fcfa': cost.sum(axis=1),
+        'gasoil_liters': gasoil.sum(axis=1),
+        'co2_kg': gasoil.sum(axis=1) * EMISSION_CO2_LITRE,
+        'min_level': min_level,
+        'below_critical': min_level < critical_level
+    }
+
+def summarize(results, percentiles=(5, 50, 95)):
+    """Percentiles des coûts/CO2/gasoil et probabilité de passer sous le niveau critique"""
+    summary = {'scenarios': int(len(results['cost_fcfa']))}
+    for key in ('cost_fcfa', 'gasoil_liters', 'co2_kg', 'min_level'):
+        values = np.percentile(results[key], percentiles)
+        summary[key] = {f'p{p}': round(float(v), 1) for p, v in zip(percentiles, values)}
+    summary['prob_below_critical'] = round(float(results['below_critical'].mean()), 4)
+    return summary
+
+def run_scenarios(n_scenarios=10000, station=DEFAULT_STATION, seed=42):
+    """Évaluer le planning publié (pump_schedule.json) sur n scénarios tirés de l'historique"""
+    print(f"Simulation Monte Carlo du planning ({n_scenarios} scénarios)...")
+    with open('data/predictions.json', 'r') as f:
+        predictions = json.load(f)
+    with open('data/pump_schedule.json', 'r') as f:
+        schedule = json.load(f)
+
+    columns = open_store().read(stations=[station], columns=['hour', 'grid_status', 'solar_capacity', 'energy', 'flow'])
+    model = ScenarioModel.fit(columns)
+    scenarios = model.sample(n_scenarios, [p['hour'] for p in predictions], seed=seed)
+    summary = summarize(evaluate_schedule(schedule, predictions, scenarios))
+
+    print(f"  - Coût (FCFA) p5/p50/p95 : {summary['cost_fcfa']['p5']:.0f} / "
+          f"{summary['cost_fcfa']['p50']:.0f} / {summary['cost_fcfa']['p95']:.0f}")
+    print(f"  - Gasoil (L) p50/p95 : {summary['gasoil_liters']['p50']} / {summary['gasoil_liters']['p95']}")
+    print(f"  - CO2 (kg) p50/p95 : {summary['co2_kg']['p50']} / {summary['co2_kg']['p95']}")
+    print(f"  - Probabilité niveau < {NIVEAU_CRITIQUE}% : {summary['prob_below_critical'] * 100:.1f}%")
+    return summary
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Robustesse du planning de pompage (Monte Carlo)")
+    parser.add_argument('--n', type=int, default=10000, help="Nombre de scénarios")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    try:
+        run_scenarios(args.n, seed=args.seed)
+    except ValueError as e:
+        print(f"✗ {e}")
+        print("  Exécutez d'abord module1_prediction.py")
+        raise SystemExit(1)
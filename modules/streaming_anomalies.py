@@ -0,0 +1,173 @@
+"""
+Détection d'Anomalies en Flux (temps réel)
+Consomme la télémétrie enregistrement par enregistrement (ou par micro-lots) depuis
+un générateur ou une file d'attente, et lève une alerte dès qu'une règle experte
+du module 3 ou qu'un écart statistique se déclenche
+État borné : quelques tableaux de 24 valeurs (une par heure de la journée) par station
+"""
+
+import queue
+import time
+from datetime import datetime
+import numpy as np
+from module3_anomalies import (
+    RULE_LABELS, load_thresholds, resolve_thresholds, evaluate_rules, severity_label
+)
+
+EWMA_ALPHA = 0.05        # poids d'une nouvelle mesure dans les moyennes/variances glissantes
+WARMUP_COUNT = 5         # mesures minimales par (station, heure) avant de tester les écarts
+Z_THRESHOLD = 4.0        # écart (en écarts-types) déclenchant une alerte statistique
+STAT_SCORE = 2
+
+STAT_LABELS = {
+    'flow': 'DEVIATION_STATISTIQUE_DEBIT',
+    'ratio': 'DEVIATION_RATIO_ENERGIE_DEBIT'
+}
+
+class StationState:
+    """Statistiques glissantes d'une station, indexées par heure de la journée (O(1) par mesure)"""
+
+    def __init__(self):
+        self.count = np.zeros(24, dtype=np.int64)
+        self.mean = {k: np.zeros(24) for k in STAT_LABELS}
+        self.var = {k: np.zeros(24) for k in STAT_LABELS}
+
+    def zscores(self, hour, values):
+        """Écart normalisé de chaque mesure par rapport à la moyenne glissante de son heure"""
+        ready = self.count[hour] >= WARMUP_COUNT
+        return {k: np.where(ready, (values[k] - self.mean[k][hour]) / np.sqrt(self.var[k][hour] + 1e-9), 0.0)
+                for k in STAT_LABELS}
+
+    def update(self, hour, values):
+        """Moyenne et variance exponentielles (EWMA), avec amorçage par moyenne simple"""
+        for i, h in enumerate(hour):
+            self.count[h] += 1
+            alpha = max(EWMA_ALPHA, 1 / self.count[h])
+            for k in STAT_LABELS:
+                diff = values[k][i] - self.mean[k][h]
+                self.mean[k][h] += alpha * diff
+                self.var[k][h] = (1 - alpha) * (self.var[k][h] + alpha * diff * diff)
+
+class StreamingDetector:
+    """Règles expertes du module 3 + écarts statistiques par (station, heure de la journée)"""
+
+    def __init__(self, thresholds=None):
+        self.config = thresholds or load_thresholds()
+        self.states = {}
+
+    def process(self, records):
+        """
+        Traiter un enregistrement (dict) ou un micro-lot (liste de dicts) -> liste d'alertes
+        Les règles sont évaluées en masques sur le lot ; les statistiques sont testées
+        avant d'être mises à jour avec les nouvelles mesures
+        """
+        if isinstance(records, dict):
+            records = [records]
+        if not records:
+            return []
+        data = {k: np.array([r.get(k, 1 if k == 'grid_status' else 0) for r in records])
+                for k in ('hour', 'flow', 'energy', 'level', 'grid_status', 'solar_capacity')}
+        station_ids = [r.get('station_id', 'ST_01') for r in records]
+        stations = sorted(set(station_ids))
+        station_index = np.array([stations.index(s) for s in station_ids])
+
+        masks, scores = evaluate_rules(data, resolve_thresholds(self.config, stations, station_index))
+        values = {'flow': data['flow'], 'ratio': data['energy'] / np.maximum(data['flow'], 1)}
+        deviations = np.zeros((len(STAT_LABELS), len(records)), dtype=bool)
+        for s, station in enumerate(stations):
+            rows = np.flatnonzero(station_index == s)
+            state = self.states.setdefault(station, StationState())
+            hour = data['hour'][rows]
+            station_values = {k: v[rows] for k, v in values.items()}
+            z = state.zscores(hour, station_values)
+            for j, k in enumerate(STAT_LABELS):
+                deviations[j, rows] = np.abs(z[k]) > Z_THRESHOLD
+            state.update(hour, station_values)
+
+        scores = scores + STAT_SCORE * deviations.any(axis=0)
+        stat_labels = np.array(list(STAT_LABELS.values()))
+        now = datetime.now().isoformat(timespec='milliseconds')
+        alerts = []
+        for i in np.flatnonzero(scores > 0):
+            record = records[i]
+            score = int(scores[i])
+            alerts.append({
+                'station_id': station_ids[i],
+                'date': record.get('date'),
+                'hour': int(data['hour'][i]),
+                'flow': float(data['flow'][i]),
+                'energy': float(data['energy'][i]),
+                'level': float(data['level'][i]),
+                'grid_status': int(data['grid_status'][i]),
+                'alerts': RULE_LABELS[masks[:, i]].tolist() + stat_labels[deviations[:, i]].tolist(),
+                'severity_score': score,
+                'severity': severity_label(score),
+                'detection_method': 'STREAMING',
+                'detected_at': now
+            })
+        return alerts
+
+    def run(self, source, on_alert=print, max_batch=100, max_wait=0.2):
+        """
+        Consommer une source de télémétrie : itérable (générateur) ou queue.Queue (None = fin du flux)
+        Les mesures sont regroupées en micro-lots d'au plus max_batch enregistrements
+        ou max_wait secondes, pour borner la latence d'alerte
+        """
+        n_records = n_alerts = 0
+        for batch in _micro_batches(source, max_batch, max_wait):
+            for alert in self.process(batch):
+                on_alert(alert)
+                n_alerts += 1
+            n_records += len(batch)
+        return n_records, n_alerts
+
+def _micro_batches(source, max_batch, max_wait):
+    if isinstance(source, queue.Queue):
+        while True:
+            batch = [source.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + max_wait
+            while len(batch) < max_batch:
+                try:
+                    record = source.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is None:
+                    yield batch
+                    return
+                batch.append(record)
+            yield batch
+    else:
+        batch = []
+        for record in source:
+            batch.append(record)
+            if len(batch) >= max_batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+if __name__ == '__main__':
+    # Démonstration : rejouer la télémétrie stockée comme un flux temps réel
+    from telemetry_store import open_store, columns_to_records, DEFAULT_STATION
+    records = columns_to_records(open_store().read(stations=[DEFAULT_STATION]))
+    for r in records:
+        r['station_id'] = DEFAULT_STATION
+    detector = StreamingDetector()
+    latencies = []
+
+    def report(alert):
+        if alert['severity'] == 'CRITIQUE':
+            print(f"  ⚠ {alert['date']} {alert['hour']}h : {', '.join(alert['alerts'])}")
+
+    start = time.perf_counter()
+    for record in records:
+        t = time.perf_counter()
+        for alert in detector.process(record):
+            report(alert)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    print(f"\n✓ {len(records)} mesures traitées en flux ({len(records) / elapsed:.0f} mesures/s)")
+    print(f"  - Latence par mesure : p50 {np.percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99 {np.percentile(latencies, 99) * 1000:.2f} ms")
@@ -0,0 +1,237 @@
+"""
+Stockage Télémétrie Colonnaire (remplace data/historical_data.json)
+Une partition par station et par année, un fichier .npy par colonne :
+    data/telemetry/<station>/<année>/<colonne>.npy
+Les colonnes sont ouvertes en memory-map : une requête (plage horaire + projection
+de colonnes) ne lit sur disque que les pages réellement utilisées
+"""
+
+import json
+import os
+import numpy as np
+
+STORE_DIR = 'data/telemetry'
+LEGACY_JSON = 'data/historical_data.json'
+DEFAULT_STATION = 'ST_01'
+
+# Schéma des colonnes (timestamp = heure de mesure, clé de tri de chaque partition)
+COLUMNS = {
+    'timestamp': 'datetime64[h]',
+    'hour': 'int8',
+    'day_of_week': 'int8',
+    'temp_ext': 'float64',
+    'humidity': 'float64',
+    'solar_capacity': 'float64',
+    'grid_status': 'int8',
+    'flow': 'float64',
+    'energy': 'float64',
+    'level': 'float64'
+}
+
+class TelemetryStore:
+    """
+    Accès unique aux données de télémétrie pour les modules 1, 3 et 3bis
+    Un manifeste (manifest.json) recense les partitions et leurs bornes temporelles
+    pour éviter de parcourir les dossiers et d'ouvrir les partitions hors plage
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.manifest = self._load_manifest()
+        self._maps = {}  # cache des colonnes déjà memory-mappées (un seul np.load par fichier)
+
+    # --- Manifeste ---
+    def _manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    def _load_manifest(self):
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self._manifest_path())
+
+    def stations(self):
+        return sorted(self.manifest)
+
+    def is_empty(self):
+        return not self.manifest
+
+    def last_timestamp(self, station):
+        """Dernière heure stockée pour une station (datetime64[h]), None si aucune mesure"""
+        ends = [np.datetime64(p['end'], 'h') for p in self.manifest.get(station, {}).values()]
+        return max(ends) if ends else None
+
+    def row_count(self, station=None):
+        stations = [station] if station else self.manifest
+        return sum(p['rows'] for s in stations for p in self.manifest.get(s, {}).values())
+
+    # --- Écriture ---
+    def append(self, station, columns):
+        """
+        Ajouter des mesures à une station (dict colonne -> tableau)
+        Les partitions touchées sont fusionnées et réécrites ; en cas de doublon
+        sur le timestamp, la nouvelle mesure remplace l'ancienne
+        """
+        columns = _normalize(columns)
+        years = columns['timestamp'].astype('datetime64[Y]').astype(int) + 1970
+        for year in np.unique(years):
+            mask = years == year
+            new = {c: v[mask] for c, v in columns.items()}
+            old = self._load_partition(station, str(year))
+            if old is not None:
+                new = {c: np.concatenate([old[c], new[c]]) for c in COLUMNS}
+            # Tri stable puis dédoublonnage : on garde la dernière occurrence de chaque heure
+            ts = new['timestamp']
+            order = np.argsort(ts, kind='stable')
+            ts_sorted = ts[order]
+            keep = np.append(ts_sorted[1:] != ts_sorted[:-1], True)
+            new = {c: v[order][keep] for c, v in new.items()}
+            self._write_partition(station, str(year), new)
+        self._save_manifest()
+
+    def _write_partition(self, station, year, columns):
+        path = os.path.join(self.root, station, year)
+        os.makedirs(path, exist_ok=True)
+        for c, values in columns.items():
+            tmp = os.path.join(path, f'{c}.tmp.npy')
+            np.save(tmp, np.ascontiguousarray(values))
+            # Projection fermée avant le remplacement (Windows refuse de remplacer un fichier mappé)
+            self._maps.pop(os.path.join(path, f'{c}.npy'), None)
+            os.replace(tmp, os.path.join(path, f'{c}.npy'))
+        ts = columns['timestamp']
+        self.manifest.setdefault(station, {})[year] = {
+            'rows': int(len(ts)), 'start': str(ts[0]), 'end': str(ts[-1])
+        }
+
+    def _load_partition(self, station, year):
+        """Partition entière lue en mémoire, sans memory-map : ses fichiers vont être remplacés"""
+        if year not in self.manifest.get(station, {}):
+            return None
+        path = os.path.join(self.root, station, year)
+        return {c: np.load(os.path.join(path, f'{c}.npy')) for c in COLUMNS}
+
+    # --- Lecture ---
+    def _read_partition(self, station, year, start, end, columns):
+        info = self.manifest.get(station, {}).get(year)
+        if info is None:
+            return None
+        path = os.path.join(self.root, station, year)
+        lo, hi = 0, info['rows']
+        if start is not None or end is not None:
+            ts = self._column(path, 'timestamp')
+            lo = 0 if start is None else int(np.searchsorted(ts, start, side='left'))
+            hi = hi if end is None else int(np.searchsorted(ts, end, side='left'))
+        return {c: self._column(path, c)[lo:hi] for c in columns}
+
+    def _column(self, path, column):
+        filename = os.path.join(path, f'{column}.npy')
+        if filename not in self._maps:
+            self._maps[filename] = np.load(filename, mmap_mode='r')
+        return self._maps[filename]
+
+    def scan(self, stations=None, start=None, end=None, columns=None):
+        """
+        Parcourir les partitions (station, colonnes) sans copie : chaque colonne
+        est une vue memory-mappée restreinte à la plage [start, end[
+        """
+        start = None if start is None else np.datetime64(start, 'h')
+        end = None if end is None else np.datetime64(end, 'h')
+        columns = list(columns or COLUMNS)
+        for station in stations or self.stations():
+            for year, info in sorted(self.manifest.get(station, {}).items()):
+                if start is not None and np.datetime64(info['end'], 'h') < start:
+                    continue
+                if end is not None and np.datetime64(info['start'], 'h') >= end:
+                    continue
+                part = self._read_partition(station, year, start, end, columns)
+                if part and len(next(iter(part.values()))):
+                    yield station, part
+
+    def read(self, stations=None, start=None, end=None, columns=None):
+        """
+        Lire une plage de temps pour une ou plusieurs stations -> dict de tableaux NumPy
+        Une seule partition est retournée telle quelle (memory-map, sans copie) ;
+        plusieurs partitions sont concaténées. La clé 'station_index' renvoie à 'stations'
+        """
+        columns = list(columns or COLUMNS)
+        stations = stations or self.stations()
+        parts = list(self.scan(stations, start, end, columns))
+        names = [s for s, _ in parts]
+        if len(parts) == 1:
+            result = dict(parts[0][1])
+        elif parts:
+            result = {c: np.concatenate([p[c] for _, p in parts]) for c in columns}
+        else:
+            result = {c: np.empty(0, dtype=COLUMNS[c]) for c in columns}
+        station_ids = sorted(set(names), key=names.index)
+        lengths = [len(p[columns[0]]) for _, p in parts]
+        result['station_index'] = np.repeat([station_ids.index(s) for s in names], lengths).astype(np.int32)
+        result['stations'] = station_ids
+        return result
+
+    # --- Compatibilité ---
+    def import_json(self, path=LEGACY_JSON, station=DEFAULT_STATION):
+        """Migrer un ancien fichier historical_data.json (liste de dicts) vers le store"""
+        with open(path, 'r') as f:
+            records = json.load(f)
+        self.append(station, records_to_columns(records))
+        return len(records)
+
+def records_to_columns(records):
+    """Liste de dicts (ancien format JSON) -> dict de colonnes"""
+    columns = {
+        'timestamp': np.array([f"{r['date']}T{r['hour']:02d}" for r in records], dtype='datetime64[h]')
+    }
+    for c in COLUMNS:
+        if c != 'timestamp':
+            default = 1 if c == 'grid_status' else 0
+            columns[c] = np.array([r.get(c, default) for r in records], dtype=COLUMNS[c])
+    return columns
+
+def columns_to_records(columns):
+    """Dict de colonnes -> liste de dicts au format de l'ancien historical_data.json"""
+    fields = [c for c in COLUMNS if c != 'timestamp' and c in columns]
+    dates = np.datetime_as_string(columns['timestamp'].astype('datetime64[D]')).tolist()
+    values = [np.asarray(columns[c]).tolist() for c in fields]
+    return [dict(zip(['date'] + fields, row)) for row in zip(dates, *values)]
+
+def _normalize(columns):
+    """Accepter soit des colonnes (avec 'timestamp' ou 'date' + 'hour'), soit une liste de dicts"""
+    if isinstance(columns, list):
+        return records_to_columns(columns)
+    columns = dict(columns)
+    if 'timestamp' not in columns:
+        dates = np.asarray(columns['date'], dtype='datetime64[D]')
+        columns['timestamp'] = dates.astype('datetime64[h]') + np.asarray(columns['hour'], dtype='timedelta64[h]')
+    ts = np.asarray(columns['timestamp'], dtype='datetime64[h]')
+    if 'hour' not in columns:
+        columns['hour'] = (ts - ts.astype('datetime64[D]')).astype(int)
+    if 'day_of_week' not in columns:
+        columns['day_of_week'] = (ts.astype('datetime64[D]').astype(int) + 3) % 7
+    out = {'timestamp': ts}
+    for c, dtype in COLUMNS.items():
+        if c == 'timestamp':
+            continue
+        if c in columns:
+            out[c] = np.asarray(columns[c], dtype=dtype)
+        else:
+            out[c] = np.full(len(ts), 1 if c == 'grid_status' else 0, dtype=dtype)
+    return out
+
+def open_store(root=STORE_DIR, legacy_json=LEGACY_JSON):
+    """
+    Ouvrir le store ; s'il est vide et qu'un ancien historical_data.json existe,
+    il est importé une fois pour toutes
+    """
+    store = TelemetryStore(root)
+    if store.is_empty() and legacy_json and os.path.exists(legacy_json):
+        n = store.import_json(legacy_json)
+        print(f"✓ {n} enregistrements importés depuis {legacy_json} vers {root}")
+    return store
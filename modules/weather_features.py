@@ -0,0 +1,282 @@
+"""
+Couche de Features Météo et Solaires
+- Potentiel solaire en ciel clair calculé à partir de la latitude/longitude de chaque station
+  et du jour de l'année (position du soleil NOAA + modèle de Haurwitz), vectorisé stations × heures
+- Prévisions météo lues dans des fichiers CSV déposés dans data/weather/
+  (station_id,timestamp,temp_ext,humidity[,cloud_cover] ; station_id '*' = toutes les stations)
+- Cache disque des features horaires par (station, date) : un fichier par date
+  (data/features/<date>.npz, une ligne par station), complété à la demande en un seul calcul
+Les horodatages sont en heure locale = UTC (Burkina Faso, pas d'heure d'été)
+"""
+
+import csv
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+
+WEATHER_DIR = 'data/weather'
+FEATURE_DIR = 'data/features'
+STATIONS_FILE = 'data/stations.json'
+FEATURES_VERSION = 1     # à incrémenter si le calcul des features change (invalide le cache)
+
+# Site par défaut (station de référence, Ouagadougou) : coordonnées et puissance crête du parc solaire
+DEFAULT_SITE = {'latitude': 12.37, 'longitude': -1.52, 'solar_kwp': 100.0}
+PERFORMANCE_RATIO = 0.8  # pertes onduleur, température, poussière
+CLOUD_LOSS = 0.3         # perte maximale par couverture nuageuse totale
+FIELDS = ('temp_ext', 'humidity', 'cloud_cover', 'clear_potential', 'solar_capacity', 'observed')
+
+# --- Sites des stations ---
+def load_sites(stations, path=STATIONS_FILE):
+    """Coordonnées et puissance crête par station (data/stations.json, site par défaut sinon)"""
+    known = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            known = json.load(f)
+    return {key: np.array([known.get(s, {}).get(key, default) for s in stations], dtype=float)
+            for key, default in DEFAULT_SITE.items()}
+
+def save_sites(sites, path=STATIONS_FILE):
+    """Fusionner {station: {latitude, longitude, solar_kwp}} dans data/stations.json"""
+    known = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            known = json.load(f)
+    known.update(sites)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(dict(sorted(known.items())), f, indent=2)
+
+# --- Modèle de ciel clair ---
+def cos_zenith(latitude, longitude, timestamps):
+    """
+    Cosinus de l'angle zénithal du soleil au milieu de chaque heure (formules NOAA)
+    latitude/longitude et timestamps (datetime64[h]) sont combinés par broadcasting
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[h]')
+    day_of_year = (timestamps.astype('datetime64[D]') - timestamps.astype('datetime64[Y]')).astype(int) + 1
+    hour = (timestamps - timestamps.astype('datetime64[D]')).astype(int) + 0.5
+    gamma = 2 * np.pi / 365 * (day_of_year - 1 + (hour - 12) / 24)
+    declination = (0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma)
+                   - 0.006758 * np.cos(2 * gamma) + 0.000907 * np.sin(2 * gamma)
+                   - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma))
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma)
+                                 - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma))
+    solar_minutes = hour * 60 + equation_of_time + 4 * np.asarray(longitude)
+    hour_angle = np.radians(solar_minutes / 4 - 180)
+    lat = np.radians(latitude)
+    return np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+
+def clear_sky_ghi(latitude, longitude, timestamps):
+    """Rayonnement global horizontal en ciel clair (W/m², modèle de Haurwitz)"""
+    cz = cos_zenith(latitude, longitude, timestamps)
+    safe = np.where(cz > 0, cz, 1.0)
+    return np.where(cz > 0, 1098 * safe * np.exp(-0.057 / safe), 0.0)
+
+def solar_potential(clear_potential, cloud_cover):
+    """Énergie solaire disponible (kWh) : potentiel en ciel clair réduit par la couverture nuageuse (0-1)"""
+    return clear_potential * (1 - CLOUD_LOSS * np.clip(cloud_cover, 0, 1))
+
+def clear_sky_potential(latitude, longitude, solar_kwp, timestamps):
+    """Énergie solaire productible en ciel clair sur chaque heure (kWh)"""
+    return clear_sky_ghi(latitude, longitude, timestamps) / 1000 * np.asarray(solar_kwp) * PERFORMANCE_RATIO
+
+def climatology(hour):
+    """Météo par défaut (profil journalier) quand aucune prévision n'est disponible"""
+    temp_ext = 35 + np.sin(hour / 24 * np.pi) * 8
+    humidity = 40 + np.cos(hour / 24 * np.pi) * 20
+    return temp_ext, humidity
+
+# --- Prévisions météo (fichiers CSV) ---
+_WEATHER = {}   # dossier -> (signature, table)
+
+def weather_signature(directory=WEATHER_DIR):
+    """Empreinte des fichiers de prévision (nom, taille, date de modification)"""
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        stat = os.stat(path)
+        h.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return h.hexdigest()
+
+def load_weather(directory=WEATHER_DIR):
+    """
+    Toutes les prévisions du dossier -> dict de tableaux (station, timestamp, temp_ext, humidity, cloud_cover)
+    Les fichiers sont lus par ordre de nom : pour une même (station, heure), le dernier l'emporte
+    cloud_cover est facultatif (fraction 0-1 ou %) ; les valeurs absentes sont NaN
+    """
+    signature = weather_signature(directory)
+    cached = _WEATHER.get(directory)
+    if cached and cached[0] == signature:
+        return cached[1]
+    rows = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.csv'))):
+        with open(path, 'r', newline='') as f:
+            for r in csv.DictReader(f):
+                rows.append((r['station_id'], r['timestamp'].replace(' ', 'T')[:13],
+                             r.get('temp_ext') or 'nan', r.get('humidity') or 'nan', r.get('cloud_cover') or 'nan'))
+    station, timestamp, temp_ext, humidity, cloud = zip(*rows) if rows else ((),) * 5
+    cloud = np.array(cloud, dtype=float)
+    table = {
+        'station': np.array(station, dtype=str), 'timestamp': np.array(timestamp, dtype='datetime64[h]'),
+        'temp_ext': np.array(temp_ext, dtype=float), 'humidity': np.array(humidity, dtype=float),
+        'cloud_cover': np.where(cloud > 1, cloud / 100, cloud)
+    }
+    _WEATHER[directory] = (signature, table)
+    return table
+
+def _fill_weather(table, stations, first_hour, n_hours):
+    """Prévisions -> grilles stations × heures (NaN sans prévision) ; '*' puis prévisions propres à la station"""
+    grids = {k: np.full((len(stations), n_hours), np.nan) for k in ('temp_ext', 'humidity', 'cloud_cover')}
+    if not len(table['station']):
+        return grids
+    offset = (table['timestamp'] - first_hour).astype(int)
+    index = {s: i for i, s in enumerate(stations)}
+    row = np.array([index.get(s, -1) for s in table['station']])
+    regional = (table['station'] == '*') & (offset >= 0) & (offset < n_hours)
+    specific = (row >= 0) & (offset >= 0) & (offset < n_hours)
+    for k, grid in grids.items():
+        values = table[k]
+        valid = ~np.isnan(values)
+        # Prévisions régionales d'abord, puis celles de la station qui les remplacent
+        for selected, per_station in ((regional & valid, False), (specific & valid, True)):
+            positions = np.flatnonzero(selected)[::-1]   # dernière occurrence de chaque case en premier
+            cells = row[positions] * n_hours + offset[positions] if per_station else offset[positions]
+            positions = positions[np.unique(cells, return_index=True)[1]]
+            if per_station:
+                grid[row[positions], offset[positions]] = values[positions]
+            else:
+                grid[:, offset[positions]] = values[positions]
+    return grids
+
+def compute_features(stations, days, sites=None, weather=None):
+    """
+    Features horaires pour stations × jours en un seul calcul -> dict de tableaux (N, D, 24)
+    days : dates (datetime64[D]) ; sites : load_sites(stations) ; weather : load_weather()
+    """
+    days = np.asarray(days, dtype='datetime64[D]')
+    sites = sites if sites is not None else load_sites(stations)
+    weather = weather if weather is not None else load_weather()
+    timestamps = days.astype('datetime64[h]')[:, None] + np.arange(24)
+    shape = (len(stations), len(days), 24)
+    col = lambda key: sites[key][:, None, None]
+
+    if not len(days):
+        return {k: np.empty(shape) for k in FIELDS}
+    # Les jours demandés ne sont pas forcément consécutifs : grille sur toute la période, puis heures utiles
+    positions = (timestamps - timestamps.min()).astype(int)
+    grids = _fill_weather(weather, list(stations), timestamps.min(), int(positions.max()) + 1)
+    forecast = {k: g[:, positions] for k, g in grids.items()}
+    clim_temp, clim_humidity = climatology(np.arange(24))
+    temp_ext = np.where(np.isnan(forecast['temp_ext']), clim_temp, forecast['temp_ext'])
+    humidity = np.where(np.isnan(forecast['humidity']), clim_humidity, forecast['humidity'])
+    # Sans nébulosité prévue, l'humidité sert d'indicateur de couverture nuageuse
+    cloud_cover = np.where(np.isnan(forecast['cloud_cover']), humidity / 100, forecast['cloud_cover'])
+    clear = clear_sky_potential(col('latitude'), col('longitude'), col('solar_kwp'), timestamps)
+    return {
+        'temp_ext': temp_ext, 'humidity': humidity, 'cloud_cover': cloud_cover, 'clear_potential': clear,
+        'solar_capacity': solar_potential(clear, cloud_cover),
+        'observed': (~np.isnan(forecast['temp_ext'])).astype(np.int8)
+    }
+
+# --- Cache par (station, date) ---
+_LOADED = {}   # fichier -> (date de modification, contenu)
+
+class FeatureCache:
+    """Un fichier .npz par date (une ligne par station), invalidé si les prévisions ou les sites changent"""
+
+    def __init__(self, root=FEATURE_DIR, weather_dir=WEATHER_DIR, stations_file=STATIONS_FILE):
+        self.root = root
+        self.weather_dir = weather_dir
+        self.stations_file = stations_file
+
+    def signature(self):
+        sites = os.stat(self.stations_file).st_mtime_ns if os.path.exists(self.stations_file) else 0
+        return f'{FEATURES_VERSION}:{weather_signature(self.weather_dir)}:{sites}'
+
+    def _path(self, day):
+        return os.path.join(self.root, f'{day}.npz')
+
+    def _read(self, day, signature):
+        path = self._path(day)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = _LOADED.get(path)
+        if cached is None or cached[0] != mtime:
+            with np.load(path) as f:
+                cached = (mtime, {k: f[k] for k in f.files})
+            _LOADED[path] = cached
+        content = cached[1]
+        return content if str(content['signature']) == signature else None
+
+    def _write(self, day, content):
+        os.makedirs(self.root, exist_ok=True)
+        path = self._path(day)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **content)
+        os.replace(tmp, path)
+
+    def days(self, stations, days):
+        """Features (N, D, 24) ; les couples (station, date) absents du cache sont calculés d'un coup puis ajoutés"""
+        stations = [str(s) for s in stations]
+        days = np.asarray(days, dtype='datetime64[D]')
+        signature = self.signature()
+        contents = [self._read(day, signature) for day in days]
+        present = [set() if content is None else set(content['stations'].tolist()) for content in contents]
+        missing = [s for s in stations if any(s not in p for p in present)]
+        if missing:
+            todo = [d for d, p in enumerate(present) if not p.issuperset(missing)]
+            computed = compute_features(missing, days[todo], load_sites(missing, self.stations_file),
+                                        load_weather(self.weather_dir))
+            for j, d in enumerate(todo):
+                old = contents[d]
+                keep = np.ones(0, dtype=bool) if old is None else ~np.isin(old['stations'], missing)
+                content = {'signature': np.array(signature),
+                           'stations': np.concatenate([old['stations'][keep] if old is not None else
+                                                       np.array([], dtype=str), np.array(missing)])}
+                for k in FIELDS:
+                    new = computed[k][:, j]
+                    content[k] = np.concatenate([old[k][keep], new]) if old is not None else new
+                self._write(days[d], content)
+                contents[d] = content
+        result = {k: np.empty((len(stations), len(days), 24)) for k in FIELDS}
+        for d, content in enumerate(contents):
+            row = {s: i for i, s in enumerate(content['stations'].tolist())}
+            rows = [row[s] for s in stations]
+            for k in FIELDS:
+                result[k][:, d] = content[k][rows]
+        return result
+
+    def window(self, stations, start, horizon_hours):
+        """Features (N, H) sur [start, start + H heures[ (start : datetime ou datetime64)"""
+        start = np.datetime64(start, 'h')
+        first = start.astype('datetime64[D]')
+        offset = int((start - first.astype('datetime64[h]')).astype(int))
+        n_days = (offset + horizon_hours + 23) // 24
+        by_day = self.days(stations, first + np.arange(n_days))
+        return {k: v.reshape(len(stations), -1)[:, offset:offset + horizon_hours] for k, v in by_day.items()}
+
+def station_features(stations, start, horizon_hours=24):
+    """Features météo/solaires des stations sur l'horizon (cache par défaut)"""
+    return FeatureCache().window(stations, start, horizon_hours)
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from datetime import datetime, timedelta
+    from telemetry_store import TelemetryStore, STORE_DIR, DEFAULT_STATION
+    parser = argparse.ArgumentParser(description="Préparer le cache des features météo / solaires")
+    parser.add_argument('--stations', nargs='+', help="Stations (défaut : celles du store télémétrie)")
+    parser.add_argument('--start', help="Premier jour (AAAA-MM-JJ, défaut demain)")
+    parser.add_argument('--days', type=int, default=7, help="Nombre de jours à préparer")
+    args = parser.parse_args()
+
+    stations = args.stations or TelemetryStore(STORE_DIR).stations() or [DEFAULT_STATION]
+    start = np.datetime64(args.start or (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'), 'D')
+    begin = time.perf_counter()
+    features = FeatureCache().days(stations, start + np.arange(args.days))
+    observed = features['observed'].mean() * 100
+    print(f"✓ Features de {len(stations)} station(s) × {args.days} jours prêtes dans {FEATURE_DIR} "
+          f"en {time.perf_counter() - begin:.2f} s ({observed:.0f} % des heures couvertes par une prévision météo)")
@@ -5,9 +5,43 @@
 document.addEventListener('DOMContentLoaded', () => {
     initNavigation();
     loadAllData();
-    setInterval(() => loadAllData(), 60000);
+    connectStream();
+    // Repli : interrogation toutes les 60 s uniquement si le flux temps réel est indisponible
+    setInterval(() => { if (!streamOpen) loadAllData(); }, 60000);
 });
 
+// ============================================
+// TEMPS RÉEL (Server-Sent Events)
+// ============================================
+let streamOpen = false;
+
+function connectStream() {
+    if (!window.EventSource) return;
+    const source = new EventSource('/api/stream');
+
+    let reconnecting = false;
+    source.onopen  = () => {
+        streamOpen = true;
+        // Après une coupure (ou un flux fermé par le serveur), des événements ont pu être perdus
+        if (reconnecting) loadAllData();
+        reconnecting = false;
+    };
+    source.onerror = () => { streamOpen = false; reconnecting = true; };   // EventSource se reconnecte seul
+
+    source.addEventListener('kpi', e => renderKPI(JSON.parse(e.data)));
+    source.addEventListener('schedule', e => {
+        if (document.querySelector('.nav-item.active')?.dataset.tab === 'optimization') {
+            renderSchedule(JSON.parse(e.data));
+        }
+    });
+    source.addEventListener('anomalies', e => {
+        const delta = JSON.parse(e.data);
+        const badge = document.getElementById('anomalies-count');
+        if (badge && delta.critical > 0) badge.classList.add('alert-pulse');
+        if (document.querySelector('.nav-item.active')?.dataset.tab === 'anomalies') loadAnomalies();
+    });
+}
+
 // ============================================
 // NAVIGATION
 // ============================================
@@ -65,18 +99,23 @@ function loadTabData(tabId) {
 function loadKPI() {
     fetch('/api/kpi')
         .then(r => r.json())
-        .then(data => {
-            document.getElementById('kpi-cost').textContent             = data.total_cost_fcfa.toLocaleString() + ' FCFA';
-            document.getElementById('kpi-savings-percent').textContent  = `+${data.savings_percent}% d'économies`;
-            document.getElementById('kpi-solar').textContent            = data.total_solar_kwh.toLocaleString() + ' kWh';
-            document.getElementById('kpi-co2').textContent              = data.total_co2_kg.toLocaleString() + ' kg';
-            document.getElementById('kpi-gasoil').textContent           = data.total_gasoil_liters + ' Litres de gasoil';
-            document.getElementById('kpi-anomalies-total').textContent  = data.total_anomalies;
-            document.getElementById('kpi-anomalies-critical').textContent = data.critical_anomalies + ' critiques';
-            document.getElementById('anomalies-count').textContent      = data.total_anomalies;
-        })
+        .then(renderKPI)
         .catch(err => console.error('Erreur KPI:', err));
+    renderSystemStatus();
+}
 
+function renderKPI(data) {
+    document.getElementById('kpi-cost').textContent             = data.total_cost_fcfa.toLocaleString() + ' FCFA';
+    document.getElementById('kpi-savings-percent').textContent  = `+${data.savings_percent}% d'économies`;
+    document.getElementById('kpi-solar').textContent            = data.total_solar_kwh.toLocaleString() + ' kWh';
+    document.getElementById('kpi-co2').textContent              = data.total_co2_kg.toLocaleString() + ' kg';
+    document.getElementById('kpi-gasoil').textContent           = data.total_gasoil_liters + ' Litres de gasoil';
+    document.getElementById('kpi-anomalies-total').textContent  = data.total_anomalies;
+    document.getElementById('kpi-anomalies-critical').textContent = data.critical_anomalies + ' critiques';
+    document.getElementById('anomalies-count').textContent      = data.total_anomalies;
+}
+
+function renderSystemStatus() {
     // Statut système (statique / enrichi depuis le backend si besoin)
     document.getElementById('system-summary').innerHTML = `
         <div class="status-grid">
@@ -157,82 +196,142 @@ function loadPredictions() {
 function loadSchedule() {
     fetch('/api/schedule')
         .then(r => r.json())
-        .then(data => {
-            // --- Graphique empilé ---
-            const ctx = document.getElementById('scheduleChart').getContext('2d');
-            if (window.schedChart) window.schedChart.destroy();
+        .then(renderSchedule)
+        .catch(err => console.error('Erreur optimisation:', err));
+}
 
-            window.schedChart = new Chart(ctx, {
-                type: 'bar',
-                data: {
-                    labels: data.map(s => s.hour + 'h'),
-                    datasets: [
-                        { label: 'Solaire',  data: data.map(s => s.mix_solar_kwh),     backgroundColor: '#f59e0b' },
-                        { label: 'SONABEL',  data: data.map(s => s.mix_sonabel_kwh),   backgroundColor: '#3b82f6' },
-                        { label: 'Gasoil',   data: data.map(s => s.mix_generator_kwh), backgroundColor: '#ef4444' }
-                    ]
-                },
-                options: {
-                    responsive: true,
-                    maintainAspectRatio: false,
-                    scales: { x: { stacked: true }, y: { stacked: true } }
-                }
-            });
+function renderSchedule(data) {
+    // --- Graphique empilé ---
+    const ctx = document.getElementById('scheduleChart').getContext('2d');
+    if (window.schedChart) window.schedChart.destroy();
+
+    window.schedChart = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: data.map(s => s.hour + 'h'),
+            datasets: [
+                { label: 'Solaire',  data: data.map(s => s.mix_solar_kwh),     backgroundColor: '#f59e0b' },
+                { label: 'SONABEL',  data: data.map(s => s.mix_sonabel_kwh),   backgroundColor: '#3b82f6' },
+                { label: 'Gasoil',   data: data.map(s => s.mix_generator_kwh), backgroundColor: '#ef4444' }
+            ]
+        },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            scales: { x: { stacked: true }, y: { stacked: true } }
+        }
+    });
 
-            // --- Tableau du mix (schedule-tbody UNIQUEMENT) ---
-            document.getElementById('schedule-tbody').innerHTML = data.map(s => `
-                <tr>
-                    <td><strong>${s.hour}h</strong></td>
-                    <td>
-                        <span class="badge badge-${s.grid_status === 'OK' ? 'success' : 'danger'}${s.grid_status !== 'OK' ? ' pulse' : ''}">
-                            ${s.grid_status}
-                        </span>
-                    </td>
-                    <td class="text-solar">${s.mix_solar_kwh}</td>
-                    <td class="text-sonabel">${s.mix_sonabel_kwh}</td>
-                    <td class="text-gasoil">${s.gasoil_used_liters > 0 ? s.gasoil_used_liters + ' L' : '0'}</td>
-                    <td>${s.pump_action}</td>
-                    <td><strong>${s.cost_fcfa.toLocaleString()} FCFA</strong></td>
-                </tr>
-            `).join('');
-        })
-        .catch(err => console.error('Erreur optimisation:', err));
+    // --- Tableau du mix (schedule-tbody UNIQUEMENT) ---
+    document.getElementById('schedule-tbody').innerHTML = data.map(s => `
+        <tr>
+            <td><strong>${s.hour}h</strong></td>
+            <td>
+                <span class="badge badge-${s.grid_status === 'OK' ? 'success' : 'danger'}${s.grid_status !== 'OK' ? ' pulse' : ''}">
+                    ${s.grid_status}
+                </span>
+            </td>
+            <td class="text-solar">${s.mix_solar_kwh}</td>
+            <td class="text-sonabel">${s.mix_sonabel_kwh}</td>
+            <td class="text-gasoil">${s.gasoil_used_liters > 0 ? s.gasoil_used_liters + ' L' : '0'}</td>
+            <td>${s.pump_action}</td>
+            <td><strong>${s.cost_fcfa.toLocaleString()} FCFA</strong></td>
+        </tr>
+    `).join('');
 }
 
 // ============================================
 // ONGLET : ANOMALIES
 // ============================================
+// Filtrage, tri et pagination sont faits côté serveur : le navigateur ne garde
+// qu'une fenêtre de ANOMALY_WINDOW_ROWS lignes (les plus anciennes pages sont retirées)
+const ANOMALY_WINDOW_ROWS = 200;
 let allAnomalies  = [];
+let anomalyOffset = 0;    // lignes déjà retirées de la fenêtre (rang de la première ligne affichée)
 let sortColumn    = 'severity_score';
 let sortDirection = 'desc';
+let nextCursor    = null;
+let facetsLoaded  = false;
+
+function anomalyQuery(cursor) {
+    const params = new URLSearchParams({ sort: sortColumn, order: sortDirection, limit: 50 });
+    const filters = { severity: 'filter-severity', alert: 'filter-alert', method: 'filter-method',
+                      station: 'filter-station', start: 'filter-start', end: 'filter-end' };
+    Object.entries(filters).forEach(([param, id]) => {
+        const value = document.getElementById(id)?.value;
+        if (value) params.set(param, value);
+    });
+    if (cursor) params.set('cursor', cursor);
+    return '/api/anomalies?' + params.toString();
+}
 
 function loadAnomalies() {
-    fetch('/api/anomalies')
+    if (!facetsLoaded) loadAnomalyFacets();
+    document.getElementById('anomalies-count')?.classList.remove('alert-pulse');
+    fetch(anomalyQuery(null))
         .then(r => r.json())
-        .then(data => {
-            allAnomalies = [...(data.rule_based || []), ...(data.ml_based || [])];
-            renderAnomaliesTable();
+        .then(page => {
+            allAnomalies = page.items;
+            anomalyOffset = 0;
+            nextCursor = page.next_cursor;
+            renderAnomaliesTable(page.total);
+        })
+        .catch(err => console.error('Erreur anomalies:', err));
+}
+
+function loadMoreAnomalies() {
+    if (!nextCursor) return;
+    fetch(anomalyQuery(nextCursor))
+        .then(r => r.json())
+        .then(page => {
+            allAnomalies = allAnomalies.concat(page.items);
+            const dropped = Math.max(0, allAnomalies.length - ANOMALY_WINDOW_ROWS);
+            allAnomalies = allAnomalies.slice(dropped);
+            anomalyOffset += dropped;
+            nextCursor = page.next_cursor;
+            renderAnomaliesTable(page.total);
         })
         .catch(err => console.error('Erreur anomalies:', err));
 }
 
-function renderAnomaliesTable() {
+function loadAnomalyFacets() {
+    fetch('/api/anomalies/facets')
+        .then(r => r.json())
+        .then(facets => {
+            const selects = { severity: 'filter-severity', alert: 'filter-alert', method: 'filter-method', station: 'filter-station' };
+            Object.entries(selects).forEach(([field, id]) => {
+                const select = document.getElementById(id);
+                if (!select) return;
+                select.innerHTML = select.options[0].outerHTML + Object.entries(facets[field] || {})
+                    .map(([value, count]) => `<option value="${value}">${value} (${count})</option>`).join('');
+            });
+            facetsLoaded = true;
+        })
+        .catch(err => console.error('Erreur filtres anomalies:', err));
+}
+
+function applyAnomalyFilters() {
+    loadAnomalies();
+}
+
+function renderAnomaliesTable(total) {
     // Cible STRICTEMENT le tbody de l'onglet anomalies
     const tbody = document.getElementById('anomalies-tbody');
     if (!tbody) return;
 
-    const sorted = [...allAnomalies].sort((a, b) => {
-        let valA = sortColumn === 'date' ? a.date + a.hour : a[sortColumn];
-        let valB = sortColumn === 'date' ? b.date + b.hour : b[sortColumn];
-        return sortDirection === 'asc' ? (valA > valB ? 1 : -1) : (valA < valB ? 1 : -1);
-    });
+    const summary = document.getElementById('anomalies-summary');
+    if (summary) summary.textContent = anomalyOffset
+        ? `${anomalyOffset + 1}–${anomalyOffset + allAnomalies.length} / ${total} anomalies`
+        : `${allAnomalies.length} / ${total} anomalies`;
+    const more = document.getElementById('anomalies-more');
+    if (more) more.style.display = nextCursor ? 'inline-flex' : 'none';
 
-    if (sorted.length === 0) {
+    if (allAnomalies.length === 0) {
         tbody.innerHTML = `<tr><td colspan="6" style="text-align:center; color:var(--text-muted); padding:2rem;">Aucune anomalie détectée</td></tr>`;
         return;
     }
 
-    tbody.innerHTML = sorted.map((a, index) => `
+    tbody.innerHTML = allAnomalies.map((a, index) => `
         <tr class="clickable" onclick="showAnomalyDetails(${index})" style="cursor:pointer;">
             <td>${a.date} <strong>${a.hour}h</strong></td>
             <td>
@@ -254,11 +353,11 @@ function renderAnomaliesTable() {
     `).join('');
 }
 
-// Tri par colonne (à appeler via onclick="setSort('colonne')" dans les <th>)
+// Tri par colonne (onclick="setSort('colonne')" dans les <th>) : nouvelle requête au serveur
 function setSort(col) {
     sortDirection = (sortColumn === col && sortDirection === 'asc') ? 'desc' : 'asc';
     sortColumn = col;
-    renderAnomaliesTable();
+    loadAnomalies();
 }
 
 // ============================================
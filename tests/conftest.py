@@ -0,0 +1,30 @@
+"""
+Configuration commune des tests (python -m pytest -q depuis la racine du projet)
+Les modules sont importés comme depuis modules/ et chaque test s'exécute dans un dossier
+temporaire : les chemins relatifs 'data/...' ne touchent jamais les données du projet
+"""
+
+import os
+import sys
+from datetime import datetime
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'modules'))
+
+from module1_prediction import iter_generated_chunks, build_station_table
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def generated_day(seed, date=datetime(2026, 4, 10)):
+    """Une journée simulée (station de référence) au format de data/predictions.json"""
+    chunk = next(iter_generated_chunks(1, build_station_table(1), date, seed))
+    return [{
+        'date': date.strftime('%Y-%m-%d'), 'hour': int(h), 'energy_predicted': float(e),
+        'solar_capacity_predicted': float(s), 'grid_status_predicted': int(g), 'flow_estimated': float(f)
+    } for h, e, s, g, f in zip(chunk['hour'], chunk['energy'], chunk['solar_capacity'],
+                               chunk['grid_status'], chunk['flow'])]
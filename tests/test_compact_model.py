@@ -0,0 +1,61 @@
+"""Forêt compacte : prédictions identiques à RandomForestRegressor.predict (export, extend, trim, memory-map)"""
+
+import copy
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from compact_model import FlatForest, PREDICT_CHUNK
+from module1_prediction import FEATURES, iter_generated_chunks, build_station_table
+
+def features(seed, n_stations=5, n_days=30):
+    """Features et énergie simulées : plus de PREDICT_CHUNK lignes pour couvrir plusieurs passes"""
+    chunk = next(iter_generated_chunks(n_days, build_station_table(n_stations, seed), seed=seed, chunk_days=n_days))
+    X = np.column_stack([chunk[f] for f in FEATURES]).astype(float)
+    assert len(X) > PREDICT_CHUNK
+    return X, chunk['energy']
+
+def forest(X, y, n_estimators, random_state):
+    return RandomForestRegressor(n_estimators=n_estimators, max_depth=12, random_state=random_state).fit(X, y)
+
+def with_trees(model, estimators):
+    """Copie de la forêt scikit-learn limitée à la liste d'arbres donnée (référence attendue)"""
+    model = copy.copy(model)
+    model.estimators_ = list(estimators)
+    model.n_estimators = len(estimators)
+    return model
+
+@pytest.fixture(scope='module')
+def data():
+    X, y = features(1)
+    X_new, y_new = features(2)
+    return X, y, X_new, y_new
+
+def test_export_matches_sklearn(data):
+    X, y, X_new, _ = data
+    model = forest(X, y, 20, 0)
+    flat = FlatForest.from_forest(model, FEATURES)
+    assert np.allclose(flat.predict(X_new), model.predict(X_new))
+    assert np.allclose(flat.predict(X), model.predict(X))
+
+def test_extend_and_trim_match_sklearn(data):
+    X, y, X_new, y_new = data
+    old, update = forest(X, y, 12, 0), forest(X_new, y_new, 8, 1)
+    extended = FlatForest.from_forest(old, FEATURES).extend(FlatForest.from_forest(update, FEATURES))
+    trees = old.estimators_ + update.estimators_
+    assert extended.n_estimators == 20
+    assert np.allclose(extended.predict(X_new), with_trees(old, trees).predict(X_new))
+    trimmed = extended.trim(10)
+    assert trimmed.n_estimators == 10
+    assert np.allclose(trimmed.predict(X_new), with_trees(old, trees[-10:]).predict(X_new))
+
+def test_memory_mapped_reload_matches_sklearn(data, workdir):
+    X, y, X_new, y_new = data
+    old, update = forest(X, y, 12, 0), forest(X_new, y_new, 8, 1)
+    model = FlatForest.from_forest(old, FEATURES).extend(FlatForest.from_forest(update, FEATURES)).trim(15)
+    path = str(workdir / 'v0001.flat')
+    model.save(path)
+    reloaded = FlatForest.load(path)
+    assert isinstance(reloaded.feature, np.memmap)
+    expected = with_trees(old, (old.estimators_ + update.estimators_)[-15:]).predict(X_new)
+    assert np.allclose(reloaded.predict(X_new), expected)
+    assert np.allclose(FlatForest.load(path, mmap=False).predict(X_new), expected)
@@ -0,0 +1,67 @@
+"""Détection d'anomalies (module 3) : fusion règles expertes + ML sur un store simulé à graine fixe"""
+
+import os
+from datetime import datetime
+import numpy as np
+import pytest
+import module3_anomalies
+from module1_prediction import write_generated_store
+from module3_anomalies import (detect_anomalies, evaluate_rules, resolve_thresholds, load_thresholds,
+                               RULE_LABELS, ML_OVERRIDING_RULES, MIN_SEVERITY_SCORE)
+from anomaly_log import AnomalyLog, ANOMALY_LOG
+from telemetry_store import open_store, DEFAULT_STATION
+
+START = datetime(2026, 3, 1)
+
+@pytest.fixture
+def store():
+    write_generated_store('data/telemetry', n_days=30, n_stations=1, seed=3, start_date=START)
+    data = open_store().read(stations=[DEFAULT_STATION])
+    thresholds = resolve_thresholds(load_thresholds(), data['stations'], data['station_index'])
+    masks, scores = evaluate_rules(data, thresholds)
+    return data, masks, scores
+
+def key(data, i):
+    return (str(data['timestamp'][i].astype('datetime64[D]')), int(data['hour'][i]))
+
+def test_empty_selection_returns_no_anomaly(store):
+    assert detect_anomalies(start='2027-01-01', end='2027-02-01') == []
+    assert not os.path.exists(ANOMALY_LOG)
+
+def test_rule_and_ml_merge(store, monkeypatch):
+    data, masks, scores = store
+    overriding = masks[np.isin(RULE_LABELS, ML_OVERRIDING_RULES)].any(axis=0)
+    other_rules = masks.any(axis=0) & ~overriding
+    # ML imposé : 2 enregistrements couverts par une règle prioritaire, 2 par une autre règle, 2 sans règle
+    covered = np.flatnonzero(overriding)[:2]
+    other = np.flatnonzero(other_rules)[:2]
+    clean = np.flatnonzero(~masks.any(axis=0))[:2]
+    assert len(covered) == len(other) == len(clean) == 2
+    flagged = np.zeros(len(data['timestamp']), dtype=bool)
+    flagged[np.concatenate([covered, other, clean])] = True
+    monkeypatch.setattr(module3_anomalies, 'score_telemetry', lambda d: {
+        'score': np.where(flagged, -0.5, 0.1), 'is_anomaly': flagged, 'model_version': 1})
+
+    anomalies = detect_anomalies()
+    rule_based = [a for a in anomalies if a['detection_method'] == 'RULE_BASED']
+    ml_based = [a for a in anomalies if a['detection_method'] == 'MACHINE_LEARNING']
+
+    # Règles : un enregistrement par ligne de score suffisant, avec toutes ses règles déclenchées
+    expected = np.flatnonzero(scores >= MIN_SEVERITY_SCORE)
+    assert sorted((a['date'], a['hour']) for a in rule_based) == sorted(key(data, i) for i in expected)
+    for a in rule_based:
+        i = next(i for i in expected if key(data, i) == (a['date'], a['hour']))
+        assert a['alerts'] == RULE_LABELS[masks[:, i]].tolist()
+        assert a['severity_score'] == scores[i]
+    # ML : publié partout sauf sur les enregistrements couverts par GASPILLAGE_GASOIL / NIVEAU_BAS_CRITIQUE
+    assert sorted((a['date'], a['hour']) for a in ml_based) == sorted(key(data, i) for i in np.concatenate([other, clean]))
+    assert all(a['alerts'] == ['COMPORTEMENT_INHABITUEL_ML'] and a['severity'] == 'MOYENNE' for a in ml_based)
+    assert len(AnomalyLog(ANOMALY_LOG)) == len(anomalies)
+
+def test_isolation_forest_never_overrides_priority_rules(store):
+    data, masks, _ = store
+    overriding = masks[np.isin(RULE_LABELS, ML_OVERRIDING_RULES)].any(axis=0)
+    covered = {key(data, i) for i in np.flatnonzero(overriding)}
+    ml_based = [a for a in detect_anomalies() if a['detection_method'] == 'MACHINE_LEARNING']
+    assert ml_based
+    assert not covered & {(a['date'], a['hour']) for a in ml_based}
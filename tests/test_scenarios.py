@@ -0,0 +1,21 @@
+"""Scénarios Monte Carlo : estimation sur une fenêtre de télémétrie vide ou incomplète"""
+
+import numpy as np
+import pytest
+from scenarios import ScenarioModel
+
+def telemetry(n_hours, first_hour=0):
+    hour = (np.arange(n_hours) + first_hour) % 24
+    return {'hour': hour, 'grid_status': np.ones(n_hours), 'solar_capacity': np.full(n_hours, 50.0),
+            'energy': np.full(n_hours, 100.0), 'flow': np.full(n_hours, 150.0)}
+
+@pytest.mark.parametrize('n_hours, first_hour', [(0, 0), (20, 0), (30, 5)])
+def test_fit_rejects_window_without_full_day(n_hours, first_hour):
+    with pytest.raises(ValueError, match="aucun jour complet"):
+        ScenarioModel.fit(telemetry(n_hours, first_hour))
+
+def test_sample_from_partial_first_day():
+    model = ScenarioModel.fit(telemetry(72, first_hour=3))
+    assert len(model.solar_days) == 2
+    scenarios = model.sample(5, list(range(24)) * 2, seed=1)
+    assert scenarios['solar_factor'].shape == (5, 48)